@@ -0,0 +1,70 @@
+"""
+Benchmark FabikConfig.path against FabikConfig.getcfg on deep keys.
+
+getcfg walks the layered config on every call, path resolves the key path
+once and caches the value until setcfg touches it.
+
+Usage::
+
+    python benchmarks/bench_getcfg.py
+    python benchmarks/bench_getcfg.py --depth 8 --calls 200000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fabik.conf import FabikConfig  # noqa: E402
+
+
+def build_config(depth: int) -> tuple[FabikConfig, list[str]]:
+    """Build a config with the same deep table in the root and in the env."""
+
+    def node(level: int) -> dict:
+        if level == depth:
+            return {"URI": "sqlite:///bench.db", "POOL": 5}
+        return {f"LEVEL{level}": node(level + 1), "OTHER": level}
+
+    keys = ["config.toml"] + [f"LEVEL{i}" for i in range(depth)] + ["URI"]
+    root = {"NAME": "bench", "config.toml": node(0), "ENV": {"prod": {"config.toml": node(0)}}}
+    return FabikConfig(root, {}, "prod"), keys
+
+
+def timeit(func, calls: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / calls * 1e9
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    opts = parser.parse_args()
+
+    config, keys = build_config(opts.depth)
+    dotted = ".".join(keys)
+    keys_tuple = tuple(keys)
+    assert config.getcfg(*keys) == config.path(dotted) == config.path(keys_tuple)
+
+    getcfg_ns = timeit(lambda: config.getcfg(*keys), opts.calls, opts.repeat)
+    dotted_ns = timeit(lambda: config.path(dotted), opts.calls, opts.repeat)
+    tuple_ns = timeit(lambda: config.path(keys_tuple), opts.calls, opts.repeat)
+    print(f"key: {dotted}")
+    print(f"getcfg(*keys):   {getcfg_ns:10.1f} ns/call")
+    print(f"path(dotted):    {dotted_ns:10.1f} ns/call  {getcfg_ns / dotted_ns:6.1f} x")
+    print(f"path(tuple):     {tuple_ns:10.1f} ns/call  {getcfg_ns / tuple_ns:6.1f} x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Benchmark ConfigReplacer.get_replace_obj on large nested config tables.
+
+Compares the structural walker (render only the string leaves containing
+placeholders) with the previous TOML round trip
+(tomli_w.dumps -> one big jinja2.Template -> tomllib.loads).
+
+Usage::
+
+    python benchmarks/bench_replace.py
+    python benchmarks/bench_replace.py --tables 200 --keys 100 --repeat 5
+"""
+
+import argparse
+import sys
+import time
+import tomllib
+from pathlib import Path
+
+import jinja2
+import tomli_w
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fabik.conf import ConfigReplacer, FabikConfig  # noqa: E402
+
+
+def build_table(tables: int, keys: int, depth: int) -> dict:
+    """Build a nested table, one value in four contains a placeholder."""
+
+    def leaf(i: int):
+        match i % 4:
+            case 0:
+                return f"{{{{ DEPLOY_DIR }}}}/data/{i}"
+            case 1:
+                return i
+            case 2:
+                return [f"item-{i}", i, i * 0.5]
+            case _:
+                return f"plain-{i}"
+
+    def node(level: int) -> dict:
+        if level == depth:
+            return {f"KEY_{k}": leaf(k) for k in range(keys)}
+        return {f"LEVEL{level}_{k}": node(level + 1) for k in range(2)}
+
+    return {f"TABLE_{t}": node(0) for t in range(tables)}
+
+
+def round_trip(replacer: ConfigReplacer, tpl_name: str) -> dict:
+    """The previous implementation of get_replace_obj."""
+    obj = replacer.get_tpl_value(tpl_name, check_tpl_name=True)
+    context = replacer.get_replace_context()
+    replaced = jinja2.Template(tomli_w.dumps(obj)).render(context)
+    return replacer._fill_root_meta(tomllib.loads(replaced))
+
+
+def timeit(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tables", type=int, default=100)
+    parser.add_argument("--keys", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    opts = parser.parse_args()
+
+    tpl_name = "config.toml"
+    config = FabikConfig(
+        {"NAME": "bench", "DEPLOY_DIR": "/srv/app/bench", tpl_name: build_table(opts.tables, opts.keys, opts.depth)}
+    )
+    replacer = ConfigReplacer(config, ROOT_DIR)
+
+    walker = replacer.get_replace_obj(tpl_name)
+    assert walker == round_trip(replacer, tpl_name), "results differ"
+
+    leaves = opts.tables * opts.keys * 2**opts.depth
+    old_ms = timeit(lambda: round_trip(replacer, tpl_name), opts.repeat)
+    new_ms = timeit(lambda: replacer.get_replace_obj(tpl_name), opts.repeat)
+    print(f"leaves: {leaves}")
+    print(f"toml round trip:   {old_ms:10.1f} ms")
+    print(f"structural walker: {new_ms:10.1f} ms")
+    print(f"speedup:           {old_ms / new_ms:10.1f} x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Benchmark reading a few values from a large config at application startup.
+
+Compares parsing the TOML/JSON output of conf make with opening the binary
+bundle written by ``conf make --bundle`` through fabik.runtime.
+
+Usage::
+
+    python benchmarks/bench_runtime.py
+    python benchmarks/bench_runtime.py --tables 20000
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tomllib
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+import tomli_w  # noqa: E402
+
+from fabik.runtime import dump_bundle, load_bundle  # noqa: E402
+
+
+def make_config(tables: int) -> dict:
+    return {
+        f"SERVICE_{i}": {
+            "HOST": f"10.0.{i // 256 % 256}.{i % 256}",
+            "PORT": 8000 + i % 1000,
+            "ENABLED": i % 2 == 0,
+            "TAGS": ["web", "api", f"zone-{i % 8}"],
+        }
+        for i in range(tables)
+    }
+
+
+def bench(func, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tables", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    data = make_config(args.tables)
+    key = f"SERVICE_{args.tables // 2}"
+    with tempfile.TemporaryDirectory() as tmp:
+        toml_file = Path(tmp, "config.toml")
+        json_file = Path(tmp, "config.json")
+        bundle_file = Path(tmp, "config.toml.fbk")
+        toml_file.write_text(tomli_w.dumps(data))
+        json_file.write_text(json.dumps(data, indent=4))
+        bundle_file.write_bytes(dump_bundle(data))
+
+        def read_toml():
+            return tomllib.loads(toml_file.read_text())[key]["PORT"]
+
+        def read_json():
+            return json.loads(json_file.read_text())[key]["PORT"]
+
+        def read_bundle():
+            with load_bundle(bundle_file) as bundle:
+                return bundle.get((key, "PORT"))
+
+        assert read_toml() == read_json() == read_bundle()
+        print(f"{args.tables} tables, {args.rounds} rounds, read {key}.PORT")
+        for name, func, file in (
+            ("tomllib", read_toml, toml_file),
+            ("json", read_json, json_file),
+            ("bundle", read_bundle, bundle_file),
+        ):
+            size = file.stat().st_size / 1024
+            print(f"{name:>8}: {bench(func, args.rounds):9.3f} ms  {size:8.0f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Benchmark the cold-start import cost of the fabik CLI per sub command.
+
+Each sub command is started in a fresh interpreter with ``python -X importtime``,
+the cumulative import time of the top level modules is summed up and compared
+with the budget. Modules which must never be imported by a sub command
+(e.g. fabric/paramiko for local commands) are checked too.
+
+Usage::
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --budget-scale 2
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# (command line, import budget in ms, modules that must not be imported)
+CASES: list[tuple[list[str], float, list[str]]] = [
+    (["--version"], 250, ["fabric", "paramiko", "invoke", "httpx", "cryptography"]),
+    (["gen", "token"], 300, ["fabric", "paramiko", "invoke", "httpx"]),
+    (["gen", "uuid"], 300, ["fabric", "paramiko", "invoke", "httpx"]),
+    (["conf", "--help"], 350, ["fabric", "paramiko", "invoke", "httpx", "jinja2"]),
+    (["server", "--help"], 600, ["httpx"]),
+    # 部署连接在第一次使用时才创建，子命令的帮助不载入 fabric
+    (["server", "deploy", "--help"], 350, ["fabric", "paramiko", "invoke", "httpx"]),
+]
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)$")
+
+
+def measure(args: list[str]) -> tuple[float, set[str]]:
+    """Return (cumulative import time in ms, imported module names)."""
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "fabik", *args],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT_DIR,
+    )
+    total_us = 0
+    modules: set[str] = set()
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m is None:
+            continue
+        _, cumulative, indent, name = m.groups()
+        modules.add(name)
+        # only the top level imports, the nested ones are included in cumulative
+        if len(indent) == 1:
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="Multiply every budget, for slow machines.",
+    )
+    opts = parser.parse_args()
+
+    failed = False
+    print(f"{'command':<20} {'median ms':>10} {'budget ms':>10}  result")
+    for args, budget, forbidden in CASES:
+        timings = []
+        modules: set[str] = set()
+        for _ in range(opts.repeat):
+            elapsed, modules = measure(args)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        limit = budget * opts.budget_scale
+        leaked = sorted(m for m in forbidden if m in modules)
+        ok = median <= limit and not leaked
+        failed = failed or not ok
+        result = "ok" if ok else "FAIL"
+        if leaked:
+            result += f" (imported: {', '.join(leaked)})"
+        print(f"{' '.join(args):<20} {median:>10.1f} {limit:>10.1f}  {result}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark the peak memory of TplWriter.write_file on a large template output.
+
+Compares streaming the template into a temp file (current write_file) with
+rendering the whole output into one string before writing it.
+
+Usage::
+
+    python benchmarks/bench_write.py
+    python benchmarks/bench_write.py --lines 1000000
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from fabik.conf.processor import TplWriter  # noqa: E402
+
+TEMPLATE = "{% for i in range(LINES) %}allow 10.{{ i // 65536 % 256 }}.{{ i // 256 % 256 }}.{{ i % 256 }};\n{% endfor %}"
+
+
+def measure(func) -> tuple[float, float]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=200000)
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        tpl_dir = Path(d)
+        (tpl_dir / "allow.conf.jinja2").write_text(TEMPLATE)
+        streamed = tpl_dir / "streamed.conf"
+        joined = tpl_dir / "joined.conf"
+
+        def write_joined():
+            writer = TplWriter("allow.conf", joined, {"LINES": opts.lines}, tpl_dir)
+            joined.write_bytes(writer._render())
+
+        def write_streamed():
+            writer = TplWriter("allow.conf", streamed, {"LINES": opts.lines}, tpl_dir)
+            writer.write_file()
+
+        # 预先编译模板，不计入结果
+        TplWriter("allow.conf", joined, {"LINES": 1}, tpl_dir)._render()
+        joined_ms, joined_mb = measure(write_joined)
+        streamed_ms, streamed_mb = measure(write_streamed)
+        assert streamed.read_bytes() == joined.read_bytes(), "results differ"
+
+        size_mb = streamed.stat().st_size / 1024 / 1024
+        print(f"output: {size_mb:.1f} MiB")
+        print(f"render then write: {joined_ms:10.1f} ms  peak {joined_mb:8.1f} MiB")
+        print(f"streaming write:   {streamed_ms:10.1f} ms  peak {streamed_mb:8.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,45 +2,21 @@
 
 fabik.cli
 ----------------------------
-    
+
 fabik command line interface implementation
+
+The sub commands (gen/conf/venv/server) are registered lazily: the implementation
+module of a sub command is only imported when that sub command is invoked,
+so ``fabik gen token`` does not pay for importing fabric/paramiko.
 """
 
+from typing import Any, Callable
+
 import typer
+from typer.core import TyperGroup
 
 from fabik.cmd.main import main_callback, main_init
 
-from fabik.cmd.gen import (
-    gen_password,
-    gen_fernet_key,
-    gen_token,
-    gen_uuid,
-    gen_requirements,
-)
-
-from fabik.cmd.conf import (
-    conf_callback,
-    conf_tpl,
-    conf_make,
-)
-
-from fabik.cmd.venv import (
-    venv_init,
-    venv_update,
-    venv_outdated,
-)
-
-from fabik.cmd.server import (
-    server_callback,
-    server_deploy,
-    server_start,
-    server_stop,
-    server_reload,
-    server_dar,
-)
-
-
-main: typer.Typer = typer.Typer()
 
 sub_gen: typer.Typer = typer.Typer(name='gen', help='[local] Generate common strings.')
 sub_conf: typer.Typer = typer.Typer(name='conf', help='[local/remote] Process configuration files.')
@@ -50,37 +26,133 @@ sub_venv: typer.Typer = typer.Typer(
 sub_server: typer.Typer = typer.Typer(
     name='server', help='[remote] Process remote server.'
 )
-
-main.add_typer(sub_gen)
-main.add_typer(sub_conf)
-main.add_typer(sub_venv)
-main.add_typer(sub_server)
+sub_daemon: typer.Typer = typer.Typer(
+    name='daemon', help='[local] Serve configs and renders from a long-running process.'
+)
 
 
 # The method in cmd module may be used as a command by other modules, so it is not decorated with a decorator.
+def register_sub_gen(sub: typer.Typer) -> None:
+    from fabik.cmd.gen import (
+        gen_password,
+        gen_fernet_key,
+        gen_token,
+        gen_uuid,
+        gen_requirements,
+    )
+
+    sub.command('password')(gen_password)
+    sub.command('fernet-key')(gen_fernet_key)
+    sub.command('token')(gen_token)
+    sub.command('uuid')(gen_uuid)
+    sub.command('requirements')(gen_requirements)
+
+
+def register_sub_conf(sub: typer.Typer) -> None:
+    from fabik.cmd.conf import (
+        conf_callback,
+        conf_tpl,
+        conf_make,
+        conf_compile,
+        conf_watch,
+        conf_deps,
+        conf_check,
+        conf_get,
+    )
+
+    sub.callback()(conf_callback)
+    sub.command('tpl')(conf_tpl)
+    sub.command('make')(conf_make)
+    sub.command('compile')(conf_compile)
+    sub.command('watch')(conf_watch)
+    sub.command('deps')(conf_deps)
+    sub.command('check')(conf_check)
+    sub.command('get')(conf_get)
+
+
+def register_sub_venv(sub: typer.Typer) -> None:
+    from fabik.cmd.server import server_callback
+    from fabik.cmd.venv import (
+        venv_init,
+        venv_update,
+        venv_outdated,
+    )
+
+    sub.callback()(server_callback)
+    sub.command('init')(venv_init)
+    sub.command('update')(venv_update)
+    sub.command('outdated')(venv_outdated)
+
+
+def register_sub_server(sub: typer.Typer) -> None:
+    from fabik.cmd.server import (
+        server_callback,
+        server_deploy,
+        server_start,
+        server_stop,
+        server_reload,
+        server_dar,
+    )
+
+    sub.callback()(server_callback)
+    sub.command('deploy')(server_deploy)
+    sub.command('start')(server_start)
+    sub.command('stop')(server_stop)
+    sub.command('reload')(server_reload)
+    sub.command('dar')(server_dar)
+
+
+def register_sub_daemon(sub: typer.Typer) -> None:
+    from fabik.cmd.daemon import (
+        daemon_serve,
+        daemon_status,
+        daemon_stop,
+    )
+
+    sub.command('serve')(daemon_serve)
+    sub.command('status')(daemon_status)
+    sub.command('stop')(daemon_stop)
+
+
+class LazyTyperGroup(TyperGroup):
+    """Load the sub Typer only when the sub command is requested."""
+
+    lazy_subcommands: dict[str, tuple[typer.Typer, Callable[[typer.Typer], None]]] = {
+        'gen': (sub_gen, register_sub_gen),
+        'conf': (sub_conf, register_sub_conf),
+        'venv': (sub_venv, register_sub_venv),
+        'server': (sub_server, register_sub_server),
+        'daemon': (sub_daemon, register_sub_daemon),
+    }
+    """ sub command name -> (sub Typer, register function) """
+
+    loaded_subcommands: dict[str, Any] = {}
+    """ The click commands which are already built from the sub Typer. """
+
+    def list_commands(self, ctx) -> list[str]:
+        return super().list_commands(ctx) + [
+            n for n in self.lazy_subcommands if n not in self.commands
+        ]
+
+    def get_command(self, ctx, cmd_name: str):
+        cmd = super().get_command(ctx, cmd_name)
+        if cmd is not None or cmd_name not in self.lazy_subcommands:
+            return cmd
+        return load_subcommand(cmd_name)
+
+
+def load_subcommand(cmd_name: str):
+    """Import the implementation module of the sub command and build its click command."""
+    cmd = LazyTyperGroup.loaded_subcommands.get(cmd_name)
+    if cmd is None:
+        sub, register = LazyTyperGroup.lazy_subcommands[cmd_name]
+        register(sub)
+        cmd = typer.main.get_command(sub)
+        LazyTyperGroup.loaded_subcommands[cmd_name] = cmd
+    return cmd
+
+
+main: typer.Typer = typer.Typer(cls=LazyTyperGroup)
+
 main.callback(invoke_without_command=True)(main_callback)
 main.command('init')(main_init)
-
-sub_conf.callback()(conf_callback)
-sub_conf.command('tpl')(conf_tpl)
-sub_conf.command('make')(conf_make)
-
-sub_gen.command('password')(gen_password)
-sub_gen.command('fernet-key')(gen_fernet_key)
-sub_gen.command('token')(gen_token)
-sub_gen.command('uuid')(gen_uuid)
-sub_gen.command('requirements')(gen_requirements)
-    
-    
-sub_venv.callback()(server_callback)
-sub_venv.command('init')(venv_init)
-sub_venv.command('update')(venv_update)
-sub_venv.command('outdated')(venv_outdated)
-
-
-sub_server.callback()(server_callback)
-sub_server.command('deploy')(server_deploy)
-sub_server.command('start')(server_start)
-sub_server.command('stop')(server_stop)
-sub_server.command('reload')(server_reload)
-sub_server.command('dar')(server_dar)
\ No newline at end of file
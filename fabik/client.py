@@ -0,0 +1,190 @@
+""".. _fabik_client:
+
+fabik.client
+----------------------
+
+``fabik daemon`` 的客户端，仅依赖标准库，启动成本远低于 ``fabik`` 命令行。 ::
+
+    from fabik.client import DaemonClient
+
+    with DaemonClient(work_dir='/path/to/project') as client:
+        client.query(['DEPLOY_DIR', 'config.toml.PORT'], env='prod')
+        client.render(['app.conf'], env='prod')
+
+也可以在命令行中调用，结果以 JSON 格式输出： ::
+
+    python -m fabik.client query '{"keys": ["DEPLOY_DIR"], "env": "prod"}'
+    python -m fabik.client --cwd /path/to/project ping
+
+协议见 :ref:`fabik_daemon` 。
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import Any
+
+from fabik.tpl import get_cache_dir
+
+__all__ = ["DAEMON_SOCKET", "DaemonClient", "DaemonClientError", "get_socket_file"]
+
+DAEMON_SOCKET: str = "daemon.sock"
+""" socket 文件名称，位于工作文件夹的缓存文件夹中，见 :func:`fabik.tpl.get_cache_dir` 。"""
+
+
+def get_socket_file(work_dir: Path | str) -> Path:
+    """返回工作文件夹的默认 socket 文件路径。"""
+    return get_cache_dir(work_dir).joinpath(DAEMON_SOCKET)
+
+
+class DaemonClientError(Exception):
+    """无法连接 daemon，或者 daemon 返回了错误。
+
+    :param code: JSON-RPC 错误码，无法连接时为 None。
+    """
+
+    code: int | None
+    message: str
+
+    def __init__(self, message: str, code: int | None = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class DaemonClient:
+    """连接 ``fabik daemon`` ，一个连接可以发送多个请求。
+
+    :param socket_file: socket 文件，默认为 work_dir 的缓存文件夹中的 ``daemon.sock`` 。
+    :param work_dir: 工作文件夹，默认为当前文件夹。
+    :param timeout: 等待响应的秒数。
+    """
+
+    socket_file: Path
+    timeout: float | None
+    _sock: socket.socket | None = None
+    _file: Any = None
+    _next_id: int = 0
+
+    def __init__(
+        self,
+        socket_file: Path | str | None = None,
+        *,
+        work_dir: Path | str | None = None,
+        timeout: float | None = 60.0,
+    ):
+        if socket_file is None:
+            socket_file = get_socket_file(work_dir or os.getcwd())
+        self.socket_file = Path(socket_file)
+        self.timeout = timeout
+
+    def connect(self) -> None:
+        if self._sock is not None:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_file.as_posix())
+        except OSError as e:
+            sock.close()
+            raise DaemonClientError(
+                f"Can not connect to fabik daemon at {self.socket_file.as_posix()}: {e}"
+            )
+        self._sock = sock
+        self._file = sock.makefile("rwb")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def __enter__(self) -> "DaemonClient":
+        self.connect()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def call(self, method: str, **params: Any) -> Any:
+        """调用一个方法，返回它的结果，出错时抛出 DaemonClientError。"""
+        self.connect()
+        self._next_id += 1
+        request = {"jsonrpc": "2.0", "id": self._next_id, "method": method, "params": params}
+        try:
+            self._file.write(json.dumps(request).encode() + b"\n")
+            self._file.flush()
+            line = self._file.readline()
+        except OSError as e:
+            self.close()
+            raise DaemonClientError(f"Call {method} error: {e}")
+        if not line:
+            self.close()
+            raise DaemonClientError(f"fabik daemon closed the connection during {method}.")
+        response = json.loads(line)
+        error = response.get("error")
+        if error is not None:
+            raise DaemonClientError(error.get("message", ""), error.get("code"))
+        return response.get("result")
+
+    def ping(self) -> dict:
+        return self.call("ping")
+
+    def query(self, keys: list[str], env: str = "") -> dict:
+        """返回 ``{"values": {键: 值}, "missing": [找不到的键]}`` ，与 ``fabik conf get`` 相同。"""
+        return self.call("query", keys=keys, env=env)
+
+    def render(self, names: list[str], env: str = "", write: bool = False) -> list[dict]:
+        """渲染配置文件，write 为 False 时仅返回渲染的内容。"""
+        return self.call("render", names=names, env=env, write=write)
+
+    def validate(
+        self, envs: list[str] | None = None, names: list[str] | None = None
+    ) -> list[dict]:
+        """与 ``fabik conf check`` 相同，返回所有检查项。"""
+        return self.call("validate", envs=envs, names=names)
+
+    def reload(self) -> dict:
+        return self.call("reload")
+
+    def shutdown(self) -> None:
+        self.call("shutdown")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m fabik.client", description="Call the methods of fabik daemon."
+    )
+    parser.add_argument("--cwd", help="The working directory of fabik daemon.")
+    parser.add_argument("--socket", help="The socket file of fabik daemon.")
+    parser.add_argument(
+        "method", help="ping, query, render, validate, reload or shutdown."
+    )
+    parser.add_argument(
+        "params", nargs="?", default="{}", help="The params in a JSON object."
+    )
+    args = parser.parse_args(argv)
+    try:
+        params = json.loads(args.params)
+        if not isinstance(params, dict):
+            raise ValueError("params must be a JSON object.")
+    except ValueError as e:
+        print(f"Invalid params: {e}", file=sys.stderr)
+        return 2
+    try:
+        with DaemonClient(args.socket, work_dir=args.cwd) as client:
+            result = client.call(args.method, **params)
+    except DaemonClientError as e:
+        print(e.message, file=sys.stderr)
+        return 1
+    print(json.dumps(result, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,31 +19,41 @@ __all__ = [
     "NoteOutputFile",
 ]
 
+from collections import Counter
 from enum import StrEnum
 import shutil
+import time
 from pathlib import Path
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable
 
 import typer
 from typing import Annotated
 
 from fabik.conf import (
-    ConfigReplacer,
     FabikConfig,
     FabikConfigFile,
     config_validator_name_workdir,
     config_validator_tpldir,
 )
-from fabric.connection import Connection
+from fabik.conf.manifest import WriteStatus, format_write_stats
+from fabik.conf.session import ConfigSession
+from fabik.conf.view import materialize
+from fabik.runtime import BUNDLE_SUFFIX
 from fabik.error import (
     ConfigError,
     FabikError,
     PathError,
+    echo_captured,
     echo_error,
     echo_info,
     echo_warning,
 )
 
+if TYPE_CHECKING:
+    from fabik.conf.processor import ConfigReplacer
+    from fabik.conf.batch import RenderJob, RenderResult
+    from fabik.deploy import Deploy
+
 
 class UUIDType(StrEnum):
     UUID1 = "uuid1"
@@ -78,17 +88,133 @@ class GlobalState:
     env_name: str = ""
     """ 命令行传递来的 env 的值。 """
 
+    use_cache: bool = True
+    """ 是否使用配置快照缓存。 """
+
+    all_envs: bool = False
+    """ 是否处理 ENV 中定义的所有环境。 """
+
+    fabik_configs: dict[str, FabikConfig] | None = None
+    """ 同时处理多个环境时，每个环境的 FabikConfig。 """
+
     output_dir: Path | None = None
     output_file: Path | None = None
+
+    matrix_key: str | None = None
+    """ 矩阵模式：为表中这个列表的每一项渲染一次模板。"""
+
+    matrix_var: str = "item"
+    """ 矩阵模式：列表项在模板中的变量名称。"""
+
+    matrix_name: str | None = None
+    """ 矩阵模式：使用列表项中这个字段的值作为输出文件名的后缀。"""
+
+    bundle: bool = False
+    """ 输出二进制配置包，输出文件名带有 .fbk 后缀，见 :ref:`fabik_runtime` 。"""
+
+    write_stats: Counter
+    """ 写入输出文件的结果统计，键为 WriteStatus，每个 GlobalState 使用自己的 Counter。 """
     _config_validators: list[Callable] = []  # 存储自定义验证器函数
 
-    deploy_conn: "Deploy" = None  # type: ignore # noqa: F821
-    
+    deploy_class: DeployClassName | None = None
+    """ server/venv 命令使用的部署类，远程部署连接在第一次使用 deploy_conns 时才创建。"""
+
+    parallel: int = 1
+    """ server/venv 命令同时操作的服务器的最大数量。"""
+
+    _deploy_conns: "dict[str, Deploy] | None" = None
+    """ 服务器名称 -> 远程部署连接，见 FABRIC.hosts。"""
+
+    _session: ConfigSession | None = None
+    """ 进程内的配置会话，见 get_session。"""
+
+    def __init__(self):
+        self.write_stats = Counter()
+
     @property
     def cwd(self) -> Path:
         """ 当前工作目录。"""
         return self.fabik_file.getdir()
 
+    @property
+    def deploy_conns(self) -> "dict[str, Deploy]":
+        """所有服务器的远程部署连接，第一次使用时才载入配置并创建，SSH 连接在第一次执行远程命令时才建立。"""
+        if self._deploy_conns is None:
+            if self.deploy_class is None:
+                echo_warning("Please set GlobalState.deploy_class first.")
+                raise typer.Exit()
+            self.build_deploy_conns(self.get_deploy_class())
+        return self._deploy_conns  # type: ignore
+
+    @property
+    def deploy_conn(self) -> "Deploy":
+        """第一台服务器的远程部署连接。"""
+        return next(iter(self.deploy_conns.values()))
+
+    @deploy_conn.setter
+    def deploy_conn(self, value: "Deploy | None") -> None:
+        self._deploy_conns = None if value is None else {value.name: value}
+
+    def get_deploy_class(self) -> type["Deploy"]:
+        """返回 deploy_class 对应的部署类，fabric 在这里才被载入。"""
+        if self.deploy_class == DeployClassName.uWSGI:
+            from fabik.deploy.uwsgi import UwsgiDeploy
+
+            return UwsgiDeploy
+        from fabik.deploy.gunicorn import GunicornDeploy
+
+        return GunicornDeploy
+
+    @property
+    def env_names(self) -> list[str]:
+        """ 命令行中使用逗号分隔的多个 env 名称。"""
+        return [n.strip() for n in self.env_name.split(",") if n.strip()]
+
+    @property
+    def is_multi_env(self) -> bool:
+        """ 是否需要同时处理多个环境。"""
+        return self.all_envs or len(self.env_names) > 1
+
+    def get_session(self) -> ConfigSession:
+        """返回当前配置文件的会话，配置文件或者 use_cache 改变时创建新的会话。"""
+        session = self._session
+        if (
+            session is None
+            or session.fabik_file is not self.fabik_file
+            or session.use_cache != self.use_cache
+        ):
+            session = ConfigSession(self.fabik_file, use_cache=self.use_cache)
+            self._session = session
+        return session
+
+    def get_replacer(
+        self,
+        fabik_config: FabikConfig | None = None,
+        *,
+        output_dir: Path | None = None,
+        tpl_dir: Path | None = None,
+    ) -> "ConfigReplacer":
+        """返回会话中共享的 ConfigReplacer，一个命令中渲染多个模板时不必重复创建。
+
+        :param fabik_config: 默认使用 self.fabik_config
+        """
+        return self.get_session().get_replacer(
+            fabik_config or self.fabik_config,  # pyright: ignore[reportArgumentType]
+            self.cwd,
+            output_dir=output_dir,
+            tpl_dir=tpl_dir,
+            verbose=self.verbose,
+        )
+
+    def echo_session_stats(self) -> None:
+        """输出本次命令载入配置文件和创建 ConfigReplacer 的次数。"""
+        if self._session is None:
+            return
+        echo_info(
+            f"Config parses: {self._session.parse_count}, replacers: {self._session.replacer_count}.",
+            panel_title="ConfigSession",
+        )
+
     def register_config_validator(self, validator_func: Callable) -> None:
         """注册一个配置验证函数，用于验证配置数据。
 
@@ -100,15 +226,19 @@ class GlobalState:
         if callable(validator_func) and validator_func not in self._config_validators:
             self._config_validators.append(validator_func)
 
-    def _check_conf_data(self) -> bool:
-        """执行所有已注册的配置验证器"""
-        if not self.fabik_config:
+    def _check_conf_data(self, fabik_config: FabikConfig | None = None) -> bool:
+        """执行所有已注册的配置验证器
+
+        :param fabik_config: 需要验证的配置，默认验证 self.fabik_config
+        """
+        fabik_config = fabik_config or self.fabik_config
+        if not fabik_config:
             return False
 
         # 运行所有注册的验证器
         for validator in self._config_validators:
             try:
-                if not validator(self.fabik_config):
+                if not validator(fabik_config):
                     return False
             except Exception as e:
                 echo_error(f"Config validation error: {str(e)}")
@@ -171,7 +301,7 @@ class GlobalState:
         file_not_found_err_msg: str = 'Please call "fabik init" to generate a "fabik.toml" file.',
     ):
         try:
-            self.fabik_config = self.fabik_file.load_config(self.env_name)
+            self.fabik_config = self.get_session().load_config(self.env_name)
             if check:
                 self._check_conf_data()
         except PathError as e:
@@ -190,16 +320,194 @@ class GlobalState:
             echo_error(e)
             raise typer.Abort()
 
+    def load_multi_env_conf_data(self, check: bool = False) -> dict[str, FabikConfig]:
+        """仅解析一次配置文件，为 --env 中的每个环境（或者 --all-envs）创建 FabikConfig。
+
+        self.fabik_config 被设置为第一个环境的配置，用于读取 TPL_DIR 等公共配置。
+        """
+        try:
+            configs = self.get_session().load_configs(
+                None if self.all_envs else self.env_names
+            )
+            if not configs:
+                raise ConfigError(err_type=ValueError(), err_msg="No env found in ENV.")
+            for config in configs.values():
+                config.check_env_name()
+                if check:
+                    self._check_conf_data(config)
+        except ConfigError as e:
+            echo_error(e.err_msg)
+            raise typer.Abort()
+        except FabikError as e:
+            echo_error(e.err_msg)
+            raise typer.Abort()
+        self.fabik_configs = configs
+        self.fabik_config = next(iter(configs.values()))
+        return configs
+
+    def get_render_configs(self) -> dict[str, FabikConfig]:
+        """返回需要渲染的所有环境的 FabikConfig。
+
+        调用之前需要先调用 load_conf_data 或者 load_multi_env_conf_data。
+        """
+        if self.is_multi_env:
+            if self.fabik_configs is None:
+                echo_warning("Please perform GlobalState.load_multi_env_conf_data first.")
+                raise typer.Exit()
+            return self.fabik_configs
+        if self.fabik_config is None:
+            echo_warning("Please perform GlobalState.load_conf_data first.")
+            raise typer.Exit()
+        return {self.fabik_config.env_name: self.fabik_config}
+
+    def preload_fragments(self, keys: list[str]) -> None:
+        """并行载入所有环境读取 keys 时需要的 INCLUDE 片段。"""
+        from fabik.conf.include import load_fragments
+
+        configs = self.get_render_configs().values()
+        try:
+            load_fragments([f for c in configs for f in c.get_fragments(*keys)])
+        except FabikError as e:
+            echo_error(e.err_msg)
+            raise typer.Abort()
+
+    def build_render_jobs(
+        self, tpl_names: list[str], /, tpl_dir: Path | None = None
+    ) -> list["RenderJob"]:
+        """为每个环境的每个配置文件创建一个渲染任务。
+
+        同时处理多个环境时，输出文件名总是带有环境名称后缀。
+        提供 matrix_key 时，为列表的每一项创建一个渲染任务，输出文件名带有列表项名称后缀，
+        例如 ``config.toml.<item>.<env>`` 。
+        bundle 为 True 时，输出文件名的最后加入 ``.fbk`` 后缀。
+        """
+        from fabik.conf.batch import RenderJob
+
+        configs = self.get_render_configs()
+        if self.is_multi_env and not self.env_postfix:
+            echo_warning(
+                "Multiple envs are rendered, --env-postfix is enabled to avoid overwriting."
+            )
+        use_postfix = self.is_multi_env or self.env_postfix
+        output_dir, output_file = self._resolve_output_parameters()
+        self.preload_fragments(tpl_names)
+
+        jobs: list[RenderJob] = []
+        for env_name, config in configs.items():
+            env_postfix = f".{env_name}" if use_postfix and env_name else ""
+            for tpl_name in tpl_names:
+                for variant, extra in self._get_matrix_variants(config, tpl_name):
+                    postfix = f".{variant}{env_postfix}" if variant else env_postfix
+                    job = RenderJob(
+                        env_name,
+                        tpl_name,
+                        tpl_dir=tpl_dir,
+                        output_dir=output_dir,
+                        force=self.force,
+                        rename=self.rename,
+                        variant=variant,
+                        extra=extra,
+                    )
+                    if output_file is None:
+                        # 指定 output_file 时，由 output_file 的后缀决定是否输出配置包
+                        job.target_postfix = (
+                            postfix + BUNDLE_SUFFIX if self.bundle else postfix
+                        )
+                    else:
+                        job.output_file = self._resolve_output_file_target(
+                            output_file, postfix
+                        )
+                    jobs.append(job)
+        return jobs
+
+    def _get_matrix_variants(
+        self, config: FabikConfig, tpl_name: str
+    ) -> list[tuple[str, dict | None]]:
+        """返回 [(列表项名称, 额外的模板变量)]，不使用矩阵模式时仅返回一个空的变体。"""
+        if self.matrix_key is None:
+            return [("", None)]
+        from fabik.conf.batch import get_matrix_items
+
+        try:
+            replacer = self.get_replacer(config)
+            items = get_matrix_items(
+                replacer.get_replace_obj(tpl_name), self.matrix_key, self.matrix_name
+            )
+        except FabikError as e:
+            echo_error(f"{tpl_name} (env: {config.env_name}): {e.err_msg}")
+            raise typer.Abort()
+        if not items:
+            echo_warning(f"{tpl_name} (env: {config.env_name}): {self.matrix_key} is empty.")
+        return [(name, {self.matrix_var: item}) for name, item in items]
+
+    def write_config_files(
+        self,
+        tpl_names: list[str],
+        /,
+        tpl_dir: Path | None = None,
+        max_workers: int | None = None,
+    ) -> list["RenderResult"]:
+        """在进程池中为多个环境渲染多个配置文件，见 build_render_jobs。
+
+        调用之前需要先调用 load_conf_data 或者 load_multi_env_conf_data。
+        """
+        from fabik.conf.batch import render_jobs
+
+        jobs = self.build_render_jobs(tpl_names, tpl_dir=tpl_dir)
+        results = render_jobs(
+            self.get_render_configs(),
+            jobs,
+            self.cwd,
+            max_workers=max_workers,
+            verbose=self.verbose,
+        )
+        self.report_render_results(results)
+        return results
+
+    def report_render_results(
+        self, results: list["RenderResult"], abort: bool = True
+    ) -> None:
+        """按照任务顺序输出渲染结果，有失败的任务时中止命令。
+
+        :param abort: 有失败的任务时是否中止命令。
+        """
+        failed = 0
+        stats: Counter = Counter()
+        for result in results:
+            echo_captured(result.output)
+            if result.status is not None:
+                stats[result.status] += 1
+            if not result.ok:
+                failed += 1
+                tpl_name = result.job.tpl_name
+                if result.job.variant:
+                    tpl_name = f"{tpl_name}[{result.job.variant}]"
+                echo_error(f"{tpl_name} (env: {result.job.env_name}): {result.error}")
+        self.write_stats.update(stats)
+        self.echo_write_stats(stats)
+        if failed:
+            echo_error(f"{failed}/{len(results)} render jobs failed.")
+            if abort:
+                raise typer.Abort()
+
+    def echo_write_stats(self, stats: Counter | None = None) -> None:
+        """输出写入结果的统计，供其他工具判断是否需要重载服务。
+
+        :param stats: 默认输出 write_stats。
+        """
+        echo_info(f"Outputs: {format_write_stats(self.write_stats if stats is None else stats)}.")
+
     def write_config_file(
         self,
         tpl_name: str,
         /,
         tpl_dir: Path | None = None,
         target_postfix: str = "",
-    ) -> None:
+    ) -> WriteStatus | None:
         """写入配置文件
 
         :param target_postfix: 配置文件的后缀
+        :return: 写入的结果，同时计入 write_stats
         """
         try:
             # 处理参数优先级和路径验证
@@ -216,13 +524,8 @@ class GlobalState:
                     panel_title="GlobalState::write_config_file()",
                 )
 
-            replacer = ConfigReplacer(
-                self.fabik_config,  # pyright: ignore[reportArgumentType]
-                self.cwd,
-                output_dir=output_dir,
-                tpl_dir=tpl_dir,
-                verbose=self.verbose,
-            )
+            # 同一个命令中的所有模板共享一个 ConfigReplacer
+            replacer = self.get_replacer(output_dir=output_dir, tpl_dir=tpl_dir)
 
             # 调用统一的 set_writer 方法，根据情况传递 output_file
             if output_file is not None:
@@ -246,6 +549,9 @@ class GlobalState:
                     target_postfix=target_postfix,
                     immediately=True,
                 )
+            status = replacer.writer.status if replacer.writer else None
+            self.write_stats[status] += 1
+            return status
 
         except FabikError as e:
             echo_error(e.err_msg)
@@ -294,11 +600,6 @@ class GlobalState:
         else:
             resolved_output_file = output_file
 
-        if self.env_postfix and self.env:
-            resolved_output_file = resolved_output_file.with_name(
-                resolved_output_file.stem + f"-{self.env}" + resolved_output_file.suffix
-            )
-
         if target_postfix:
             resolved_output_file = resolved_output_file.with_name(
                 resolved_output_file.stem + target_postfix + resolved_output_file.suffix
@@ -319,7 +620,7 @@ class GlobalState:
 
         config_validator_tpldir(self.fabik_config)
         # 源文件夹
-        srcfiledir = Path(self.fabik_config.getcfg("TPL_DIR"))
+        srcfiledir = Path(self.fabik_config.path("TPL_DIR"))
         # 目标文件夹
         dstfiledir = self.cwd
         while len(split_path) > 1:
@@ -354,31 +655,28 @@ class GlobalState:
             shutil.copyfile(srcfile, dstfile)
             echo_info(f"复制 [red]{srcfile}[/] 到 [red]{dstfile}[/]！")
 
-    def build_deploy_conn(self, deploy_class: type["Deploy"]) -> "Deploy":  # type: ignore  # noqa: F821
-        """创建一个远程部署连接。"""
+    def build_deploy_conns(self, deploy_class: type["Deploy"]) -> "dict[str, Deploy]":  # type: ignore  # noqa: F821
+        """为 FABRIC 中的每台服务器创建一个远程部署连接。"""
+        # fabric 的载入成本很高，仅在需要远程部署时才载入
+        from fabric.connection import Connection
+        from fabik.deploy.fleet import get_fabric_hosts
+
         try:
             # 确保配置已加载
             if self.fabik_config is None:
                 self.load_conf_data(check=True)
 
-            replacer = ConfigReplacer(
-                self.fabik_config,  # pyright: ignore[reportArgumentType]
-                self.cwd,
-                verbose=self.verbose,
-            )
+            replacer = self.get_replacer()
             # 从 fabik.toml 配置中获取服务器地址
-            fabric_conf = replacer.get_tpl_value("FABRIC", merge=True)
+            # Connection 需要真正的 dict（例如 connect_kwargs）
+            fabric_conf = materialize(replacer.get_tpl_value("FABRIC", merge=True))
             pye_conf = replacer.get_tpl_value("PYE", merge=True)
 
             # 确保 fabric_conf 是一个字典
-            if (
-                not isinstance(fabric_conf, dict)
-                or "host" not in fabric_conf
-                or "user" not in fabric_conf
-            ):
+            if not isinstance(fabric_conf, dict):
                 raise ConfigError(
-                    err_type=ValueError(),
-                    err_msg="FABRIC configuration must contain 'host' and 'user' parameter",
+                    err_type=TypeError(),
+                    err_msg="FABRIC must be a table",
                 )
 
             if pye_conf is None:
@@ -387,14 +685,21 @@ class GlobalState:
                     err_msg="PYE configuration is required",
                 )
 
-            d = deploy_class(
-                self.fabik_config,
-                self.cwd,
-                Connection(**fabric_conf),
-                self.verbose,
-            )
-            self.deploy_conn = d
-            return d
+            conns: dict[str, "Deploy"] = {}
+            for host in get_fabric_hosts(fabric_conf):
+                fabik_config = self.fabik_config
+                if host.overrides:
+                    fabik_config = fabik_config.with_overrides(host.overrides)
+                d = deploy_class(
+                    fabik_config,
+                    self.cwd,
+                    Connection(**host.conn_kwargs),
+                    self.verbose,
+                )
+                d.name = host.name
+                conns[host.name] = d
+            self._deploy_conns = conns
+            return conns
         except FabikError as e:
             echo_error(e.err_msg)
             raise typer.Abort()
@@ -402,6 +707,57 @@ class GlobalState:
             echo_error(str(e))
             raise typer.Abort()
 
+    def build_deploy_conn(self, deploy_class: type["Deploy"]) -> "Deploy":  # type: ignore  # noqa: F821
+        """创建远程部署连接，返回第一台服务器的连接。"""
+        return next(iter(self.build_deploy_conns(deploy_class).values()))
+
+    def run_deploy(
+        self,
+        action: Callable[["Deploy"], Any],
+        title: str = "",
+        *,
+        batch_size: int | None = None,
+        canary: int = 1,
+    ) -> None:
+        """在所有的服务器上执行 action，同时执行的服务器数量由 parallel 限制。
+
+        仅有一台服务器时直接执行；有多台服务器时，输出每台服务器的结果和耗时，任一服务器失败时返回非零值。
+
+        :param title: 失败时输出的说明文字。
+        :param batch_size: 提供时分批执行，见 :func:`fabik.deploy.fleet.run_rolling` ，忽略 parallel。
+        :param canary: 分批执行时，金丝雀批次的服务器数量。
+        """
+        from fabik.deploy.fleet import (
+            format_host_results,
+            get_error_message,
+            run_on_hosts,
+            run_rolling,
+        )
+
+        conns = self.deploy_conns
+        prefix = f"{title}: " if title else ""
+        if len(conns) == 1:
+            try:
+                action(next(iter(conns.values())))
+            except (typer.Exit, typer.Abort):
+                raise
+            except Exception as e:
+                echo_error(prefix + get_error_message(e))
+                raise typer.Abort()
+            return
+
+        start = time.perf_counter()
+        if batch_size is None:
+            results = run_on_hosts(conns, action, self.parallel)
+        else:
+            results = run_rolling(conns, action, batch_size, canary)
+        summary = format_host_results(results, time.perf_counter() - start)
+        if all(r.ok for r in results):
+            echo_info(summary)
+        else:
+            echo_error(summary, panel_title=title or None)
+            raise typer.Exit(1)
+
     def __repr__(self) -> str:
         return f"""{self.__class__.__name__}(
     cwd={self.cwd!s}, 
@@ -11,7 +11,8 @@ from typing import Annotated
 from pathlib import Path
 
 from fabik.conf import config_validator_tpldir
-from fabik.error import echo_error
+from fabik.error import echo_error, echo_info, FabikError
+from fabik.runtime import BUNDLE_SUFFIX
 from fabik.cmd import global_state, NoteOutputDir, NoteOutputFile, NoteForce, NoteRename, NoteEnvPostfix
 
 
@@ -21,12 +22,35 @@ def conf_callback(
     output_dir: NoteOutputDir = None,
     output_file: NoteOutputFile = None,
     env_postfix: NoteEnvPostfix = False,
+    all_envs: Annotated[
+        bool,
+        typer.Option(
+            help="Process all envs defined in ENV. Use --env a,b,c to process some of them."
+        ),
+    ] = False,
 ):
     global_state.force = force
     global_state.rename = rename
     global_state.output_dir = output_dir
     global_state.output_file = output_file
     global_state.env_postfix = env_postfix
+    global_state.all_envs = all_envs
+    # 同一个进程中多次调用命令（例如测试）时，每个命令单独统计
+    global_state.write_stats.clear()
+
+
+def _get_tpl_names(file: list[str], tpl_dir: Path) -> list[str]:
+    """将命令行提供的文件名转换为模板名称，模板文件不存在时中止命令。"""
+    tpl_names: list[str] = []
+    for n in file:
+        # 模板名称统一不带 jinja2 后缀，模板文件必须带有 jinja2 后缀。
+        tpl_name = n[:-7] if n.endswith(".jinja2") else n
+        tpl_file = tpl_dir.joinpath(f"{tpl_name}.jinja2")
+        tpl_names.append(tpl_name)
+        if not tpl_file.exists():
+            echo_error(f'Template file "{tpl_file}" not found.')
+            raise typer.Abort()
+    return tpl_names
 
 
 def conf_tpl(
@@ -36,21 +60,50 @@ def conf_tpl(
             help="Provide configuration file names based on the tpl directory."
         ),
     ],
+    matrix: Annotated[
+        str | None,
+        typer.Option(
+            help="Render the template once for each item of the list MATRIX in the table, e.g. REGIONALS."
+        ),
+    ] = None,
+    matrix_var: Annotated[
+        str, typer.Option(help="The variable name of the list item in the template.")
+    ] = "item",
+    matrix_name: Annotated[
+        str | None,
+        typer.Option(
+            help="Use this field of the list item as the output file postfix, default to the item itself or its index."
+        ),
+    ] = None,
+    jobs: Annotated[
+        int | None,
+        typer.Option(
+            "--jobs",
+            "-j",
+            min=1,
+            help="Render the templates in JOBS processes, default to the CPU count for multiple envs or matrix mode.",
+        ),
+    ] = None,
 ):
     """[local] Initialize configuration file content based on the template files in the local tpl directory."""
     # 需要检查 tpl_dir 是否存在
     global_state.register_config_validator(config_validator_tpldir)
-    global_state.load_conf_data(check=True)
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data(check=True)
+    else:
+        global_state.load_conf_data(check=True)
     tpl_dir = Path(global_state.fabik_config.TPL_DIR)  # type: ignore
-    tpl_names: list[str] = []
-    for n in file:
-        # 模板名称统一不带 jinja2 后缀，模板文件必须带有 jinja2 后缀。
-        tpl_name = n[:-7] if n.endswith(".jinja2") else n
-        tpl_file = tpl_dir.joinpath(f"{tpl_name}.jinja2")
-        tpl_names.append(tpl_name)
-        if not tpl_file.exists():
-            echo_error(f'Template file "{tpl_file}" not found.')
-            raise typer.Abort()
+    tpl_names = _get_tpl_names(file, tpl_dir)
+    global_state.matrix_key = matrix
+    global_state.bundle = False
+    global_state.matrix_var = matrix_var
+    global_state.matrix_name = matrix_name
+
+    if global_state.is_multi_env or matrix is not None or jobs is not None:
+        # 多个环境、矩阵模式或者提供了 --jobs 时，多个输出文件在进程池中并发渲染，
+        # 输出和错误按照模板的顺序报告
+        global_state.write_config_files(tpl_names, tpl_dir=tpl_dir, max_workers=jobs)
+        return
 
     for tpl_name in tpl_names:
         global_state.write_config_file(
@@ -58,6 +111,7 @@ def conf_tpl(
             tpl_dir=tpl_dir,
             target_postfix=f".{global_state.fabik_config.env_name}" if global_state.env_postfix else "",  # pyright: ignore[reportOptionalMemberAccess]
         )
+    global_state.echo_write_stats()
 
 
 def conf_make(
@@ -66,10 +120,289 @@ def conf_make(
         typer.Argument(help="Make a configuration file in fabik.toml."),
     ],
     env_postfix: NoteEnvPostfix = False,
+    bundle: Annotated[
+        bool,
+        typer.Option(
+            help="Write a memory-mappable binary bundle with .fbk postfix, read it by fabik.runtime.load_bundle."
+        ),
+    ] = False,
 ):
     """[local] Initialize configuration file content based on the fabik.toml, no template file is used."""
+    global_state.matrix_key = None
+    global_state.bundle = bundle
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data(check=True)
+        global_state.write_config_files(file)
+        return
+
     global_state.load_conf_data(check=True)
+    # 指定 --output-file 时，由它的后缀决定是否输出配置包
+    bundle_postfix = BUNDLE_SUFFIX if bundle and global_state.output_file is None else ""
     for f in file:
-        global_state.write_config_file(
-            f, target_postfix=f".{global_state.fabik_config.env_name}" if global_state.env_postfix else ""  # pyright: ignore[reportOptionalMemberAccess]
+        env_postfix_value = f".{global_state.fabik_config.env_name}" if global_state.env_postfix else ""  # pyright: ignore[reportOptionalMemberAccess]
+        global_state.write_config_file(f, target_postfix=env_postfix_value + bundle_postfix)
+    global_state.echo_write_stats()
+
+
+def conf_watch(
+    file: Annotated[
+        list[str],
+        typer.Argument(
+            help="Provide configuration file names based on the tpl directory."
+        ),
+    ],
+    polling: Annotated[
+        bool, typer.Option(help="Use polling instead of inotify.")
+    ] = False,
+    interval: Annotated[
+        float, typer.Option(help="Polling interval in seconds.")
+    ] = 0.5,
+    debounce: Annotated[
+        float,
+        typer.Option(help="Merge changes within DEBOUNCE seconds into one rebuild."),
+    ] = 0.2,
+):
+    """[local] Watch fabik.toml, .fabik.env and the tpl directory, re-render the affected configuration files."""
+    from fabik.conf.rebuild import Rebuilder
+    from fabik.util.watch import create_watcher, watch_changes
+
+    global_state.register_config_validator(config_validator_tpldir)
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data(check=True)
+    else:
+        global_state.load_conf_data(check=True)
+    tpl_dir = Path(global_state.fabik_config.TPL_DIR)  # type: ignore
+    tpl_names = _get_tpl_names(file, tpl_dir)
+
+    rebuilder = Rebuilder(
+        global_state.fabik_file,
+        global_state.get_render_configs(),
+        global_state.build_render_jobs(tpl_names, tpl_dir=tpl_dir),
+        verbose=global_state.verbose,
+        use_cache=global_state.use_cache,
+    )
+    global_state.report_render_results(rebuilder.render_all(), abort=False)
+    rebuilder.save_graph()
+
+    with create_watcher(
+        rebuilder.config_files, rebuilder.tpl_dirs, polling=polling, interval=interval
+    ) as watcher:
+        echo_info(f"Watching for changes ({watcher.name}), press Ctrl+C to stop.")
+        try:
+            for changed in watch_changes(watcher, debounce):
+                try:
+                    results = rebuilder.rebuild(changed)
+                except FabikError as e:
+                    echo_error(e.err_msg)
+                    continue
+                if results:
+                    global_state.report_render_results(results, abort=False)
+                    rebuilder.save_graph()
+        except KeyboardInterrupt:
+            echo_info("Stop watching.")
+
+
+def conf_deps(
+    file: Annotated[
+        list[str],
+        typer.Argument(
+            help="Provide configuration file names based on the tpl directory."
+        ),
+    ],
+    key: Annotated[
+        list[str] | None,
+        typer.Option(
+            "--key",
+            "-k",
+            help="Print the outputs to re-render if KEY changes, e.g. app.conf.PORT or ENV.prod.app.conf.PORT.",
+        ),
+    ] = None,
+):
+    """[local] Print the config keys and template files each configuration file depends on."""
+    from fabik.conf.rebuild import Rebuilder
+
+    global_state.register_config_validator(config_validator_tpldir)
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data(check=True)
+    else:
+        global_state.load_conf_data(check=True)
+    tpl_dir = Path(global_state.fabik_config.TPL_DIR)  # type: ignore
+    tpl_names = _get_tpl_names(file, tpl_dir)
+
+    rebuilder = Rebuilder(
+        global_state.fabik_file,
+        global_state.get_render_configs(),
+        global_state.build_render_jobs(tpl_names, tpl_dir=tpl_dir),
+        verbose=global_state.verbose,
+        use_cache=global_state.use_cache,
+    )
+    if not global_state.use_cache or not rebuilder.load_graph():
+        results = rebuilder.track(range(len(rebuilder.jobs)))
+        for result in results:
+            if not result.ok:
+                echo_error(f"{result.job.name}: {result.error}")
+        if not all(r.ok for r in results):
+            raise typer.Abort()
+        if global_state.use_cache:
+            rebuilder.save_graph()
+
+    graph = rebuilder.graph
+    if key:
+        for k in key:
+            env_name, path = graph.resolve_key(k)
+            outputs = sorted(graph.affected_by_key(path, env_name))
+            echo_info(f"{k}: {', '.join(outputs) if outputs else '(none)'}")
+        return
+
+    for job in rebuilder.jobs:
+        deps = graph.outputs[job.name]
+        keys = "\n".join(f"  {'.'.join(k)}" for k in sorted(deps.keys))
+        templates = "\n".join(f"  {t}" for t in sorted(deps.templates))
+        echo_info(f"{job.name}\nkeys:\n{keys}\ntemplates:\n{templates}")
+
+
+def conf_check(
+    file: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Only check these configuration files, default to all tables and templates."
+        ),
+    ] = None,
+    jobs: Annotated[
+        int | None,
+        typer.Option("--jobs", "-j", help="Number of processes, default to the CPU count."),
+    ] = None,
+):
+    """[local] Validate the configs and dry-render all tables and templates, report all failures."""
+    import time
+    from rich.table import Table
+    from fabik.conf.check import check_configs
+    from fabik.error import echo
+
+    global_state.register_config_validator(config_validator_tpldir)
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data(check=False)
+    else:
+        global_state.load_conf_data(check=False)
+    configs = global_state.get_render_configs()
+    names = [n[:-7] if n.endswith(".jinja2") else n for n in file] if file else None
+
+    start = time.perf_counter()
+    items = check_configs(
+        configs,
+        global_state.cwd,
+        list(global_state._config_validators),
+        names=names,
+        max_workers=jobs,
+    )
+    elapsed = time.perf_counter() - start
+
+    table = Table("env", "kind", "name", "time (ms)", "result")
+    for item in items:
+        table.add_row(
+            item.env_name,
+            item.kind,
+            item.name,
+            f"{item.elapsed * 1000:.1f}",
+            "[green]ok[/]" if item.ok else "[red]failed[/]",
+        )
+    echo(table)
+
+    failed = [item for item in items if not item.ok]
+    for item in failed:
+        echo_error(f"{item.name} ({item.kind}, env: {item.env_name}): {item.error}")
+    summary = f"{len(items)} checks in {len(configs)} envs, {len(failed)} failed, {elapsed:.2f}s."
+    if failed:
+        echo_error(summary)
+        raise typer.Exit(1)
+    echo_info(summary)
+
+
+def _read_stdin_keys() -> list[str]:
+    """从标准输入读取 JSON 格式的键名列表。"""
+    import json
+    import sys
+
+    try:
+        keys = json.loads(sys.stdin.read() or "[]")
+    except json.JSONDecodeError as e:
+        echo_error(f"Decode keys from stdin error: {e}")
+        raise typer.Abort()
+    if not isinstance(keys, list) or not all(isinstance(k, str) for k in keys):
+        echo_error("Keys from stdin must be a JSON list of strings.")
+        raise typer.Abort()
+    return keys
+
+
+def conf_get(
+    key: Annotated[
+        list[str] | None,
+        typer.Argument(
+            help="Dotted keys to read, e.g. DEPLOY_DIR or config.toml.SQLALCHEMY.URI."
+        ),
+    ] = None,
+    stdin: Annotated[
+        bool, typer.Option(help="Also read a JSON list of keys from stdin.")
+    ] = False,
+    strict: Annotated[
+        bool, typer.Option(help="Fail if any key is not found, instead of printing null.")
+    ] = False,
+):
+    """[local] Print the resolved values of many keys in one JSON document, no template file is used."""
+    import json
+
+    from fabik.conf.query import ConfigQuery
+
+    keys = list(key or [])
+    if stdin:
+        keys.extend(_read_stdin_keys())
+    if not keys:
+        echo_error("Please provide at least one key.")
+        raise typer.Abort()
+
+    if global_state.is_multi_env:
+        global_state.load_multi_env_conf_data()
+    else:
+        global_state.load_conf_data()
+    configs = global_state.get_render_configs()
+
+    result: dict[str, dict] = {}
+    try:
+        for env_name, config in configs.items():
+            values, missing = ConfigQuery(config, global_state.cwd).get_many(keys)
+            if missing and strict:
+                echo_error(f"Keys not found in env {env_name!r}: {', '.join(missing)}.")
+                raise typer.Exit(1)
+            result[env_name] = values
+    except FabikError as e:
+        echo_error(e.err_msg)
+        raise typer.Abort()
+
+    # 同时处理多个环境时，以环境名称为键
+    output = result if global_state.is_multi_env else next(iter(result.values()))
+    # TOML 中的日期时间使用 ISO 8601 格式输出
+    typer.echo(
+        json.dumps(
+            output,
+            ensure_ascii=False,
+            default=lambda v: v.isoformat() if hasattr(v, "isoformat") else str(v),
         )
+    )
+
+
+def conf_compile():
+    """[local] Precompile all templates in the local tpl directory into the bytecode cache."""
+    from fabik.conf.processor import get_tpl_bytecode_dir, precompile_templates
+
+    global_state.register_config_validator(config_validator_tpldir)
+    global_state.load_conf_data(check=True)
+    tpl_dir = Path(global_state.fabik_config.TPL_DIR)  # type: ignore
+    cache_dir = get_tpl_bytecode_dir(global_state.cwd)
+    try:
+        names = precompile_templates(tpl_dir, cache_dir)
+    except FabikError as e:
+        echo_error(e.err_msg)
+        raise typer.Abort()
+    for name in names:
+        echo_info(f"编译模板 {name} 成功。")
+    echo_info(f"{len(names)} 个模板的字节码保存在 {cache_dir.as_posix()}。")
@@ -0,0 +1,104 @@
+""".. _fabik_cmd_daemon:
+
+fabik.cmd.daemon
+~~~~~~~~~~~~~~~~~~~~~~
+
+daemon 子命令相关函数
+"""
+
+import typer
+from typing import Annotated
+from pathlib import Path
+
+from fabik.client import DaemonClient, DaemonClientError, get_socket_file
+from fabik.conf import config_validator_tpldir
+from fabik.error import echo_error, echo_info, FabikError
+from fabik.cmd import global_state
+
+
+NoteSocket = Annotated[
+    Path | None,
+    typer.Option(
+        "--socket",
+        help="The Unix socket file, default to daemon.sock in the user cache folder of the working directory.",
+    ),
+]
+
+
+def _get_socket_file(socket_file: Path | None) -> Path:
+    return socket_file or get_socket_file(global_state.fabik_file.getdir())
+
+
+def daemon_serve(
+    socket_file: NoteSocket = None,
+    polling: Annotated[
+        bool, typer.Option(help="Use polling instead of inotify.")
+    ] = False,
+    interval: Annotated[
+        float, typer.Option(help="Polling interval in seconds.")
+    ] = 0.5,
+    debounce: Annotated[
+        float,
+        typer.Option(help="Merge changes within DEBOUNCE seconds into one reload."),
+    ] = 0.2,
+):
+    """[local] Keep the configs and templates in memory, serve JSON-RPC requests on a Unix socket."""
+    from fabik.conf.daemon import DaemonState, serve
+
+    global_state.register_config_validator(config_validator_tpldir)
+    state = DaemonState(
+        global_state.fabik_file,
+        list(global_state._config_validators),
+        use_cache=global_state.use_cache,
+    )
+    socket_file = _get_socket_file(socket_file)
+    try:
+        serve(
+            state,
+            socket_file,
+            polling=polling,
+            interval=interval,
+            debounce=debounce,
+            on_ready=lambda _: echo_info(
+                f"fabik daemon is listening on {socket_file.as_posix()}, press Ctrl+C to stop."
+            ),
+            on_reload=lambda changed: echo_info(
+                f"Reloaded: {', '.join(sorted(p.name for p in changed))}."
+            ),
+        )
+    except FabikError as e:
+        echo_error(e.err_msg)
+        raise typer.Abort()
+    except OSError as e:
+        # 例如 socket 文件的路径太长，或者没有权限创建它
+        echo_error(f"Cannot listen on {socket_file.as_posix()}: {e}")
+        raise typer.Abort()
+    except KeyboardInterrupt:
+        pass
+    echo_info("fabik daemon stopped.")
+
+
+def daemon_status(socket_file: NoteSocket = None):
+    """[local] Show the status of the running fabik daemon."""
+    try:
+        with DaemonClient(_get_socket_file(socket_file), timeout=5) as client:
+            status = client.ping()
+    except DaemonClientError as e:
+        echo_error(e.message)
+        raise typer.Exit(1)
+    echo_info(
+        f"pid: {status['pid']}, uptime: {status['uptime']:.0f}s, "
+        f"requests: {status['requests']}, reloads: {status['reloads']}, "
+        f"envs: {', '.join(e or '(default)' for e in status['envs'])}"
+    )
+
+
+def daemon_stop(socket_file: NoteSocket = None):
+    """[local] Stop the running fabik daemon."""
+    try:
+        with DaemonClient(_get_socket_file(socket_file), timeout=5) as client:
+            client.shutdown()
+    except DaemonClientError as e:
+        echo_error(e.message)
+        raise typer.Exit(1)
+    echo_info("fabik daemon is stopping.")
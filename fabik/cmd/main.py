@@ -10,7 +10,6 @@ from typing import Annotated
 from pathlib import Path
 
 import typer
-import jinja2
 
 import fabik
 from fabik import tpl
@@ -39,6 +38,12 @@ def main_callback(
     verbose: Annotated[
         bool, typer.Option("--verbose", "-v", help="Show more information.")
     ] = False,
+    cache: Annotated[
+        bool,
+        typer.Option(
+            help="Use the config snapshot cache in the user cache folder (~/.cache/fabik), it is rebuilt automatically when the config files change."
+        ),
+    ] = True,
     version: Annotated[
         bool, typer.Option("--version", is_eager=True, help="Show fabik version.")
     ] = False,
@@ -55,6 +60,7 @@ def main_callback(
     try:
         global_state.verbose = verbose
         global_state.env_name = env
+        global_state.use_cache = cache
         global_state.fabik_file = FabikConfigFile.gen_fabik_config_file(
             work_dir=cwd, config_file=config_file
         )
@@ -67,6 +73,8 @@ def main_callback(
             f"{global_state!r}",
             panel_title="main_callback",
         )
+        # 命令结束时输出载入配置文件和创建 ConfigReplacer 的次数
+        ctx.call_on_close(global_state.echo_session_stats)
 
 
 def main_init(
@@ -76,6 +84,9 @@ def main_init(
     force: NoteForce = False,
 ):
     """[local] Initialize fabik project, create fabik.toml and .fabik.env configuration files in the working directory."""
+    # jinja2 仅在生成配置文件时才需要，不影响其他命令的启动
+    import jinja2
+
     # 对于 init 命令，直接使用 global_state.cwd，因为此时可能还没有配置文件
     work_dir: Path = global_state.cwd
 
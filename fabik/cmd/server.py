@@ -6,64 +6,84 @@ fabik.cmd.server
 server 子命令相关函数
 """
 
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 import typer
 
-from fabik.error import echo_error, FabikError
 from fabik.cmd import global_state, DeployClassName
 
+if TYPE_CHECKING:
+    from fabik.deploy import Deploy
 
 
 def server_callback(
     deploy_class: Annotated[
         DeployClassName, typer.Option(help="指定部署类。")
     ] = DeployClassName.GUNICORN,
+    parallel: Annotated[
+        int, typer.Option(min=1, help="同时操作的服务器的最大数量，见 FABRIC.hosts。")
+    ] = 1,
 ):
-    if deploy_class == DeployClassName.GUNICORN:
-        from fabik.deploy.gunicorn import GunicornDeploy as Deploy
+    # 远程部署连接在子命令第一次使用 global_state.deploy_conns 时才创建
+    global_state.deploy_class = deploy_class
+    global_state.parallel = parallel
+    global_state.deploy_conn = None
 
-        global_state.build_deploy_conn(Deploy)
-    elif deploy_class == DeployClassName.uWSGI:
-        from fabik.deploy.uwsgi import UwsgiDeploy as Deploy
 
-        global_state.build_deploy_conn(Deploy)
+def _deploy(d: "Deploy"):
+    d.rsync()
+    d.put_config(force=True)
+
+
+def _dar(d: "Deploy"):
+    _deploy(d)
+    d.reload()
 
 
 def server_deploy():
     """「远程」部署项目到远程服务器。"""
-    global_state.deploy_conn.rsync(
-        exclude=global_state.fabik_config.getcfg("RSYNC_EXCLUDE", [])
-    )  # type: ignore # noqa: F821
-    global_state.deploy_conn.put_config(force=True)  # type: ignore # noqa: F821
+    global_state.run_deploy(_deploy)
 
 
 def server_start():
     """「远程」在服务器上启动项目进程。"""
-    global_state.deploy_conn.start()  # type: ignore # noqa: F821
+    global_state.run_deploy(lambda d: d.start())
 
 
 def server_stop():
     """「远程」在服务器上停止项目进程。"""
-    global_state.deploy_conn.stop()  # type: ignore # noqa: F821
-
-
-def server_reload():
+    global_state.run_deploy(lambda d: d.stop())
+
+
+def _reload_ready(d: "Deploy"):
+    from invoke.exceptions import Exit
+
+    # 在重载之前检查 HEALTH_CHECK，没有提供时不重载这台服务器
+    if not d.get_health_check()["command"]:
+        raise Exit("server reload --rolling 需要 HEALTH_CHECK 判断服务是否就绪。")
+    d.reload()
+    d.wait_ready()
+
+
+def server_reload(
+    rolling: Annotated[
+        bool,
+        typer.Option(help="分批重载：先重载金丝雀服务器，每批服务器就绪之后才重载下一批，失败时停止。"),
+    ] = False,
+    batch_size: Annotated[
+        int, typer.Option(min=1, help="分批重载时每批的服务器数量。")
+    ] = 1,
+    canary: Annotated[
+        int, typer.Option(min=0, help="分批重载时金丝雀批次的服务器数量。")
+    ] = 1,
+):
     """「远程」在服务器上重载项目进程。"""
-    global_state.deploy_conn.reload()  # type: ignore # noqa: F821
+    if rolling:
+        global_state.run_deploy(_reload_ready, batch_size=batch_size, canary=canary)
+    else:
+        global_state.run_deploy(lambda d: d.reload())
 
 
 def server_dar():
     """「远程」在服务器上部署代码，然后执行重载。也就是 deploy and reload 的组合。"""
-    try:
-        global_state.deploy_conn.rsync(
-            exclude=global_state.conf_data.get("RSYNC_EXCLUDE", [])
-        )  # type: ignore # noqa: F821
-        global_state.deploy_conn.put_config(force=True)  # type: ignore # noqa: F821
-        global_state.deploy_conn.reload()  # type: ignore # noqa: F821
-    except FabikError as e:
-        echo_error(e.err_msg)
-        raise typer.Abort()
-    except Exception as e:
-        echo_error(str(e))
-        raise typer.Abort()
+    global_state.run_deploy(_dar)
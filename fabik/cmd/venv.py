@@ -7,23 +7,25 @@ venv 子命令相关函数
 """
 
 import typer
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 from fabik.error import echo_error
 from fabik.cmd import global_state, NoteRequirementsFileName
 
+if TYPE_CHECKING:
+    from fabik.deploy import Deploy
+
 
 def venv_init(
     requirements_file_name: NoteRequirementsFileName = "requirements.txt",
 ):
     """「远程」部署远程服务器的虚拟环境。"""
-    try:
-        rsync_exclude = global_state.conf_data.get("RSYNC_EXCLUDE", [])
-        global_state.deploy_conn.rsync(exclude=rsync_exclude)
-        global_state.deploy_conn.init_remote_venv(requirements_file_name)
-    except Exception as e:
-        echo_error(f"初始化虚拟环境失败: {str(e)}")
-        raise typer.Abort()
+
+    def init(d: "Deploy"):
+        d.rsync()
+        d.init_remote_venv(requirements_file_name)
+
+    global_state.run_deploy(init, title="初始化虚拟环境失败")
 
 
 def venv_update(
@@ -33,19 +35,15 @@ def venv_update(
     all: Annotated[bool, typer.Option(help="更新所有 pip 包。")] = False,
 ):
     """「远程」部署远程服务器的虚拟环境。"""
-    try:
-        if all:
-            global_state.deploy_conn.pipupgrade(all=True)
-        elif name is not None and len(name) > 0:
-            global_state.deploy_conn.pipupgrade(names=name)
-        else:
-            echo_error("请提供希望更新的 pip 包名称。")
-            raise typer.Abort()
-    except Exception as e:
-        echo_error(f"更新 pip 包失败: {str(e)}")
+    if all:
+        global_state.run_deploy(lambda d: d.pipupgrade(all=True), title="更新 pip 包失败")
+    elif name is not None and len(name) > 0:
+        global_state.run_deploy(lambda d: d.pipupgrade(names=name), title="更新 pip 包失败")
+    else:
+        echo_error("请提供希望更新的 pip 包名称。")
         raise typer.Abort()
 
 
 def venv_outdated():
     """「远程」打印所有的过期的 python package。"""
-    global_state.deploy_conn.pipoutdated()  # type: ignore # noqa: F821
+    global_state.run_deploy(lambda d: d.pipoutdated())
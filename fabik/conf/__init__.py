@@ -8,6 +8,8 @@ fabik.conf
 
 __all__ = [
     "merge_dict",
+    "LayeredView",
+    "materialize",
     "config_validator_tpldir",
     "config_validator_name_workdir",
     "FabikConfig",
@@ -18,6 +20,8 @@ __all__ = [
     "ConfigReplacer",
 ]
 
+from typing import TYPE_CHECKING, Any
+
 
 def merge_dict(x: dict, y: dict, z: dict | None = None) -> dict:
     """合并 x 和 y 两个 dict。
@@ -64,6 +68,7 @@ def merge_dict(x: dict, y: dict, z: dict | None = None) -> dict:
     return z
 
 
+from .view import LayeredView, materialize
 from .storage import (
     FabikConfig,
     FabikConfigFile,
@@ -72,4 +77,15 @@ from .storage import (
     config_validator_tpldir,
     config_validator_name_workdir,
 )
-from .processor import ConfigWriter, ConfigReplacer
+
+if TYPE_CHECKING:
+    from .processor import ConfigWriter, ConfigReplacer
+
+
+def __getattr__(name: str) -> Any:
+    # processor 依赖 jinja2，仅在需要渲染时才载入，conf get 等命令不会载入它
+    if name in ("ConfigWriter", "ConfigReplacer"):
+        from . import processor
+
+        return getattr(processor, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,207 @@
+""".._fabik_conf_batch:
+
+fabik.conf.batch
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+在一个进程池中批量渲染配置文件。
+
+所有的 FabikConfig 只在主进程中解析一次，通过进程池的 initializer 传递到每个子进程。
+每个子进程中，相同环境和输出参数的任务共享一个 ConfigReplacer。
+子进程的输出被收集起来，由主进程按照任务的顺序输出，保证输出顺序稳定。
+
+矩阵模式下，同一个模板为配置中的列表的每一项渲染一次，见 :func:`get_matrix_items` 。
+"""
+
+import os
+import time
+import traceback
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from fabik.conf.manifest import WriteStatus
+from fabik.conf.storage import FabikConfig, resolve_key_path, split_key_path
+from fabik.error import ConfigError, FabikError, capture_echo
+
+if TYPE_CHECKING:
+    from fabik.conf.processor import ConfigReplacer
+
+
+@dataclass
+class RenderJob:
+    """一个渲染任务，对应一个环境中的一个输出文件。"""
+
+    env_name: str
+    tpl_name: str
+    tpl_dir: Path | None = None
+    output_dir: Path | None = None
+    output_file: Path | None = None
+    target_postfix: str = ""
+    force: bool = False
+    rename: bool = False
+    variant: str = ""
+    """ 矩阵模式下列表项的名称，同一个模板的多个输出文件使用它区分。"""
+    extra: dict[str, Any] | None = None
+    """ 渲染时额外提供给模板的变量，例如矩阵模式下的列表项。"""
+
+    @property
+    def name(self) -> str:
+        """任务的名称，在同一批任务中唯一。"""
+        name = f"{self.tpl_name}[{self.variant}]" if self.variant else self.tpl_name
+        return f"{name}@{self.env_name}" if self.env_name else name
+
+
+def get_matrix_items(
+    replace_obj: Mapping, key: str, name_field: str | None = None
+) -> list[tuple[str, Any]]:
+    """返回替换值中 key 对应的列表的每一项，以及用于输出文件名的名称。
+
+    :param key: 列表在替换值中的路径，使用点号分隔，例如 ``REGIONALS`` 。
+    :param name_field: 使用列表项中这个字段的值作为名称。
+        不提供时，字符串和数字类型的列表项使用它自身作为名称，其他类型使用序号。
+    :return: [(名称, 列表项)]
+    """
+    items: Any = replace_obj
+    for k in resolve_key_path(replace_obj, split_key_path(key)):
+        items = items.get(k) if isinstance(items, Mapping) else None
+    if not isinstance(items, list):
+        raise ConfigError(err_type=TypeError(), err_msg=f"Matrix key {key} must be a list.")
+
+    result: list[tuple[str, Any]] = []
+    for i, item in enumerate(items):
+        if name_field is not None:
+            if not isinstance(item, Mapping) or item.get(name_field) is None:
+                raise ConfigError(
+                    err_type=KeyError(),
+                    err_msg=f"Item {i} of {key} has no field {name_field}.",
+                )
+            name = str(item[name_field])
+        elif isinstance(item, (str, int)) and not isinstance(item, bool):
+            name = str(item)
+        else:
+            name = str(i)
+        if not name or "/" in name or name in (".", ".."):
+            raise ConfigError(
+                err_type=ValueError(),
+                err_msg=f"Item {i} of {key} has an invalid name {name!r}.",
+            )
+        if any(name == n for n, _ in result):
+            raise ConfigError(
+                err_type=ValueError(),
+                err_msg=f"Item {i} of {key} has a duplicated name {name!r}.",
+            )
+        result.append((name, item))
+    return result
+
+
+@dataclass
+class RenderResult:
+    """渲染任务的结果。"""
+
+    job: RenderJob
+    target: Path | None = None
+    status: WriteStatus | None = None
+    output: str = ""
+    """ 渲染过程中 echo 的输出。"""
+    error: str | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class _WorkerState:
+    configs: dict[str, FabikConfig] = {}
+    work_dir: Path
+    verbose: bool = False
+    replacers: dict[tuple, "ConfigReplacer"] = {}
+
+
+def _init_worker(configs: dict[str, FabikConfig], work_dir: Path, verbose: bool):
+    _WorkerState.configs = configs
+    _WorkerState.work_dir = work_dir
+    _WorkerState.verbose = verbose
+    _WorkerState.replacers = {}
+
+
+def _get_replacer(job: RenderJob) -> "ConfigReplacer":
+    key = (job.env_name, job.output_dir, job.tpl_dir)
+    replacer = _WorkerState.replacers.get(key)
+    if replacer is None:
+        from fabik.conf.processor import ConfigReplacer
+
+        replacer = ConfigReplacer(
+            _WorkerState.configs[job.env_name],
+            _WorkerState.work_dir,
+            output_dir=job.output_dir,
+            tpl_dir=job.tpl_dir,
+            verbose=_WorkerState.verbose,
+        )
+        _WorkerState.replacers[key] = replacer
+    return replacer
+
+
+def _render(job: RenderJob) -> tuple[Path, WriteStatus | None]:
+    replacer = _get_replacer(job)
+    _, final_target = replacer.set_writer(
+        job.tpl_name,
+        force=job.force,
+        rename=job.rename,
+        target_postfix=job.target_postfix,
+        output_file=job.output_file,
+        immediately=True,
+        extra=job.extra,
+    )
+    return final_target, replacer.writer.status if replacer.writer else None
+
+
+def _run_job(job: RenderJob, capture: bool = True) -> RenderResult:
+    result = RenderResult(job)
+    start = time.perf_counter()
+    try:
+        if capture:
+            with capture_echo() as buffer:
+                try:
+                    result.target, result.status = _render(job)
+                finally:
+                    result.output = buffer.getvalue()
+        else:
+            result.target, result.status = _render(job)
+    except FabikError as e:
+        result.error = e.err_msg
+    except Exception as e:
+        result.error = str(e) or traceback.format_exc()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def render_jobs(
+    configs: dict[str, FabikConfig],
+    jobs: list[RenderJob],
+    work_dir: Path,
+    *,
+    max_workers: int | None = None,
+    verbose: bool = False,
+) -> list[RenderResult]:
+    """并发执行渲染任务，返回的结果与 jobs 的顺序一致。
+
+    :param configs: 环境名称和 FabikConfig 的对应关系。
+    :param max_workers: 进程数量，默认为 CPU 数量。值为 1 或者仅有一个任务时，直接在当前进程中执行。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(jobs)))
+
+    if max_workers == 1:
+        _init_worker(configs, work_dir, verbose)
+        return [_run_job(job, capture=False) for job in jobs]
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(configs, work_dir, verbose),
+    ) as executor:
+        return list(executor.map(_run_job, jobs))
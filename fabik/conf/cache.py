@@ -0,0 +1,162 @@
+""".._fabik_conf_cache:
+
+fabik.conf.cache
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+fabik 配置文件的磁盘快照缓存。
+
+快照以源文件的 mtime/size/hash 作为键，源文件未改变时，
+使用一次 pickle 反序列化替代 TOML 的解析。
+
+缓存保存在当前用户的缓存文件夹中（见 :func:`fabik.tpl.get_cache_dir` ），
+文件夹的权限为 0700，仅读取当前用户拥有的快照文件。
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any
+
+import fabik
+from fabik.tpl import get_cache_dir, get_cache_home
+
+__all__ = [
+    "SNAPSHOT_SUFFIX",
+    "ConfigSnapshot",
+    "file_hash",
+    "file_signature",
+    "get_cache_dir",
+    "make_cache_dir",
+]
+
+SNAPSHOT_SUFFIX: str = ".snapshot"
+""" 配置快照文件的后缀，快照文件保存在 get_cache_dir 返回的文件夹中。"""
+
+
+def file_signature(p: Path) -> tuple[int, int]:
+    """获取文件的 (mtime_ns, size)，文件不存在时返回 (0, -1)。"""
+    try:
+        st = p.stat()
+    except FileNotFoundError:
+        return (0, -1)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def file_hash(p: Path) -> str:
+    """计算文件内容的 sha256，文件不存在时返回空字符串。"""
+    try:
+        return hashlib.sha256(p.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def make_cache_dir(cache_dir: Path) -> Path:
+    """创建缓存文件夹，权限为 0700。
+
+    cache_dir 位于用户缓存文件夹中时，同时确保用户缓存文件夹的权限为 0700。
+    """
+    home = get_cache_home()
+    if cache_dir.is_relative_to(home):
+        home.mkdir(parents=True, exist_ok=True, mode=0o700)
+        if home.stat().st_mode & 0o077:
+            home.chmod(0o700)
+    cache_dir.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return cache_dir
+
+
+class ConfigSnapshot:
+    """将解析后的配置数据保存到磁盘，源文件改变时自动失效。
+
+    快照中记录每个源文件的 ``(mtime_ns, size, sha256)``。
+    读取时先比较 mtime 和 size，二者一致时直接信任快照；
+    不一致时再比较 hash，内容未变（例如仅执行了 touch）则刷新快照中的签名。
+    """
+
+    snapshot_file: Path
+    """ 快照文件路径。"""
+
+    sources: list[Path]
+    """ 快照依赖的源文件。"""
+
+    def __init__(self, snapshot_file: Path, sources: list[Path]):
+        self.snapshot_file = snapshot_file
+        self.sources = sources
+
+    def _read(self) -> dict | None:
+        try:
+            with self.snapshot_file.open("rb") as f:
+                # 不读取其他用户写入的快照
+                if hasattr(os, "getuid") and os.fstat(f.fileno()).st_uid != os.getuid():
+                    return None
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return None
+        if (
+            not isinstance(snapshot, dict)
+            or snapshot.get("version") != fabik.__version__
+        ):
+            return None
+        return snapshot
+
+    def _write(self, snapshot: dict) -> None:
+        """原子地写入快照，写入失败（例如只读文件夹）时静默忽略。"""
+        tmp_file = self.snapshot_file.with_name(
+            f"{self.snapshot_file.name}.{os.getpid()}.tmp"
+        )
+        try:
+            make_cache_dir(self.snapshot_file.parent)
+            with tmp_file.open("wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.snapshot_file)
+        except OSError:
+            tmp_file.unlink(missing_ok=True)
+
+    def load(self) -> Any:
+        """返回快照中保存的数据，快照不存在或已经失效时返回 None。"""
+        snapshot = self._read()
+        if snapshot is None:
+            return None
+        signatures: dict[str, tuple[int, int, str]] = snapshot.get("sources", {})
+        if sorted(signatures) != sorted(p.as_posix() for p in self.sources):
+            return None
+
+        refreshed = False
+        for p in self.sources:
+            mtime_ns, size, digest = signatures[p.as_posix()]
+            current = file_signature(p)
+            if current == (mtime_ns, size):
+                continue
+            # mtime 或 size 改变，比较内容是否真的改变
+            if current[1] != size or file_hash(p) != digest:
+                return None
+            signatures[p.as_posix()] = (*current, digest)
+            refreshed = True
+
+        if refreshed:
+            self._write(snapshot)
+        return snapshot.get("data")
+
+    def collect_signatures(self) -> dict[str, tuple[int, int, str]]:
+        """获取所有源文件当前的签名。
+
+        应该在解析源文件之前调用，避免解析期间文件改变导致快照记录了错误的签名。
+        """
+        return {p.as_posix(): (*file_signature(p), file_hash(p)) for p in self.sources}
+
+    def save(
+        self, data: Any, signatures: dict[str, tuple[int, int, str]] | None = None
+    ) -> None:
+        """保存数据，同时记录所有源文件的签名。
+
+        :param signatures: 解析前调用 collect_signatures 获取的签名，不提供则立即获取。
+        """
+        if signatures is None:
+            signatures = self.collect_signatures()
+        self._write(
+            {"version": fabik.__version__, "sources": signatures, "data": data}
+        )
+
+    def clear(self) -> None:
+        """删除快照文件。"""
+        self.snapshot_file.unlink(missing_ok=True)
@@ -0,0 +1,195 @@
+""".._fabik_conf_check:
+
+fabik.conf.check
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+在一个进程池中并发检查多个环境的配置。
+
+每个环境在一个子进程中执行所有的配置验证器，并在内存中渲染（不写入文件）所有的输出表和模板。
+与 ``load_conf_data(check=True)`` 不同，检查不会在第一个错误处停止，所有的错误和耗时被一次性返回。
+"""
+
+import os
+import time
+import traceback
+from collections.abc import Callable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+
+import jinja2
+import typer
+from rich.text import Text
+
+from fabik.conf.storage import FabikConfig
+from fabik.error import FabikError, capture_echo
+
+
+class CheckKind(StrEnum):
+    VALIDATOR = "validator"
+    """ 使用 GlobalState.register_config_validator 注册的验证器。"""
+    TABLE = "table"
+    """ 没有模板的输出表，与 conf make 相同的方式渲染。"""
+    TEMPLATE = "template"
+    """ 有同名模板的输出表，与 conf tpl 相同的方式渲染。"""
+    PARTIAL = "partial"
+    """ 没有同名输出表的模板（例如被 include 的模板），仅编译。"""
+
+
+@dataclass
+class CheckItem:
+    """一个环境中的一项检查的结果。"""
+
+    env_name: str
+    kind: CheckKind
+    name: str
+    error: str | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def get_output_tables(config: FabikConfig) -> list[str]:
+    """返回配置根中的输出表名称。
+
+    值为表并且名称不是全大写的键被视为输出表（例如 ``config.toml`` ），
+    ``ENV`` 、 ``FABRIC`` 、 ``PATH`` 等全大写的键是 fabik 的设置。
+    """
+    return [
+        k
+        for k, v in config.root_data.items()
+        if isinstance(v, Mapping) and not k.isupper()
+    ]
+
+
+def get_template_names(tpl_dir: Path) -> list[str]:
+    """返回 tpl_dir 中所有的模板名称（相对路径，不含 jinja2 后缀）。"""
+    if not tpl_dir.is_dir():
+        return []
+    return sorted(
+        p.relative_to(tpl_dir).as_posix()[:-7] for p in tpl_dir.rglob("*.jinja2")
+    )
+
+
+class _WorkerState:
+    configs: dict[str, FabikConfig] = {}
+    work_dir: Path
+    validators: list[Callable] = []
+    names: list[str] | None = None
+
+
+def _init_worker(
+    configs: dict[str, FabikConfig],
+    work_dir: Path,
+    validators: list[Callable],
+    names: list[str] | None,
+):
+    _WorkerState.configs = configs
+    _WorkerState.work_dir = work_dir
+    _WorkerState.validators = validators
+    _WorkerState.names = names
+
+
+def _run_item(item: CheckItem, func: Callable[[], object]) -> CheckItem:
+    """执行一项检查，记录错误和耗时。验证器通过 echo 输出的错误信息作为检查的错误。"""
+    start = time.perf_counter()
+    with capture_echo() as buffer:
+        try:
+            if func() is False:
+                item.error = "validation failed"
+        except FabikError as e:
+            item.error = e.err_msg
+        except (typer.Abort, typer.Exit):
+            item.error = "validation failed"
+        except jinja2.TemplateError as e:
+            item.error = f"{e.__class__.__name__}: {e!s}"
+        except Exception as e:
+            item.error = str(e) or traceback.format_exc()
+        output = Text.from_ansi(buffer.getvalue()).plain.strip()
+    if item.error is not None and output:
+        item.error = f"{item.error}: {output}"
+    item.elapsed = time.perf_counter() - start
+    return item
+
+
+def _check_env(env_name: str) -> list[CheckItem]:
+    from fabik.conf.processor import (
+        ConfigReplacer,
+        get_tpl_bytecode_dir,
+        get_tpl_env,
+    )
+
+    config = _WorkerState.configs[env_name]
+    work_dir = _WorkerState.work_dir
+    items: list[CheckItem] = []
+    for validator in _WorkerState.validators:
+        name = getattr(validator, "__name__", repr(validator))
+        item = CheckItem(env_name, CheckKind.VALIDATOR, name)
+        items.append(_run_item(item, lambda v=validator: v(config)))
+
+    tpl_dir_value = config.path("TPL_DIR")
+    tpl_dir = Path(tpl_dir_value) if tpl_dir_value else None
+    tpl_names = get_template_names(tpl_dir) if tpl_dir is not None else []
+    tables = get_output_tables(config)
+    names = _WorkerState.names
+
+    def render(table: str, use_tpl: bool) -> None:
+        replacer = ConfigReplacer(
+            config, work_dir, tpl_dir=tpl_dir if use_tpl else None
+        )
+        replacer.set_writer(table)
+        for _ in replacer.writer.generate():  # type: ignore
+            pass
+
+    for table in tables:
+        if names is not None and table not in names:
+            continue
+        use_tpl = table in tpl_names
+        item = CheckItem(
+            env_name, CheckKind.TEMPLATE if use_tpl else CheckKind.TABLE, table
+        )
+        items.append(_run_item(item, lambda t=table, u=use_tpl: render(t, u)))
+
+    if tpl_dir is not None:
+        tpl_env = get_tpl_env(tpl_dir, get_tpl_bytecode_dir(work_dir))
+        for tpl_name in tpl_names:
+            if tpl_name in tables or (names is not None and tpl_name not in names):
+                continue
+            item = CheckItem(env_name, CheckKind.PARTIAL, tpl_name)
+            items.append(
+                _run_item(item, lambda n=tpl_name: tpl_env.get_template(f"{n}.jinja2"))
+            )
+    return items
+
+
+def check_configs(
+    configs: dict[str, FabikConfig],
+    work_dir: Path,
+    validators: list[Callable],
+    *,
+    names: list[str] | None = None,
+    max_workers: int | None = None,
+) -> list[CheckItem]:
+    """并发检查每个环境的配置，返回的结果按照 configs 的顺序排列。
+
+    :param validators: 配置验证器，接受 FabikConfig，返回 False 或者抛出异常表示验证失败。
+        使用进程池时，验证器必须是可以被 pickle 的模块级函数。
+    :param names: 仅检查这些输出表和模板，默认检查所有的输出表和模板。
+    :param max_workers: 进程数量，默认为 CPU 数量。值为 1 或者仅有一个环境时，直接在当前进程中执行。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(configs)))
+    initargs = (configs, work_dir, validators, names)
+
+    if max_workers == 1:
+        _init_worker(*initargs)
+        return [item for env_name in configs for item in _check_env(env_name)]
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=initargs
+    ) as executor:
+        return [item for items in executor.map(_check_env, configs) for item in items]
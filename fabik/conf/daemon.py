@@ -0,0 +1,403 @@
+""".._fabik_conf_daemon:
+
+fabik.conf.daemon
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+在一个常驻进程中保持解析后的配置、编译后的模板和 ConfigReplacer，
+通过本地 Unix socket 提供 JSON-RPC 2.0 服务，见 :ref:`fabik_daemon` 。
+
+每个连接中可以发送多个请求，每个请求和响应都是一行 JSON。
+配置文件改变时重新解析配置，模板文件改变时 jinja2 会自动重新编译这个模板。
+
+客户端见 :mod:`fabik.client` ，它仅依赖标准库。
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+import fabik
+from fabik.client import get_socket_file
+from fabik.conf.cache import make_cache_dir
+from fabik.conf.check import check_configs
+from fabik.conf.processor import ConfigReplacer
+from fabik.conf.query import ConfigQuery
+from fabik.conf.storage import FabikConfig, FabikConfigFile
+from fabik.error import ConfigError, FabikError, capture_echo
+from fabik.util.watch import create_watcher
+
+
+# JSON-RPC 2.0 的错误码
+PARSE_ERROR: int = -32700
+INVALID_REQUEST: int = -32600
+METHOD_NOT_FOUND: int = -32601
+INVALID_PARAMS: int = -32602
+INTERNAL_ERROR: int = -32603
+FABIK_ERROR: int = -32000
+""" 配置或者模板错误，message 为 FabikError.err_msg。"""
+
+
+class RpcError(Exception):
+    """返回给客户端的 JSON-RPC 错误。"""
+
+    code: int
+    message: str
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class DaemonState:
+    """常驻进程中的配置状态。所有的方法都需要在持有 lock 时调用。
+
+    :param fabik_file: 配置文件。
+    :param validators: validate 使用的配置验证器。
+    """
+
+    fabik_file: FabikConfigFile
+    work_dir: Path
+    validators: list[Callable]
+    use_cache: bool = True
+
+    lock: threading.RLock
+    configs: dict[str, FabikConfig]
+    """ 环境名称 -> 已经载入的配置，不使用环境时键名为空字符串。"""
+
+    replacers: dict[tuple[str, Path | None], ConfigReplacer]
+    """ (环境名称, 模板文件夹) -> ConfigReplacer。"""
+
+    started: float
+    requests: int = 0
+    reloads: int = 0
+
+    def __init__(
+        self,
+        fabik_file: FabikConfigFile,
+        validators: list[Callable] | None = None,
+        *,
+        use_cache: bool = True,
+    ):
+        self.fabik_file = fabik_file
+        self.work_dir = fabik_file.getdir()
+        self.validators = validators or []
+        self.use_cache = use_cache
+        self.lock = threading.RLock()
+        self.configs = {}
+        self.replacers = {}
+        self.started = time.time()
+
+    def get_config(self, env: str = "") -> FabikConfig:
+        config = self.configs.get(env)
+        if config is None:
+            config = self.fabik_file.load_config(env, use_cache=self.use_cache)
+            config.check_env_name()
+            self.configs[env] = config
+        return config
+
+    def get_env_names(self, envs: list[str] | None) -> list[str]:
+        """envs 为 None 时返回 ENV 中的所有环境，没有定义 ENV 时仅返回空字符串（不使用环境）。"""
+        if envs is not None:
+            return envs
+        env_names = self.get_config("").envs
+        return list(env_names) if env_names else [""]
+
+    def get_tpl_dir(self, config: FabikConfig, name: str) -> Path | None:
+        """name 有同名模板时返回模板文件夹，否则返回 None（与 conf make 相同的方式渲染）。"""
+        tpl_dir = config.TPL_DIR
+        if tpl_dir and Path(tpl_dir, f"{name}.jinja2").is_file():
+            return Path(tpl_dir)
+        return None
+
+    def get_replacer(self, env: str, tpl_dir: Path | None) -> ConfigReplacer:
+        key = (env, tpl_dir)
+        replacer = self.replacers.get(key)
+        if replacer is None:
+            replacer = ConfigReplacer(self.get_config(env), self.work_dir, tpl_dir=tpl_dir)
+            self.replacers[key] = replacer
+        return replacer
+
+    @property
+    def watch_files(self) -> list[Path]:
+        files = [self.fabik_file.fabik_toml, self.fabik_file.fabik_env]
+        for config in self.configs.values():
+            files.extend(p for p in config.include_files if p not in files)
+            break
+        return files
+
+    @property
+    def watch_dirs(self) -> list[Path]:
+        dirs: list[Path] = []
+        for config in self.configs.values():
+            tpl_dir = config.TPL_DIR
+            if tpl_dir and Path(tpl_dir).is_dir() and Path(tpl_dir) not in dirs:
+                dirs.append(Path(tpl_dir))
+        return dirs
+
+    def reload(self) -> None:
+        """重新解析配置，已经载入的环境被立即载入，其他环境在第一次使用时载入。"""
+        env_names = list(self.configs)
+        self.configs = {}
+        self.replacers = {}
+        self.reloads += 1
+        for env in env_names:
+            try:
+                self.get_config(env)
+            except FabikError:
+                # 环境可能已经被删除，或者配置有错误，在使用时再报告错误
+                pass
+
+    def handle_changes(self, changed: set[Path]) -> bool:
+        """处理改变的文件，配置文件改变时重新载入配置，返回是否重新载入。
+
+        模板文件改变时 jinja2 会在下一次渲染时自动重新编译，无需处理。
+        """
+        config_files = {p.absolute() for p in self.watch_files}
+        if {Path(p).absolute() for p in changed} & config_files:
+            self.reload()
+            return True
+        return False
+
+    # ==============================================
+    # RPC 方法
+    # ==============================================
+
+    def rpc_ping(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "version": fabik.__version__,
+            "work_dir": self.work_dir.as_posix(),
+            "uptime": time.time() - self.started,
+            "requests": self.requests,
+            "reloads": self.reloads,
+            "envs": list(self.configs),
+        }
+
+    def rpc_query(self, keys: list[str], env: str = "") -> dict:
+        """与 conf get 相同，返回 ``{"values": {键: 值}, "missing": [找不到的键]}`` 。"""
+        values, missing = ConfigQuery(self.get_config(env), self.work_dir).get_many(keys)
+        return {"values": values, "missing": missing}
+
+    def rpc_render(self, names: list[str], env: str = "", write: bool = False) -> list[dict]:
+        """渲染配置文件，有同名模板时与 conf tpl 相同，否则与 conf make 相同。
+
+        :param write: 为 False 时仅返回渲染的内容，为 True 时写入文件并返回写入的结果。
+        """
+        results = []
+        for name in names:
+            result: dict[str, Any] = {"name": name, "env": env, "error": None}
+            try:
+                config = self.get_config(env)
+                replacer = self.get_replacer(env, self.get_tpl_dir(config, name))
+                with capture_echo():
+                    _, target = replacer.set_writer(name, immediately=write)
+                writer = replacer.writer
+                result["target"] = target.as_posix()
+                if write:
+                    result["status"] = writer.status.value if writer.status else None  # type: ignore
+                else:
+                    result["content"] = writer._render().decode()  # type: ignore
+            except FabikError as e:
+                result["error"] = e.err_msg
+            results.append(result)
+        return results
+
+    def rpc_validate(
+        self, envs: list[str] | None = None, names: list[str] | None = None
+    ) -> list[dict]:
+        """与 conf check 相同，在常驻进程中执行，返回所有检查项。"""
+        configs = {env: self.get_config(env) for env in self.get_env_names(envs)}
+        items = check_configs(
+            configs, self.work_dir, self.validators, names=names, max_workers=1
+        )
+        return [{**asdict(item), "ok": item.ok} for item in items]
+
+    def rpc_reload(self) -> dict:
+        self.reload()
+        return self.rpc_ping()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """每个连接在一个线程中处理，请求在 DaemonState.lock 中串行执行。"""
+
+    daemon_threads = True
+    state: DaemonState
+    socket_file: Path
+
+    def __init__(self, socket_file: Path, state: DaemonState):
+        self.state = state
+        self.socket_file = socket_file
+        _remove_stale_socket(socket_file)
+        make_cache_dir(socket_file.parent)
+        # 仅允许当前用户连接：socket 文件在 bind 时就以 0600 创建，而不是创建之后再修改权限。
+        # 此时还没有启动其他线程，可以临时修改进程的 umask
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_file.as_posix(), _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def call(self, method: str, params: Any) -> Any:
+        func = getattr(self.state, f"rpc_{method}", None)
+        if method == "shutdown":
+            # shutdown 会等待 serve_forever 退出，不能在处理请求的线程中直接调用
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return None
+        if func is None:
+            raise RpcError(METHOD_NOT_FOUND, f"Method {method!r} not found.")
+        with self.state.lock:
+            self.state.requests += 1
+            try:
+                if isinstance(params, dict):
+                    return func(**params)
+                return func(*params)
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e))
+            except FabikError as e:
+                raise RpcError(FABIK_ERROR, e.err_msg)
+
+    def dispatch(self, line: bytes) -> dict | None:
+        """处理一行请求，返回响应。请求是通知（没有 id）时返回 None。"""
+        req_id = None
+        notification = False
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                raise RpcError(PARSE_ERROR, f"Parse error: {e}")
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                raise RpcError(INVALID_REQUEST, "Invalid request.")
+            req_id = request.get("id")
+            notification = "id" not in request
+            params = request.get("params", {})
+            if not isinstance(params, (dict, list)):
+                raise RpcError(INVALID_REQUEST, "params must be an object or an array.")
+            result = self.call(request["method"], params)
+            response = {"jsonrpc": "2.0", "id": req_id, "result": result}
+        except RpcError as e:
+            error = {"code": e.code, "message": e.message}
+            response = {"jsonrpc": "2.0", "id": req_id, "error": error}
+        except Exception as e:
+            error = {"code": INTERNAL_ERROR, "message": f"{e.__class__.__name__}: {e}"}
+            response = {"jsonrpc": "2.0", "id": req_id, "error": error}
+        return None if notification else response
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.socket_file.unlink(missing_ok=True)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: DaemonServer
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.dispatch(line)
+            if response is not None:
+                data = json.dumps(response, ensure_ascii=False, default=_json_default)
+                self.wfile.write(data.encode() + b"\n")
+                self.wfile.flush()
+
+
+def _json_default(value: Any) -> Any:
+    # TOML 中的日期时间使用 ISO 8601 格式输出
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _remove_stale_socket(socket_file: Path) -> None:
+    """删除之前的进程遗留的 socket 文件，已经有进程在监听时抛出 ConfigError。"""
+    if not socket_file.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_file.as_posix())
+        except OSError:
+            socket_file.unlink(missing_ok=True)
+            return
+    raise ConfigError(
+        err_type=FileExistsError(),
+        err_msg=f"A daemon is already listening on {socket_file.as_posix()}.",
+    )
+
+
+def _watch(
+    server: DaemonServer,
+    stop: threading.Event,
+    *,
+    polling: bool,
+    interval: float,
+    debounce: float,
+    on_reload: Callable[[set[Path]], None] | None,
+) -> None:
+    state = server.state
+    while not stop.is_set():
+        with state.lock:
+            files, dirs = state.watch_files, state.watch_dirs
+        with create_watcher(files, dirs, polling=polling, interval=interval) as watcher:
+            while not stop.is_set():
+                changed = watcher.wait(0.5)
+                if not changed:
+                    continue
+                while more := watcher.wait(debounce):
+                    changed |= more
+                with state.lock:
+                    reloaded = state.handle_changes(changed)
+                    new_files = (state.watch_files, state.watch_dirs)
+                if reloaded and on_reload is not None:
+                    on_reload(changed)
+                # INCLUDE 中的片段文件或者 TPL_DIR 改变时，重新创建监控器
+                if new_files != (files, dirs):
+                    break
+
+
+def serve(
+    state: DaemonState,
+    socket_file: Path | None = None,
+    *,
+    polling: bool = False,
+    interval: float = 0.5,
+    debounce: float = 0.2,
+    on_ready: Callable[[DaemonServer], None] | None = None,
+    on_reload: Callable[[set[Path]], None] | None = None,
+) -> None:
+    """在当前线程中提供服务，直到客户端调用 shutdown 或者 KeyboardInterrupt。
+
+    :param socket_file: 默认为工作文件夹的缓存文件夹中的 ``daemon.sock`` 。
+    :param on_ready: 开始监听之后调用。
+    :param on_reload: 配置文件改变并重新载入之后调用。
+    """
+    if socket_file is None:
+        socket_file = get_socket_file(state.work_dir)
+    with state.lock:
+        # 启动时载入默认环境，配置错误时不启动
+        state.get_config("")
+    server = DaemonServer(socket_file, state)
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=_watch,
+        args=(server, stop),
+        kwargs=dict(
+            polling=polling, interval=interval, debounce=debounce, on_reload=on_reload
+        ),
+        daemon=True,
+    )
+    watcher.start()
+    try:
+        if on_ready is not None:
+            on_ready(server)
+        server.serve_forever()
+    finally:
+        stop.set()
+        server.server_close()
@@ -0,0 +1,385 @@
+""".._fabik_conf_deps:
+
+fabik.conf.deps
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+输出文件的依赖图。
+
+记录每个输出文件读取了哪些配置路径和模板文件，用于回答「键 X 改变时，需要重新渲染哪些输出文件」。
+
+- 模板中直接引用的顶层变量使用 ``jinja2.meta`` 静态分析获得。
+- 嵌套的值使用 TrackingDict 在渲染时记录实际读取的键。
+- 配置值中的占位符（例如 ``{{ DEPLOY_DIR }}``）引用的 ROOT META 和 REPLACE_ENVIRON 也被记录下来。
+
+配置路径是 fabik.toml 中的键名组成的元组，例如 ``('gunicorn.conf.py', 'bind')`` 。
+``ENV.<env>`` 中的值与根中的同名值使用相同的路径，依赖图按照环境分别保存。
+"""
+
+import functools
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import jinja2
+from jinja2 import meta
+
+from fabik.conf.cache import ConfigSnapshot, SNAPSHOT_SUFFIX
+from fabik.conf.storage import FabikConfig
+
+
+ROOT_META_KEYS: tuple[str, ...] = ("NAME", "WORK_DIR", "DEPLOY_DIR", "TPL_DIR", "ENV_NAME")
+""" ConfigReplacer._fill_root_meta 填充的变量，它们总是来自配置的根。"""
+
+REPLACE_ENVIRON_KEY: str = "REPLACE_ENVIRON"
+
+DEPS_SNAPSHOT_NAME: str = "deps"
+""" 依赖图缓存的名称，保存在 get_cache_dir 返回的文件夹中。"""
+
+KeyPath = tuple[str, ...]
+
+_parse_env = jinja2.Environment()
+
+
+@functools.lru_cache(maxsize=4096)
+def find_value_refs(value: str) -> frozenset[str]:
+    """返回配置值中的占位符引用的变量名称。"""
+    try:
+        return frozenset(meta.find_undeclared_variables(_parse_env.parse(value)))
+    except jinja2.TemplateError:
+        return frozenset()
+
+
+class AccessTracker:
+    """记录 ConfigReplacer 生成的替换值在渲染过程中被读取的路径。"""
+
+    paths: set[KeyPath]
+    """ 被读取的路径，相对于替换值的根。"""
+
+    value_refs: dict[KeyPath, set[str]]
+    """ 包含占位符的值的路径 -> 占位符引用的变量。"""
+
+    tracked_names: set[str]
+    """ 使用 TrackingDict 记录读取路径的顶层变量。"""
+
+    def __init__(self):
+        self.paths = set()
+        self.value_refs = {}
+        self.tracked_names = set()
+
+    def record(self, path: KeyPath) -> None:
+        self.paths.add(path)
+
+    def add_value_refs(self, path: KeyPath, value: str) -> None:
+        refs = find_value_refs(value)
+        if refs:
+            self.value_refs.setdefault(path, set()).update(refs)
+
+    def wrap(self, obj: dict) -> dict:
+        """将 obj 中的 dict 值替换为 TrackingDict。
+
+        顶层保持为普通的 dict，jinja2 会复制顶层的值，顶层变量通过 jinja2.meta 静态分析。
+        """
+        self.tracked_names = {k for k, v in obj.items() if isinstance(v, dict)}
+        return {
+            k: TrackingDict(v, (k,), self) if isinstance(v, dict) else v
+            for k, v in obj.items()
+        }
+
+    def config_paths(
+        self, tpl_name: str, names: Iterable[str] | None, environ_names: Iterable[str]
+    ) -> set[KeyPath]:
+        """将记录的路径转换为配置路径。
+
+        :param tpl_name: 替换值对应的配置中的表名称。
+        :param names: 模板中引用的顶层变量，为 None 表示读取了整个表。
+        :param environ_names: REPLACE_ENVIRON 中的变量名称。
+        """
+        environ_names = set(environ_names)
+        rel_paths = (
+            {()}
+            if names is None
+            else self.paths | {(n,) for n in names if n not in self.tracked_names}
+        )
+
+        def ref_path(name: str) -> KeyPath | None:
+            if name in ROOT_META_KEYS:
+                return (name,)
+            if name in environ_names:
+                return (REPLACE_ENVIRON_KEY, name)
+            return None
+
+        result: set[KeyPath] = set()
+        for p in rel_paths:
+            if p and p[0] in ROOT_META_KEYS:
+                result.add((p[0],))
+                continue
+            result.add((tpl_name, *p))
+            # 读取的值（及其子值）中的占位符引用的变量
+            for value_path, refs in self.value_refs.items():
+                if value_path[: len(p)] == p:
+                    result.update(r for r in map(ref_path, refs) if r is not None)
+        return result
+
+
+class TrackingDict(dict):
+    """在 jinja2 渲染过程中记录被读取的键。
+
+    读取标量值时记录它的路径；遍历、判断长度或者输出整个 dict 时记录 dict 自身的路径。
+    """
+
+    __slots__ = ("_fabik_path", "_fabik_tracker")
+
+    def __init__(self, data: dict, path: KeyPath, tracker: AccessTracker):
+        super().__init__(data)
+        self._fabik_path = path
+        self._fabik_tracker = tracker
+
+    def _whole(self) -> None:
+        self._fabik_tracker.record(self._fabik_path)
+
+    def __getitem__(self, key: Any) -> Any:
+        path = (*self._fabik_path, str(key))
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            # 记录不存在的键，以后添加这个键时也需要重新渲染
+            self._fabik_tracker.record(path)
+            raise
+        if isinstance(value, dict):
+            return TrackingDict(value, path, self._fabik_tracker)
+        self._fabik_tracker.record(path)
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: object) -> bool:
+        self._fabik_tracker.record((*self._fabik_path, str(key)))
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._whole()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self._whole()
+        return super().__len__()
+
+    def __eq__(self, other: object) -> bool:
+        self._whole()
+        return super().__eq__(other)
+
+    __hash__ = None  # type: ignore
+
+    def keys(self):
+        self._whole()
+        return super().keys()
+
+    def values(self):
+        self._whole()
+        return super().values()
+
+    def items(self):
+        self._whole()
+        return super().items()
+
+    def __repr__(self) -> str:
+        self._whole()
+        return super().__repr__()
+
+    __str__ = __repr__
+
+
+class KeyTrie:
+    """配置路径的前缀树，每个节点保存读取了这个路径的输出文件。"""
+
+    __slots__ = ("children", "outputs")
+
+    children: dict[str, "KeyTrie"]
+    outputs: set[str]
+
+    def __init__(self):
+        self.children = {}
+        self.outputs = set()
+
+    def add(self, path: KeyPath, output: str) -> None:
+        node = self
+        for seg in path:
+            node = node.children.setdefault(seg, KeyTrie())
+        node.outputs.add(output)
+
+    def discard(self, path: KeyPath, output: str) -> None:
+        node = self
+        for seg in path:
+            node = node.children.get(seg)  # type: ignore
+            if node is None:
+                return
+        node.outputs.discard(output)
+
+    def _collect(self, result: set[str]) -> None:
+        result.update(self.outputs)
+        for child in self.children.values():
+            child._collect(result)
+
+    def find(self, path: KeyPath) -> set[str]:
+        """返回受 path 改变影响的输出文件。
+
+        包括读取了 path 的祖先（读取了整个 dict）、path 自身以及 path 的后代的输出文件。
+        """
+        result: set[str] = set(self.outputs)
+        node = self
+        for seg in path:
+            node = node.children.get(seg)  # type: ignore
+            if node is None:
+                return result
+            result.update(node.outputs)
+        for child in node.children.values():
+            child._collect(result)
+        return result
+
+
+@dataclass
+class OutputDeps:
+    """一个输出文件的依赖。"""
+
+    output: str
+    """ 输出文件的名称，见 RenderJob.name。"""
+    env_name: str = ""
+    keys: set[KeyPath] = field(default_factory=set)
+    """ 读取的配置路径。"""
+    templates: set[str] = field(default_factory=set)
+    """ 读取的模板文件的绝对路径。"""
+
+
+class DependencyGraph:
+    """输出文件到配置路径和模板文件的依赖图，以及反向索引。"""
+
+    outputs: dict[str, OutputDeps]
+    _tries: dict[str, KeyTrie]
+    """ env_name -> 前缀树 """
+    _templates: dict[str, set[str]]
+    """ 模板文件 -> 输出文件 """
+
+    def __init__(self):
+        self.outputs = {}
+        self._tries = {}
+        self._templates = {}
+
+    def add(self, deps: OutputDeps) -> None:
+        """添加或者替换一个输出文件的依赖。"""
+        self.remove(deps.output)
+        self.outputs[deps.output] = deps
+        trie = self._tries.setdefault(deps.env_name, KeyTrie())
+        for k in deps.keys:
+            trie.add(k, deps.output)
+        for t in deps.templates:
+            self._templates.setdefault(t, set()).add(deps.output)
+
+    def remove(self, output: str) -> None:
+        deps = self.outputs.pop(output, None)
+        if deps is None:
+            return
+        trie = self._tries.get(deps.env_name)
+        if trie is not None:
+            for k in deps.keys:
+                trie.discard(k, output)
+        for t in deps.templates:
+            self._templates.get(t, set()).discard(output)
+
+    def affected_by_key(self, path: KeyPath, env_name: str | None = None) -> set[str]:
+        """返回 path 改变时需要重新渲染的输出文件。
+
+        :param env_name: 仅查找这个环境的输出文件，为 None 时查找所有环境。
+        """
+        if env_name is not None:
+            trie = self._tries.get(env_name)
+            return trie.find(path) if trie else set()
+        result: set[str] = set()
+        for trie in self._tries.values():
+            result |= trie.find(path)
+        return result
+
+    def affected_by_template(self, tpl_file: Path | str) -> set[str]:
+        """返回模板文件改变时需要重新渲染的输出文件。"""
+        return set(self._templates.get(Path(tpl_file).absolute().as_posix(), ()))
+
+    def resolve_key(self, key: str) -> tuple[str | None, KeyPath]:
+        """将命令行中使用点号分隔的键名转换为 (env_name, 配置路径)。
+
+        ``ENV.<env>.`` 开头的键名仅影响这个环境。
+        键名本身可以包含点号（例如 ``app.conf.PORT``），优先匹配依赖图中已经存在的最长的键名。
+        """
+        tokens = key.split(".")
+        env_name = None
+        if len(tokens) > 2 and tokens[0] == "ENV":
+            env_name, tokens = tokens[1], tokens[2:]
+        tries = [self._tries[env_name]] if env_name in self._tries else list(self._tries.values())
+        path: list[str] = []
+        while tokens:
+            for size in range(len(tokens), 0, -1):
+                seg = ".".join(tokens[:size])
+                children = [t.children[seg] for t in tries if seg in t.children]
+                if children or size == 1:
+                    path.append(seg)
+                    tokens = tokens[size:]
+                    tries = children
+                    break
+        return env_name, tuple(path)
+
+    def to_data(self) -> dict:
+        return {
+            name: {
+                "env_name": d.env_name,
+                "keys": sorted(d.keys),
+                "templates": sorted(d.templates),
+            }
+            for name, d in self.outputs.items()
+        }
+
+    @classmethod
+    def from_data(cls, data: dict) -> "DependencyGraph":
+        graph = cls()
+        for name, d in data.items():
+            graph.add(
+                OutputDeps(
+                    name,
+                    d["env_name"],
+                    {tuple(k) for k in d["keys"]},
+                    set(d["templates"]),
+                )
+            )
+        return graph
+
+
+def diff_paths(old: Any, new: Any, prefix: KeyPath = ()) -> set[KeyPath]:
+    """比较两个值，返回所有不同的路径。"""
+    if isinstance(old, Mapping) and isinstance(new, Mapping):
+        result: set[KeyPath] = set()
+        for k in old.keys() | new.keys():
+            if k not in old or k not in new:
+                result.add((*prefix, k))
+            elif old[k] != new[k]:
+                result |= diff_paths(old[k], new[k], (*prefix, k))
+        return result
+    return set() if old == new else {prefix}
+
+
+def diff_config_paths(old: FabikConfig, new: FabikConfig) -> set[KeyPath]:
+    """返回同一个环境的两个配置中所有不同的配置路径。"""
+    old_root = {k: v for k, v in old.root_data.items() if k != "ENV"}
+    new_root = {k: v for k, v in new.root_data.items() if k != "ENV"}
+    paths = diff_paths(old_root, new_root)
+    paths |= diff_paths(old.get_env_value() or {}, new.get_env_value() or {})
+    # 以项目名称开头的环境变量用于 REPLACE_ENVIRON
+    if old.env_data != new.env_data:
+        paths.add((REPLACE_ENVIRON_KEY,))
+    return paths
+
+
+def get_deps_snapshot(cache_dir: Path, sources: list[Path]) -> ConfigSnapshot:
+    """返回依赖图的缓存，sources 中的任何一个文件改变时缓存失效。"""
+    return ConfigSnapshot(cache_dir.joinpath(f"{DEPS_SNAPSHOT_NAME}{SNAPSHOT_SUFFIX}"), sources)
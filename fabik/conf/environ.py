@@ -0,0 +1,68 @@
+""".._fabik_conf_environ:
+
+fabik.conf.environ
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+REPLACE_ENVIRON 中的变量的值的提供者。
+
+环境变量（或者 ``.fabik.env`` 中）的值以下列前缀开头时，使用前缀之后的内容获取真正的值：
+
+- ``@file:`` 读取这个文件的内容（去掉末尾的换行），相对路径基于工作文件夹，例如 ``@file:~/.secrets/db_password`` 。
+- ``@cmd:`` 在工作文件夹中执行这个 shell 命令，使用它的标准输出（去掉末尾的换行），例如 ``@cmd:pass show myapp/token`` 。
+
+这些值的获取成本较高，ConfigReplacer 仅在占位符引用它们时才获取，并且每个 ConfigReplacer 仅获取一次。
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Any
+
+from fabik.error import ConfigError
+
+
+FILE_PREFIX: str = "@file:"
+CMD_PREFIX: str = "@cmd:"
+
+CMD_TIMEOUT: float = 60
+""" @cmd: 命令的超时秒数。"""
+
+
+def resolve_environ_value(name: str, value: Any, work_dir: Path) -> Any:
+    """返回 REPLACE_ENVIRON 中的变量 name 的真正的值。
+
+    :param value: 环境变量中的值，不是以提供者前缀开头的字符串时原样返回。
+    :param work_dir: 相对路径和命令的工作文件夹。
+    """
+    if not isinstance(value, str):
+        return value
+    if value.startswith(FILE_PREFIX):
+        file = Path(value[len(FILE_PREFIX) :].strip()).expanduser()
+        if not file.is_absolute():
+            file = work_dir.joinpath(file)
+        try:
+            return file.read_text(encoding="utf-8").rstrip("\r\n")
+        except OSError as e:
+            raise ConfigError(
+                err_type=e, err_msg=f"Read {name} from {file.as_posix()} error: {e.strerror}"
+            )
+    if value.startswith(CMD_PREFIX):
+        cmd = value[len(CMD_PREFIX) :].strip()
+        try:
+            proc = subprocess.run(
+                cmd,
+                shell=True,
+                cwd=work_dir,
+                capture_output=True,
+                text=True,
+                timeout=CMD_TIMEOUT,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ConfigError(err_type=e, err_msg=f"Run the command of {name} error: {e}")
+        if proc.returncode != 0:
+            # 不输出标准输出，其中可能包含敏感信息
+            raise ConfigError(
+                err_type=subprocess.CalledProcessError(proc.returncode, cmd),
+                err_msg=f"The command of {name} exited with {proc.returncode}: {proc.stderr.strip()}",
+            )
+        return proc.stdout.rstrip("\r\n")
+    return value
@@ -0,0 +1,256 @@
+""".._fabik_conf_include:
+
+fabik.conf.include
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+将 fabik.toml 中的表拆分到单独的 TOML 片段文件中，按需载入。
+
+``[INCLUDE]`` 表的结构与配置的结构相同，字符串值是片段文件的路径（相对于 fabik.toml 所在的文件夹）::
+
+    [INCLUDE]
+    'config.toml' = 'conf.d/config.toml'
+
+    [INCLUDE.ENV]
+    prod = 'conf.d/prod.toml'
+
+解析 fabik.toml 时，片段文件所在的位置被替换为 :class:`Fragment` ，
+第一次读取片段中的值时才解析片段文件。每个片段有自己的快照缓存，片段文件改变时仅重新解析这个片段。
+"""
+
+import hashlib
+import os
+import tomllib
+from collections.abc import Iterable, Iterator, Mapping
+from pathlib import Path
+from typing import Any
+
+from fabik.conf.cache import SNAPSHOT_SUFFIX, ConfigSnapshot
+from fabik.error import ConfigError
+
+
+INCLUDE_KEY: str = "INCLUDE"
+""" fabik.toml 中定义片段文件的表名。"""
+
+INCLUDE_CACHE_DIR: str = "include"
+""" 片段快照保存在缓存文件夹（见 get_cache_dir）的这个子文件夹中。"""
+
+
+def parse_fragment_file(file: Path) -> dict:
+    """解析一个片段文件。"""
+    try:
+        return tomllib.loads(file.read_text(encoding="utf-8"))
+    except FileNotFoundError as e:
+        raise ConfigError(err_type=e, err_msg=f"Include file {file} not found.")
+    except tomllib.TOMLDecodeError as e:
+        raise ConfigError(err_type=e, err_msg=f"Decode {file} error: {e}")
+
+
+class Fragment(Mapping):
+    """一个片段文件中的表，第一次读取其中的值时才解析片段文件。
+
+    判断 ``isinstance(value, Mapping)`` 不会解析片段文件。
+
+    :param file: 片段文件的绝对路径。
+    :param cache_file: 片段的快照文件，为 None 时不使用快照。
+    :param data: 已经解析的数据。
+    """
+
+    __slots__ = ("file", "cache_file", "_data")
+
+    file: Path
+    cache_file: Path | None
+    _data: dict | None
+
+    def __init__(
+        self, file: Path, cache_file: Path | None = None, data: dict | None = None
+    ):
+        self.file = file
+        self.cache_file = cache_file
+        self._data = data
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def get_snapshot(self) -> ConfigSnapshot | None:
+        if self.cache_file is None:
+            return None
+        return ConfigSnapshot(self.cache_file, [self.file])
+
+    def load_cached(self) -> dict | None:
+        """仅从快照中载入，快照不存在或已经失效时返回 None。"""
+        if self._data is None:
+            snapshot = self.get_snapshot()
+            if snapshot is not None:
+                data = snapshot.load()
+                if isinstance(data, dict):
+                    self._data = data
+        return self._data
+
+    def load(self) -> dict:
+        """载入片段的数据，已经载入时直接返回。"""
+        if self.load_cached() is None:
+            snapshot = self.get_snapshot()
+            signatures = snapshot.collect_signatures() if snapshot else None
+            self.set_data(parse_fragment_file(self.file), signatures)
+        return self._data  # type: ignore
+
+    def set_data(
+        self, data: dict, signatures: dict[str, tuple[int, int, str]] | None = None
+    ) -> None:
+        """设置解析后的数据，同时保存快照。
+
+        :param signatures: 解析前调用 ConfigSnapshot.collect_signatures 获取的签名。
+        """
+        self._data = data
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            snapshot.save(data, signatures)
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.load()[key]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.load()
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"{self.__class__.__name__}({self.file.as_posix()!r}, {state})"
+
+    def __reduce__(self):
+        # 未载入的片段仅保存路径，传递到子进程之后再按需载入
+        return (self.__class__, (self.file, self.cache_file, self._data))
+
+
+def get_fragment_cache_file(cache_dir: Path, file: Path) -> Path:
+    """返回片段文件的快照文件路径，不同文件夹中的同名片段不会冲突。"""
+    digest = hashlib.sha1(file.as_posix().encode()).hexdigest()[:8]
+    return cache_dir.joinpath(
+        INCLUDE_CACHE_DIR, f"{file.name}.{digest}{SNAPSHOT_SUFFIX}"
+    )
+
+
+def expand_includes(
+    root_data: dict, base_dir: Path, cache_dir: Path | None = None
+) -> dict:
+    """将 root_data 中的 INCLUDE 表替换为 Fragment，返回 root_data。
+
+    :param base_dir: 片段文件的相对路径基于这个文件夹。
+    :param cache_dir: 快照缓存文件夹，为 None 时不使用快照。
+    """
+    includes = root_data.pop(INCLUDE_KEY, None)
+    if includes is None:
+        return root_data
+    if not isinstance(includes, dict):
+        raise ConfigError(
+            err_type=TypeError(), err_msg=f"{INCLUDE_KEY} must be a table."
+        )
+
+    def expand(includes: dict, data: dict, path: tuple[str, ...]):
+        for key, value in includes.items():
+            key_path = ".".join((*path, key))
+            if isinstance(value, dict):
+                sub_data = data.setdefault(key, {})
+                if not isinstance(sub_data, dict):
+                    raise ConfigError(
+                        err_type=TypeError(),
+                        err_msg=f"{key_path} in {INCLUDE_KEY} must be a table.",
+                    )
+                expand(value, sub_data, (*path, key))
+            elif isinstance(value, str):
+                if key in data:
+                    raise ConfigError(
+                        err_type=ValueError(),
+                        err_msg=f"{key_path} is defined both in fabik.toml and {value}.",
+                    )
+                file = Path(value)
+                if not file.is_absolute():
+                    file = base_dir.joinpath(file)
+                if not file.is_file():
+                    raise ConfigError(
+                        err_type=FileNotFoundError(),
+                        err_msg=f"Include file {file} of {key_path} not found.",
+                    )
+                cache_file = (
+                    None if cache_dir is None else get_fragment_cache_file(cache_dir, file)
+                )
+                data[key] = Fragment(file, cache_file)
+            else:
+                raise ConfigError(
+                    err_type=TypeError(),
+                    err_msg=f"{key_path} in {INCLUDE_KEY} must be a file path or a table.",
+                )
+
+    expand(includes, root_data, ())
+    return root_data
+
+
+def find_fragments(data: Mapping) -> list[Fragment]:
+    """返回 data 中所有的 Fragment，不会载入它们。"""
+    fragments: list[Fragment] = []
+    for value in data.values():
+        if isinstance(value, Fragment):
+            fragments.append(value)
+        elif isinstance(value, dict):
+            fragments.extend(find_fragments(value))
+    return fragments
+
+
+def collect_fragments(
+    data: Mapping, paths: Iterable[tuple[str, ...]]
+) -> list[Fragment]:
+    """返回读取 paths 时需要载入的 Fragment，不会载入它们。"""
+    fragments: list[Fragment] = []
+    for path in paths:
+        value: Any = data
+        for key in path:
+            if isinstance(value, Fragment) and not value.loaded:
+                break
+            if not isinstance(value, Mapping) or key not in value:
+                value = None
+                break
+            value = value[key]
+        if (
+            isinstance(value, Fragment)
+            and not value.loaded
+            and all(value is not f for f in fragments)
+        ):
+            fragments.append(value)
+    return fragments
+
+
+def load_fragments(
+    fragments: list[Fragment], max_workers: int | None = None
+) -> None:
+    """载入多个 Fragment，快照失效的片段在进程池中并行解析，重复的 Fragment 仅载入一次。
+
+    :param max_workers: 进程数量，默认为 CPU 数量。值为 1 或者仅有一个片段需要解析时，直接在当前进程中解析。
+    """
+    pending: list[Fragment] = []
+    for f in fragments:
+        # 多个环境共享同一份数据，同一个 Fragment 可能出现多次
+        if all(f is not p for p in pending) and f.load_cached() is None:
+            pending.append(f)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(pending)))
+    if max_workers == 1:
+        for f in pending:
+            f.load()
+        return
+
+    # 所有命令都会载入这个模块，进程池仅在需要时才载入
+    from concurrent.futures import ProcessPoolExecutor
+
+    snapshots = [f.get_snapshot() for f in pending]
+    signatures = [s.collect_signatures() if s else None for s in snapshots]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(parse_fragment_file, [f.file for f in pending]))
+    for f, data, sig in zip(pending, results, signatures):
+        f.set_data(data, sig)
@@ -0,0 +1,263 @@
+""".._fabik_conf_manifest:
+
+fabik.conf.manifest
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+输出文件的内容清单。
+
+在输出文件所在的文件夹中保存 FABIK_MANIFEST_FILE，记录每个输出文件的
+``hash/size/mtime_ns``。渲染结果与现有文件内容相同时不再写入，
+文件的 mtime 保持不变，不会触发下游的文件监控和服务重载。
+
+输出文件使用 :class:`AtomicOutput` 写入：内容被逐段写入同一个文件夹中的临时文件，
+写入完成后原子地替换目标文件，读取者不会看到写入了一半的文件。
+"""
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+from collections import Counter
+from collections.abc import Iterable
+from enum import StrEnum
+from itertools import islice
+from pathlib import Path
+from typing import IO
+
+from fabik.conf.cache import file_hash, file_signature
+from fabik.tpl import FABIK_MANIFEST_FILE
+
+
+class WriteStatus(StrEnum):
+    """写入输出文件的结果。"""
+
+    NEW = "new"
+    """ 文件不存在，新建。"""
+    CHANGED = "changed"
+    """ 文件内容改变，覆盖。"""
+    UNCHANGED = "unchanged"
+    """ 文件内容未改变，没有写入。"""
+    SKIPPED = "skipped"
+    """ 文件内容改变，但没有提供 --force，没有写入。"""
+
+
+def content_hash(content: bytes) -> str:
+    """计算内容的 sha256，与 file_hash 的结果可以直接比较。"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def format_write_stats(stats: Counter) -> str:
+    """将写入结果的统计转换为一行文字，便于其他工具解析。"""
+    return ", ".join(f"{stats.get(s, 0)} {s}" for s in WriteStatus)
+
+
+def _swap_umask() -> int:
+    """通过 os.umask 获取 umask，会短暂地修改 umask，仅在导入模块时调用。"""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_IMPORT_UMASK: int = _swap_umask()
+""" 导入模块时的 umask，无法读取 /proc/self/status 时使用。"""
+
+
+def get_umask() -> int:
+    """返回当前进程的 umask。
+
+    从 /proc/self/status 中读取，不修改 umask，可以在多个线程中同时调用；
+    不支持时返回导入模块时的 umask。
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    return _IMPORT_UMASK
+
+
+class AtomicOutput:
+    """将内容逐段写入 dst_file 所在文件夹中的临时文件，同时计算内容的 hash。
+
+    调用 commit 之后才会替换 dst_file；没有调用 commit（例如渲染出错或者内容未改变）时，
+    临时文件在退出上下文时被删除，dst_file 保持不变。 ::
+
+        with AtomicOutput(dst_file) as output:
+            output.writelines(chunks)
+            if output.digest != old_digest:
+                output.commit()
+
+    :param dst_file: 目标文件，所在的文件夹必须存在。
+        dst_file 是符号链接时，替换链接指向的文件，链接本身保持不变。
+    """
+
+    dst_file: Path
+    real_file: Path
+    """ dst_file 解析符号链接之后的路径，commit 时替换这个文件。"""
+    tmp_file: Path
+    committed: bool = False
+    size: int = 0
+    """ 已经写入的字节数。"""
+
+    batch_size: int = 4096
+    """ 模板逐段返回的内容通常很短，writelines 积累这么多段之后再一起编码、计算 hash 和写入。"""
+
+    _file: IO[bytes]
+    _hash: "hashlib._Hash"
+
+    def __init__(self, dst_file: Path):
+        self.dst_file = dst_file
+        self.real_file = Path(os.path.realpath(dst_file))
+        # 临时文件与目标文件在同一个文件夹中，保证 os.replace 是原子的
+        fd, tmp_name = tempfile.mkstemp(
+            prefix=f".{self.real_file.name}.", suffix=".tmp", dir=self.real_file.parent
+        )
+        self.tmp_file = Path(tmp_name)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+
+    def write(self, chunk: str | bytes) -> None:
+        data = chunk.encode() if isinstance(chunk, str) else chunk
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def writelines(self, chunks: Iterable[str] | Iterable[bytes]) -> None:
+        """逐段写入，内存中最多保存 batch_size 段内容。同一批的内容必须都是 str 或者都是 bytes。"""
+        it = iter(chunks)
+        while batch := list(islice(it, self.batch_size)):
+            sep = b"" if isinstance(batch[0], bytes) else ""
+            self.write(sep.join(batch))
+
+    @property
+    def digest(self) -> str:
+        """已经写入的内容的 sha256，与 content_hash 的结果相同。"""
+        return self._hash.hexdigest()
+
+    def commit(self) -> None:
+        """将临时文件写入磁盘，然后替换 dst_file。
+
+        dst_file 已经存在时保留它的权限，否则使用与 ``open()`` 新建文件相同的权限。
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        try:
+            mode = stat.S_IMODE(self.real_file.stat().st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~get_umask()
+        os.chmod(self.tmp_file, mode)
+        os.replace(self.tmp_file, self.real_file)
+        self.committed = True
+        # 同步文件夹，保证重命名本身也被写入磁盘，不支持时忽略
+        try:
+            dir_fd = os.open(self.real_file.parent, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def discard(self) -> None:
+        """删除临时文件，dst_file 保持不变。"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            self.tmp_file.unlink(missing_ok=True)
+
+    def __enter__(self) -> "AtomicOutput":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.discard()
+
+
+class OutputManifest:
+    """一个文件夹中所有输出文件的内容清单。
+
+    判断文件内容时，若文件当前的 mtime 和 size 与清单一致，直接使用清单中的 hash；
+    否则（文件被手动修改，或者清单中没有记录）重新计算文件的 hash。
+    因此清单丢失或者过期都只会影响速度，不会影响结果。
+    """
+
+    manifest_file: Path
+    """ 清单文件路径。"""
+
+    _entries: dict[str, dict] | None = None
+    _updates: dict[str, dict]
+
+    def __init__(self, manifest_file: Path):
+        self.manifest_file = manifest_file
+        self._entries = None
+        self._updates = {}
+
+    @classmethod
+    def for_file(cls, dst_file: Path) -> "OutputManifest":
+        """获取 dst_file 所在文件夹的清单。"""
+        return cls(dst_file.parent.joinpath(FABIK_MANIFEST_FILE))
+
+    def _read(self) -> dict[str, dict]:
+        try:
+            entries = json.loads(self.manifest_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    @property
+    def entries(self) -> dict[str, dict]:
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def get_hash(self, p: Path) -> str:
+        """获取文件当前内容的 hash，文件不存在时返回空字符串。"""
+        entry = self.entries.get(p.name)
+        if isinstance(entry, dict):
+            mtime_ns, size = file_signature(p)
+            if entry.get("mtime_ns") == mtime_ns and entry.get("size") == size:
+                return entry.get("hash", "")
+        return file_hash(p)
+
+    def record(self, p: Path, digest: str) -> None:
+        """记录文件当前的签名和内容 hash，需要调用 save 才会保存到磁盘。"""
+        mtime_ns, size = file_signature(p)
+        entry = {"hash": digest, "size": size, "mtime_ns": mtime_ns}
+        if self.entries.get(p.name) == entry:
+            return
+        self.entries[p.name] = entry
+        self._updates[p.name] = entry
+
+    def save(self) -> None:
+        """保存清单。
+
+        写入前重新读取磁盘上的清单并合并本次的修改，减少多个进程同时写入同一个文件夹时丢失记录。
+        写入失败（例如只读文件夹）时静默忽略。
+        """
+        if not self._updates:
+            return
+        entries = self._read()
+        entries.update(self._updates)
+        content = json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True)
+        tmp_file: Path | None = None
+        try:
+            # 每次写入使用不同的临时文件，多个线程同时保存也不会冲突
+            fd, tmp_name = tempfile.mkstemp(
+                prefix=f"{self.manifest_file.name}.", suffix=".tmp", dir=self.manifest_file.parent
+            )
+            tmp_file = Path(tmp_name)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.chmod(tmp_file, 0o666 & ~get_umask())
+            os.replace(tmp_file, self.manifest_file)
+        except OSError:
+            if tmp_file is not None:
+                tmp_file.unlink(missing_ok=True)
+            return
+        self._entries = entries
+        self._updates = {}
@@ -6,12 +6,14 @@ fabik.conf.processor
 fabik command line interface implementation
 """
 
+import functools
 import jinja2
+from jinja2 import meta
 from pathlib import Path
+from collections.abc import Iterable, Iterator, Mapping
 from typing import Any
 import shutil
 
-import tomllib
 import tomli_w
 import json
 
@@ -25,7 +27,94 @@ from fabik.error import (
     ConfigError,
     TplError,
 )
-from fabik.conf import merge_dict
+from fabik.conf.view import LayeredView
+from fabik.conf.cache import get_cache_dir, make_cache_dir
+from fabik.conf.deps import AccessTracker, find_value_refs
+from fabik.conf.environ import resolve_environ_value
+from fabik.conf.manifest import AtomicOutput, OutputManifest, WriteStatus
+from fabik.conf.query import has_placeholder
+from fabik.runtime import BUNDLE_SUFFIX, BundleError, dump_bundle
+
+
+TPL_BYTECODE_DIR: str = "jinja2"
+""" 模板字节码缓存文件夹名称，位于 get_cache_dir 返回的文件夹中。"""
+
+_tpl_envs: dict[tuple[Path, Path | None], jinja2.Environment] = {}
+""" 进程级的 jinja2.Environment 缓存，键名为 (tpl_dir, bytecode_cache_dir)。"""
+
+
+def get_tpl_env(tpl_dir: Path, cache_dir: Path | None = None) -> jinja2.Environment:
+    """返回 tpl_dir 对应的 jinja2.Environment，同一个进程中的同一个 tpl_dir 共享一个实例。
+
+    jinja2.Environment 在内存中缓存编译过的模板（包括 include 和 extends 的模板），
+    提供 cache_dir 时，还会将编译结果保存为磁盘上的字节码缓存，下次运行时无需再次编译。
+
+    :param tpl_dir: 模板文件夹。
+    :param cache_dir: 字节码缓存文件夹，为 None 时不使用磁盘缓存。
+    """
+    key = (tpl_dir, cache_dir)
+    tpl_env = _tpl_envs.get(key)
+    if tpl_env is None:
+        bytecode_cache = None
+        if cache_dir is not None:
+            try:
+                make_cache_dir(cache_dir)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir.as_posix())
+            except OSError:
+                # 无法创建缓存文件夹（例如只读文件系统）时不使用磁盘缓存
+                bytecode_cache = None
+        tpl_env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(tpl_dir), bytecode_cache=bytecode_cache
+        )
+        _tpl_envs[key] = tpl_env
+    return tpl_env
+
+
+def get_tpl_bytecode_dir(work_dir: Path) -> Path:
+    """返回工作文件夹的模板字节码缓存文件夹。"""
+    return get_cache_dir(work_dir).joinpath(TPL_BYTECODE_DIR)
+
+
+def precompile_templates(tpl_dir: Path, cache_dir: Path) -> list[str]:
+    """编译 tpl_dir 中所有的 jinja2 模板，保存到字节码缓存中。
+
+    :return: 编译成功的模板名称列表。
+    """
+    tpl_env = get_tpl_env(tpl_dir, cache_dir)
+    names = tpl_env.list_templates(extensions=["jinja2"])
+    for name in names:
+        try:
+            tpl_env.get_template(name)
+        except jinja2.TemplateError as e:
+            raise TplError(err_type=e, err_msg=f"模版文件 {name} 错误： {e!s}")
+    return names
+
+
+def find_referenced_templates(tpl_env: jinja2.Environment, name: str) -> list[str]:
+    """返回 name 以及它通过 include/extends/import 递归引用的所有模板名称。
+
+    使用变量动态引用的模板无法静态分析，会被忽略。
+    """
+    names: list[str] = []
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        if current in names:
+            continue
+        names.append(current)
+        try:
+            source, _, _ = tpl_env.loader.get_source(tpl_env, current)  # type: ignore
+            ast = tpl_env.parse(source)
+        except jinja2.TemplateError:
+            continue
+        pending.extend(n for n in meta.find_referenced_templates(ast) if n is not None)
+    return names
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_value_template(value: str) -> jinja2.Template:
+    """编译配置值中的 jinja2 模板，相同的字符串仅编译一次。"""
+    return jinja2.Template(value)
 
 
 class ConfigWriter:
@@ -35,6 +124,8 @@ class ConfigWriter:
     dst_file: Path
     replace_obj: dict
     verbose: bool = False
+    status: WriteStatus | None = None
+    """ 最后一次调用 write_file 的结果。"""
 
     def __init__(
         self, tpl_name: str, dst_file: Path, replace_obj: dict, verbose: bool = False
@@ -48,48 +139,94 @@ class ConfigWriter:
         self.replace_obj = replace_obj
         self.verbose = verbose
 
-    def _write_key_value(self):
-        """输出 key = value 形式的文件"""
-        txt = "\n".join([f"{k} = {v}" for k, v in self.replace_obj.items()])
-        self.dst_file.write_text(txt)
-        echo_info(f"文件 {self.dst_file.as_posix()} 创建成功。")
+    def _generate_key_value(self) -> str:
+        """生成 key = value 形式的文件内容"""
+        return "\n".join([f"{k} = {v}" for k, v in self.replace_obj.items()])
+
+    def generate(self) -> Iterator[str] | Iterator[bytes]:
+        """根据后缀决定如何渲染，逐段返回文件内容。
 
-    def _write_file_by_type(self):
-        """根据后缀决定如何处理渲染。"""
-        if self.tpl_name.endswith(".toml"):
-            self.dst_file.write_text(tomli_w.dumps(self.replace_obj))
-            echo_info(f"文件 {self.dst_file.as_posix()} 创建成功。")
+        目标文件的后缀为 ``.fbk`` 时，生成二进制配置包，见 :ref:`fabik_runtime` 。
+        """
+        if self.dst_file.name.endswith(BUNDLE_SUFFIX):
+            try:
+                yield dump_bundle(self.replace_obj)
+            except BundleError as e:
+                raise ConfigError(
+                    err_type=e, err_msg=f"Bundle {self.dst_file.name} error: {e}"
+                )
+        elif self.tpl_name.endswith(".toml"):
+            yield tomli_w.dumps(self.replace_obj)
         elif self.tpl_name == ".env":
-            self._write_key_value()
+            yield self._generate_key_value()
         else:
             # 对于不支持的文件类型，使用 json 格式渲染
-            self.dst_file.write_text(
-                json.dumps(self.replace_obj, ensure_ascii=False, indent=4)
-            )
-            echo_info(f"文件 {self.dst_file.as_posix()} 创建成功。")
+            yield json.dumps(self.replace_obj, ensure_ascii=False, indent=4)
+
+    def _stream(self) -> Iterator[str] | Iterator[bytes]:
+        """逐段返回文件内容，子类在这里处理渲染错误。"""
+        return self.generate()
+
+    def _render(self) -> bytes:
+        """渲染完整的文件内容。"""
+        return b"".join(
+            chunk.encode() if isinstance(chunk, str) else chunk
+            for chunk in self._stream()
+        )
+
+    def _echo_written(self):
+        echo_info(f"文件 {self.dst_file.as_posix()} 创建成功。")
 
-    def write_file(self, force: bool = True, rename: bool = False):
+    def write_file(
+        self, force: bool = True, rename: bool = False, record: bool = True
+    ) -> WriteStatus:
         """写入配置文件
+
+        渲染结果与现有文件的内容相同时不会写入，文件的 mtime 保持不变。
+        写入结果记录在 dst_file 所在文件夹的 FABIK_MANIFEST_FILE 中。
+
+        内容被逐段写入同一个文件夹中的临时文件，完成后原子地替换 dst_file，
+        渲染出错时 dst_file 保持不变，见 :class:`fabik.conf.manifest.AtomicOutput` 。
+
         :param force: 若 force 为 False，则仅当文件不存在的时候才写入。
         :param rename: 是否重命名原始文件。
+        :param record: 是否将写入结果记录在清单中，使用后即删除的临时文件不需要记录。
         """
-        if not self.dst_file.exists():
-            self._write_file_by_type()
-        elif force:
-            if rename:
-                bak_file = self.dst_file.parent.joinpath(
-                    f"{self.dst_file.name}.bak_{int(fabik.__now__.timestamp())}"
-                )
-                # 强制覆盖的时候备份原始文件
-                shutil.copyfile(self.dst_file, bak_file)
-                echo_warning(
-                    f"备份文件 {self.dst_file.as_posix()} 到 {bak_file.as_posix()}。"
+        manifest = OutputManifest.for_file(self.dst_file)
+        with AtomicOutput(self.dst_file) as output:
+            output.writelines(self._stream())
+            digest = output.digest
+            if not self.dst_file.exists():
+                output.commit()
+                self._echo_written()
+                self.status = WriteStatus.NEW
+            elif manifest.get_hash(self.dst_file) == digest:
+                echo_info(f"文件 {self.dst_file.as_posix()} 内容未改变。")
+                self.status = WriteStatus.UNCHANGED
+            elif force:
+                if rename:
+                    bak_file = self.dst_file.parent.joinpath(
+                        f"{self.dst_file.name}.bak_{int(fabik.__now__.timestamp())}"
+                    )
+                    # 强制覆盖的时候备份原始文件
+                    shutil.copyfile(self.dst_file, bak_file)
+                    echo_warning(
+                        f"备份文件 {self.dst_file.as_posix()} 到 {bak_file.as_posix()}。"
+                    )
+                output.commit()
+                self._echo_written()
+                self.status = WriteStatus.CHANGED
+            else:
+                echo_error(
+                    f"文件 {self.dst_file.as_posix()} 已存在。使用 --force 覆盖，使用 --rename 在覆盖前重命名。"
                 )
-            self._write_file_by_type()
-        else:
-            echo_error(
-                f"文件 {self.dst_file.as_posix()} 已存在。使用 --force 覆盖，使用 --rename 在覆盖前重命名。"
-            )
+                self.status = WriteStatus.SKIPPED
+                return self.status
+
+        if record:
+            manifest.record(self.dst_file, digest)
+            manifest.save()
+        return self.status
 
 
 class TplWriter(ConfigWriter):
@@ -106,11 +243,13 @@ class TplWriter(ConfigWriter):
         replace_obj: dict[str, Any],
         tpl_dir: Path,
         verbose: bool = False,
+        cache_dir: Path | None = None,
     ) -> None:
         """初始化
         :param tplname: 模版名称，不含扩展名
         :param dstname: 目标名称
         :param tpl_dir: 模板文件目录
+        :param cache_dir: 模板字节码缓存目录
         """
         super().__init__(tpl_name, dst_file, replace_obj, verbose)
 
@@ -119,30 +258,45 @@ class TplWriter(ConfigWriter):
             tpl_name if tpl_name.endswith(".jinja2") else f"{tpl_name}.jinja2"
         )
         self.tpl_dir = tpl_dir
-        self.tpl_env = jinja2.Environment(loader=jinja2.FileSystemLoader(self.tpl_dir))
+        self.tpl_env = get_tpl_env(self.tpl_dir, cache_dir)
 
-    def _write_by_jinja(self):
-        """能找到模板文件，调用 jinja2 直接渲染。"""
+    def generate(self) -> Iterator[str]:
+        """使用 jinja2 模版逐段渲染文件内容。"""
         tpl = self.tpl_env.get_template(self.tpl_filename)
-        self.dst_file.write_text(tpl.render(self.replace_obj))
         if self.verbose:
             echo_info(
                 f"{self.tpl_filename=}\n{self.dst_file.absolute().as_posix()}\n{self.replace_obj=}",
-                panel_title="TplWriter::_write_by_jinja()",
+                panel_title="TplWriter::generate()",
             )
-        echo_info(
-            f"从模板 {self.tpl_filename} 创建文件 {self.dst_file.as_posix()} 成功。"
-        )
+        return tpl.generate(self.replace_obj)
 
-    def _write_file_by_type(self):
-        """重写父类的方法，仅支持 jinja2 模版渲染。"""
+    def _stream(self) -> Iterator[str]:
+        """重写父类的方法，将 jinja2 的错误转换为 TplError。"""
         try:
-            self._write_by_jinja()
-        except TplError as e:
+            yield from self.generate()
+        except jinja2.TemplateError as e:
             raise TplError(
                 err_type=e, err_msg=f"模版文件 {self.tpl_filename} 错误： {e!s}"
             )
 
+    def _echo_written(self):
+        echo_info(
+            f"从模板 {self.tpl_filename} 创建文件 {self.dst_file.as_posix()} 成功。"
+        )
+
+    def find_dependencies(self) -> tuple[set[str], set[str]]:
+        """返回模板（包括引用的模板）中引用的顶层变量名称，以及这些模板文件的绝对路径。"""
+        names: set[str] = set()
+        files: set[str] = set()
+        for n in find_referenced_templates(self.tpl_env, self.tpl_filename):
+            try:
+                source, filename, _ = self.tpl_env.loader.get_source(self.tpl_env, n)  # type: ignore
+                names |= meta.find_undeclared_variables(self.tpl_env.parse(source))
+            except jinja2.TemplateError:
+                continue
+            files.add(Path(filename).absolute().as_posix())
+        return names, files
+
 
 class ConfigReplacer:
     env_name: str | None = None
@@ -157,6 +311,14 @@ class ConfigReplacer:
     replace_environ: list[str] | None = None
     verbose: bool = False
     writer: ConfigWriter | None = None
+    tracker: AccessTracker | None = None
+    """ 不为 None 时，记录渲染过程中读取的配置路径，见 get_dependencies。"""
+
+    _root_meta: dict | None = None
+    """ get_root_meta 的缓存。"""
+
+    _environ_values: dict[str, Any]
+    """ get_environ_value 的缓存，REPLACE_ENVIRON 中的变量名称 -> 值。"""
 
     def __init__(
         self,
@@ -166,14 +328,21 @@ class ConfigReplacer:
         output_dir: Path | None = None,
         tpl_dir: Path | None = None,
         verbose: bool = False,
+        track_access: bool = False,
     ):
-        """初始化"""
+        """初始化
+
+        :param track_access: 是否记录渲染过程中读取的配置路径。
+        """
         self.fabik_config = fabik_config
         self.work_dir = work_dir
+        self._environ_values = {}
 
         self.output_dir = output_dir
         self.tpl_dir = tpl_dir
         self.verbose = verbose
+        if track_access:
+            self.tracker = AccessTracker()
 
         self.fabik_config.check_env_name()
 
@@ -188,32 +357,57 @@ class ConfigReplacer:
     def _get_deploy_dir(self):
         """获取 DEPLOY_DIR 的 字符串形态"""
         # 处理 DEPLOY_DIR（优先从环境配置获取）
-        return self.fabik_config.getcfg(
-            "DEPLOY_DIR", f"/srv/app/{self.fabik_config.NAME}"
+        return self.fabik_config.path(
+            ("DEPLOY_DIR",), default_value=f"/srv/app/{self.fabik_config.NAME}"
         )
 
+    def get_root_meta(self) -> dict:
+        """返回 NAME/WORK_DIR/DEPLOY_DIR 等 ROOT META，仅在第一次调用时计算。"""
+        if self._root_meta is None:
+            # 直接使用固化的 fabik_name
+            root_meta = {"NAME": self.fabik_config.NAME}
+
+            # 优先从环境配置获取 WORK_DIR，否则使用当前工作目录
+            work_dir_from_env = self.fabik_config.WORK_DIR
+            if work_dir_from_env:
+                root_meta["WORK_DIR"] = Path(work_dir_from_env).resolve().as_posix()
+            else:
+                root_meta["WORK_DIR"] = self.work_dir.resolve().as_posix()
+
+            # 优先从环境配置获取 TPL_DIR
+            tpl_dir_from_env = self.fabik_config.TPL_DIR
+            if tpl_dir_from_env:
+                root_meta["TPL_DIR"] = Path(tpl_dir_from_env).resolve().as_posix()
+
+            root_meta["DEPLOY_DIR"] = Path(self._get_deploy_dir()).as_posix()
+            if self.env_name:
+                root_meta["ENV_NAME"] = self.fabik_config.env_name
+            self._root_meta = root_meta
+        return self._root_meta
+
     def _fill_root_meta(self, replace_obj: dict = {}):
         """向被替换的值，填充 NAME/WORK_DIR/DEPLOY_DIR 变量。"""
-        # 直接使用固化的 fabik_name
-        replace_obj["NAME"] = self.fabik_config.NAME
-
-        # 优先从环境配置获取 WORK_DIR，否则使用当前工作目录
-        work_dir_from_env = self.fabik_config.WORK_DIR
-        if work_dir_from_env:
-            replace_obj["WORK_DIR"] = Path(work_dir_from_env).resolve().as_posix()
-        else:
-            replace_obj["WORK_DIR"] = self.work_dir.resolve().as_posix()
-
-        # 优先从环境配置获取 TPL_DIR
-        tpl_dir_from_env = self.fabik_config.TPL_DIR
-        if tpl_dir_from_env:
-            replace_obj["TPL_DIR"] = Path(tpl_dir_from_env).resolve().as_posix()
+        replace_obj.update(self.get_root_meta())
+        return replace_obj
 
-        replace_obj["DEPLOY_DIR"] = Path(self._get_deploy_dir()).as_posix()
-        if self.env_name:
-            replace_obj["ENV_NAME"] = self.fabik_config.env_name
+    def get_environ_value(self, name: str) -> Any:
+        """返回 REPLACE_ENVIRON 中的变量 name 的值，不存在时返回 None。
 
-        return replace_obj
+        值在第一次调用时获取并缓存，支持 ``@file:`` 和 ``@cmd:`` 提供者，见 :ref:`fabik_conf_environ` 。
+        """
+        if name in self._environ_values:
+            return self._environ_values[name]
+        # FABIK_LOCAL_NAME
+        env_var_name = self.fabik_config.get_env_var_name(name)
+        environ_value = self.fabik_config.getcfg(env_var_name, data=FABIK_ENV)
+        if self.verbose:
+            echo_info(
+                f"""{env_var_name=}\n{environ_value=}""",
+                panel_title=f"LOG: ConfigReplacer::get_environ_value() CURRENT REPLACE_ENVIRON {name=!s}",
+            )
+        environ_value = resolve_environ_value(env_var_name, environ_value, self.work_dir)
+        self._environ_values[name] = environ_value
+        return environ_value
 
     def get_tpl_value(
         self,
@@ -243,7 +437,7 @@ class ConfigReplacer:
             )
 
         # 对于非字典类型，强制不使用合并
-        if not isinstance(base_obj, dict) or not isinstance(update_obj, dict):
+        if not isinstance(base_obj, Mapping) or not isinstance(update_obj, Mapping):
             merge = False
 
         if self.verbose:
@@ -252,7 +446,8 @@ class ConfigReplacer:
                 panel_title=f"ConfigReplacer::get_tpl_value({tpl_name=!s}) BEFORE MERGE",
             )
         if merge:
-            repl_obj = merge_dict(base_obj or {}, update_obj or {})
+            # ENV 中的表叠加在根中的表之上，读取时才合并
+            repl_obj = LayeredView(base_obj, update_obj)
         else:
             repl_obj = update_obj or base_obj
 
@@ -264,51 +459,76 @@ class ConfigReplacer:
 
         return {wrap_key: repl_obj} if wrap_key else repl_obj
 
-    def replace(self, value: str) -> str:
-        """替换 value 中的占位符"""
-        # 环境变量替换用
-        environ_keys = {}
-        # 替换 NAME 和 WORK_DIR
-        replace_obj = self._fill_root_meta()
-        # 获取环境变量中的替换值
-        if self.replace_environ is not None:
-            for n in self.replace_environ:
-                # FABIK_LOCAL_NAME
-                env_var_name = self.fabik_config.get_env_var_name(n)
-                environ_keys[n] = env_var_name
-                environ_value = self.fabik_config.getcfg(env_var_name, data=FABIK_ENV)
-                if self.verbose:
-                    echo_info(
-                        f"""{env_var_name=}\n{environ_value=}""",
-                        panel_title=f"LOG: ConfigReplacer::replace() CURRENT REPLACE_ENVIRON {n=!s}",
-                    )
+    def get_replace_context(self, names: Iterable[str] | None = None) -> dict:
+        """获取用于替换占位符的变量：NAME/WORK_DIR/DEPLOY_DIR 等 ROOT META 以及 REPLACE_ENVIRON 中的环境变量。
 
+        :param names: 仅获取 REPLACE_ENVIRON 中的这些变量（例如占位符引用的变量），默认获取所有的变量。
+        """
+        replace_obj = dict(self.get_root_meta())
+        if self.replace_environ is not None:
+            environ_names = (
+                self.replace_environ
+                if names is None
+                else [n for n in self.replace_environ if n in names]
+            )
+            for n in environ_names:
+                environ_value = self.get_environ_value(n)
                 if environ_value is not None:
                     replace_obj[n] = environ_value
         if self.verbose:
             echo_info(
-                f"""{environ_keys=}\n{replace_obj=}""",
-                panel_title="LOG: ConfigReplacer::replace() AFTER REPLACE_ENVIRON",
+                f"""{names=}\n{replace_obj=}""",
+                panel_title="LOG: ConfigReplacer::get_replace_context() AFTER REPLACE_ENVIRON",
+            )
+        return replace_obj
+
+    def replace(self, value: str, context: dict | None = None) -> str:
+        """替换 value 中的占位符
+
+        :param context: 替换使用的变量，默认仅获取 value 引用的 REPLACE_ENVIRON 变量。
+        """
+        if context is None:
+            context = self.get_replace_context(find_value_refs(value))
+        if self.verbose:
+            echo_info(
+                f"""{value=}\n{context=}""",
+                panel_title="LOG: ConfigReplacer::replace()",
             )
         try:
-            if self.verbose:
-                echo_info(
-                    f"""{value=}\n{replace_obj=}""",
-                    panel_title="LOG: ConfigReplacer::replace()",
-                )
-            # new_value = value.format_map(replace_obj)
-            new_value = jinja2.Template(value).render(replace_obj)
+            return compile_value_template(value).render(context)
+        except jinja2.TemplateError as e:
+            raise TplError(e, err_type=e, err_msg=f"Replace {value!r} error: {e!s}")
+
+    def replace_value(
+        self, value: Any, context: dict | None = None, path: tuple[str, ...] = ()
+    ) -> Any:
+        """遍历 value 的结构，仅渲染包含占位符的字符串（包括键名），其他类型的值保持不变。
+
+        返回一个新的对象，不修改 value。
+
+        :param context: 替换使用的变量，默认为每个字符串仅获取它引用的 REPLACE_ENVIRON 变量。
+        :param path: value 在替换值中的路径，用于记录占位符引用的变量。
+        """
+        if isinstance(value, str):
+            if not has_placeholder(value):
+                return value
+            if self.tracker is not None:
+                self.tracker.add_value_refs(path, value)
+            return self.replace(value, context)
+        if isinstance(value, Mapping):
+            # 同时将 LayeredView 转换为 dict
+            new_value = {}
+            for k, v in value.items():
+                new_k = k
+                if isinstance(k, str) and has_placeholder(k):
+                    new_k = self.replace(k, context)
+                    if self.tracker is not None:
+                        self.tracker.add_value_refs((*path, new_k), k)
+                new_value[new_k] = self.replace_value(v, context, (*path, new_k))
             return new_value
-        except KeyError as e:
-            # 抛出对应的 environ key 的错误
-            error_key = e.args[0]
-            raise FabikError(
-                e,
-                err_type=e,
-                err_msg=f"""error_key: {error_key}
-{environ_keys=}
-{replace_obj=}.""",
-            )
+        if isinstance(value, list):
+            return [self.replace_value(v, context, path) for v in value]
+        return value
 
     def get_replace_obj(self, tpl_name: str) -> dict:
         """获取已经替换过所有值的对象。"""
@@ -318,10 +538,9 @@ class ConfigReplacer:
                 panel_title="ConfigReplacer::get_replace_obj() BEFORE",
             )
         replace_obj_before = self.get_tpl_value(tpl_name, check_tpl_name=True)
-        replace_str = tomli_w.dumps(replace_obj_before)
-        # 将 obj 转换成 toml 字符串，进行一次替换，然后再转换回 obj
-        # 采用这样的方法可以不必处理复杂的层级关系
-        replace_obj_after = tomllib.loads(self.replace(replace_str))
+        # 遍历结构仅替换字符串中的占位符，不必将整个对象转换成 TOML 字符串，
+        # 仅获取占位符引用的 REPLACE_ENVIRON 变量
+        replace_obj_after = self.replace_value(replace_obj_before)
         # 再填充一次 ROOT META，让文件模板也可以使用 NAME/WORK_DIR/DEPLOY_DIR
         replace_obj_after = self._fill_root_meta(replace_obj_after)
         if self.verbose:
@@ -331,8 +550,28 @@ class ConfigReplacer:
             {replace_obj_after=!s}""",
                 panel_title=f"{self.__class__.__name__}::get_replace_obj() AFTER",
             )
+        if self.tracker is not None:
+            return self.tracker.wrap(replace_obj_after)
         return replace_obj_after
 
+    def get_dependencies(self, tpl_name: str) -> tuple[set[tuple[str, ...]], set[str]]:
+        """返回最后一次 set_writer 渲染 tpl_name 时读取的配置路径和模板文件。
+
+        需要在初始化时提供 track_access=True，并且已经调用过 writer.write_file 或者 writer.generate。
+        """
+        if self.tracker is None or self.writer is None:
+            raise ConfigError(
+                err_type=ValueError(),
+                err_msg="get_dependencies requires track_access and set_writer.",
+            )
+        names, templates = (
+            self.writer.find_dependencies()
+            if isinstance(self.writer, TplWriter)
+            else (None, set())
+        )
+        keys = self.tracker.config_paths(tpl_name, names, self.replace_environ or [])
+        return keys, templates
+
     def set_writer(
         self,
         tpl_name: str,
@@ -342,17 +581,26 @@ class ConfigReplacer:
         target_postfix: str = "",
         output_file: Path | None = None,
         immediately: bool = False,
+        replace_obj: dict | None = None,
+        extra: dict[str, Any] | None = None,
+        record: bool = True,
     ) -> tuple[Path, Path]:
         """写入配置文件。
         :param tpl_name: 配置中的根名称，一般情况下是一个表。
         :param output_file: 可选的具体输出文件路径，如果提供则优先使用
+        :param replace_obj: 已经调用 get_replace_obj 获取的替换值，不提供则重新获取。
+        :param extra: 额外的变量，覆盖替换值中的同名键，例如矩阵模式下的列表项。
+        :param record: 是否将写入结果记录在输出文件夹的清单中，见 ConfigWriter.write_file。
         """
         if self.verbose:
             echo_info(
                 f"{tpl_name=} {force=!s} {rename=!s} {target_postfix=} {output_file=} {immediately}",
                 panel_title="ConfigReplacer::set_writer() BEFORE",
             )
-        replace_obj = self.get_replace_obj(tpl_name)
+        if replace_obj is None:
+            replace_obj = self.get_replace_obj(tpl_name)
+        if extra:
+            replace_obj = {**replace_obj, **extra}
 
         if output_file is not None:
             # 使用指定的文件路径
@@ -373,10 +621,15 @@ class ConfigReplacer:
             ConfigWriter(tpl_name, final_target, replace_obj, self.verbose)
             if self.tpl_dir is None
             else TplWriter(
-                tpl_name, final_target, replace_obj, self.tpl_dir, self.verbose
+                tpl_name,
+                final_target,
+                replace_obj,
+                self.tpl_dir,
+                self.verbose,
+                cache_dir=get_tpl_bytecode_dir(self.work_dir),
             )
         )
 
         if immediately:
-            self.writer.write_file(force, rename)
+            self.writer.write_file(force, rename, record)
         return target, final_target
@@ -0,0 +1,128 @@
+""".._fabik_conf_query:
+
+fabik.conf.query
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+一次读取多个配置值，供部署脚本使用，见 :ref:`fabik_conf_get` 。
+
+读取的值与渲染配置文件时相同：ENV.<env_name> 中的同名值叠加在根中的值之上，字符串中的占位符被替换。
+ROOT_META_KEYS 与渲染和部署时相同，由 ConfigReplacer.get_root_meta 计算，不使用 ENV.<env_name> 中的值。
+其他不包含占位符的值直接返回，不会载入 jinja2 以及模板相关的模块。
+"""
+
+from collections.abc import Iterable, Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from fabik.conf.storage import FabikConfig, KeyPath
+from fabik.conf.view import LayeredView, materialize
+
+if TYPE_CHECKING:
+    from fabik.conf.processor import ConfigReplacer
+
+
+_MISSING = object()
+
+ROOT_META_KEYS: tuple[str, ...] = ("NAME", "WORK_DIR", "TPL_DIR", "DEPLOY_DIR")
+""" 由 ConfigReplacer.get_root_meta 提供的键名，与渲染和部署时使用的值相同。"""
+
+PLACEHOLDER_MARKS: tuple[str, ...] = ("{{", "{%", "{#")
+""" 包含这些标记的字符串才需要使用 jinja2 渲染。"""
+
+
+def has_placeholder(value: str) -> bool:
+    """字符串中是否包含 jinja2 占位符。"""
+    return any(mark in value for mark in PLACEHOLDER_MARKS)
+
+
+def contains_placeholder(value: Any) -> bool:
+    """value 的结构中是否有包含占位符的字符串（包括键名）。"""
+    if isinstance(value, str):
+        return has_placeholder(value)
+    if isinstance(value, Mapping):
+        return any(
+            (isinstance(k, str) and has_placeholder(k)) or contains_placeholder(v)
+            for k, v in value.items()
+        )
+    if isinstance(value, list):
+        return any(contains_placeholder(v) for v in value)
+    return False
+
+
+class ConfigQuery:
+    """读取一个环境中的配置值。
+
+    :param fabik_config: 需要读取的配置。
+    :param work_dir: 替换占位符时使用的 WORK_DIR 默认值。
+    """
+
+    fabik_config: FabikConfig
+    work_dir: Path
+    _replacer: "ConfigReplacer | None" = None
+
+    def __init__(self, fabik_config: FabikConfig, work_dir: Path):
+        self.fabik_config = fabik_config
+        self.work_dir = work_dir
+
+    def get_raw(self, path: str | KeyPath, default_value: Any = None) -> Any:
+        """读取未替换占位符的值，ENV.<env_name> 中的值覆盖根中的值。
+
+        与 ConfigReplacer.get_tpl_value 的合并规则相同：两者都是表时叠加，否则优先使用 ENV 中的值。
+        """
+        config = self.fabik_config
+        keys = path if isinstance(path, tuple) else config.compile_path(path)
+        if not keys:
+            return default_value
+        base = config.path(keys, default_value=None)
+        update = (
+            config.path(("ENV", config.env_name, *keys), default_value=None)
+            if config.env_name
+            else None
+        )
+        if isinstance(base, Mapping) and isinstance(update, Mapping):
+            return LayeredView(base, update)
+        if update is not None:
+            return update
+        if base is not None:
+            return base
+        return default_value
+
+    def _get_replacer(self) -> "ConfigReplacer":
+        if self._replacer is None:
+            from fabik.conf.processor import ConfigReplacer
+
+            self._replacer = ConfigReplacer(self.fabik_config, self.work_dir)
+        return self._replacer
+
+    def get(self, path: str | KeyPath, default_value: Any = None) -> Any:
+        """读取替换了占位符的值，表被转换为 dict。
+
+        仅当值中包含占位符，或者读取 ROOT_META_KEYS 时才创建 ConfigReplacer。
+        """
+        keys = path if isinstance(path, tuple) else (path,)
+        if len(keys) == 1 and keys[0] in ROOT_META_KEYS:
+            # 与渲染和部署时相同，例如 DEPLOY_DIR 仅从根中读取
+            return self._get_replacer().get_root_meta().get(keys[0], default_value)
+        value = self.get_raw(path, _MISSING)
+        if value is _MISSING:
+            return default_value
+        if contains_placeholder(value):
+            return self._get_replacer().replace_value(value)
+        return materialize(value)
+
+    def get_many(
+        self, paths: Iterable[str], default_value: Any = None
+    ) -> tuple[dict[str, Any], list[str]]:
+        """读取多个值。
+
+        :return: (路径 -> 值, 找不到的路径)，找不到的值为 default_value。
+        """
+        values: dict[str, Any] = {}
+        missing: list[str] = []
+        for path in paths:
+            value = self.get(path, _MISSING)
+            if value is _MISSING:
+                missing.append(path)
+                value = default_value
+            values[path] = value
+        return values, missing
@@ -0,0 +1,197 @@
+""".._fabik_conf_rebuild:
+
+fabik.conf.rebuild
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+在内存中保持解析后的配置和编译后的模板，输入改变时仅重新渲染受影响的输出文件。
+
+用于 ``fabik conf watch`` 和 ``fabik conf deps`` 。
+每次渲染时记录输出文件的依赖（见 :ref:`fabik_conf_deps` ）：
+
+- ``fabik.toml`` 、 ``.fabik.env`` 或者 INCLUDE 片段文件改变时，比较新旧配置得到改变的配置路径，仅渲染读取了这些路径的输出文件。
+- 模板文件改变时，仅渲染使用了这个模板（包括 include/extends/import 引用）的输出文件。
+"""
+
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from fabik.conf.batch import RenderJob, RenderResult
+from fabik.conf.deps import (
+    DependencyGraph,
+    OutputDeps,
+    diff_config_paths,
+    get_deps_snapshot,
+)
+from fabik.conf.processor import ConfigReplacer
+from fabik.conf.storage import FabikConfig, FabikConfigFile
+from fabik.error import FabikError
+
+
+class Rebuilder:
+    """记录每个渲染任务的依赖，判断哪些任务需要重新渲染。
+
+    :param configs: 环境名称和 FabikConfig 的对应关系，与 jobs 中的 env_name 对应。
+    :param jobs: 所有的渲染任务。
+    """
+
+    fabik_file: FabikConfigFile
+    configs: dict[str, FabikConfig]
+    jobs: list[RenderJob]
+    work_dir: Path
+    verbose: bool = False
+    use_cache: bool = True
+
+    graph: DependencyGraph
+    """ 成功渲染的任务的依赖图。"""
+
+    _failed: set[int]
+    """ 上一次渲染失败的任务序号。"""
+
+    _indexes: dict[str, int]
+    """ 任务名称 -> 任务序号 """
+
+    def __init__(
+        self,
+        fabik_file: FabikConfigFile,
+        configs: dict[str, FabikConfig],
+        jobs: list[RenderJob],
+        *,
+        verbose: bool = False,
+        use_cache: bool = True,
+    ):
+        self.fabik_file = fabik_file
+        self.configs = configs
+        self.jobs = jobs
+        self.work_dir = fabik_file.getdir()
+        self.verbose = verbose
+        self.use_cache = use_cache
+        self.graph = DependencyGraph()
+        self._failed = set()
+        self._indexes = {job.name: i for i, job in enumerate(jobs)}
+
+    @property
+    def config_files(self) -> list[Path]:
+        """需要监控的配置文件，包括 INCLUDE 中定义的片段文件。"""
+        files = [self.fabik_file.fabik_toml, self.fabik_file.fabik_env]
+        for config in self.configs.values():
+            files.extend(p for p in config.include_files if p not in files)
+            break
+        return files
+
+    @property
+    def tpl_dirs(self) -> list[Path]:
+        """需要监控的模板文件夹。"""
+        dirs: list[Path] = []
+        for job in self.jobs:
+            if job.tpl_dir is not None and job.tpl_dir not in dirs:
+                dirs.append(job.tpl_dir)
+        return dirs
+
+    def _get_replacer(self, job: RenderJob) -> ConfigReplacer:
+        return ConfigReplacer(
+            self.configs[job.env_name],
+            self.work_dir,
+            output_dir=job.output_dir,
+            tpl_dir=job.tpl_dir,
+            verbose=self.verbose,
+            track_access=True,
+        )
+
+    def _process(self, i: int, write: bool) -> RenderResult:
+        job = self.jobs[i]
+        result = RenderResult(job)
+        start = time.perf_counter()
+        try:
+            replacer = self._get_replacer(job)
+            _, result.target = replacer.set_writer(
+                job.tpl_name,
+                force=job.force,
+                rename=job.rename,
+                target_postfix=job.target_postfix,
+                output_file=job.output_file,
+                immediately=write,
+                extra=job.extra,
+            )
+            writer = replacer.writer
+            if writer is not None:
+                if write:
+                    result.status = writer.status
+                else:
+                    # 仅渲染，不写入文件
+                    for _ in writer.generate():
+                        pass
+            keys, templates = replacer.get_dependencies(job.tpl_name)
+            self.graph.add(OutputDeps(job.name, job.env_name, keys, templates))
+            self._failed.discard(i)
+        except FabikError as e:
+            result.error = e.err_msg
+        except Exception as e:
+            result.error = str(e)
+        if result.error is not None:
+            self.graph.remove(job.name)
+            self._failed.add(i)
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def render(self, indexes: Iterable[int]) -> list[RenderResult]:
+        """渲染指定序号的任务并记录依赖，返回的结果与 indexes 的顺序一致。"""
+        return [self._process(i, write=True) for i in indexes]
+
+    def render_all(self) -> list[RenderResult]:
+        return self.render(range(len(self.jobs)))
+
+    def track(self, indexes: Iterable[int]) -> list[RenderResult]:
+        """仅渲染指定序号的任务以记录依赖，不写入文件。"""
+        return [self._process(i, write=False) for i in indexes]
+
+    def reload_configs(self) -> dict[str, FabikConfig]:
+        """重新解析配置文件，返回旧的配置。"""
+        old_configs = self.configs
+        self.configs = self.fabik_file.load_configs(
+            list(self.configs), use_cache=self.use_cache
+        )
+        return old_configs
+
+    def affected(self, changed: Iterable[Path]) -> list[int]:
+        """返回受 changed 中的文件影响，需要重新渲染的任务序号。
+
+        配置文件改变时会调用 reload_configs。上一次渲染失败的任务总是需要重新渲染。
+        """
+        changed = {Path(p).absolute() for p in changed}
+        names: set[str] = set()
+        for p in changed:
+            names |= self.graph.affected_by_template(p)
+
+        if changed & {p.absolute() for p in self.config_files}:
+            old_configs = self.reload_configs()
+            for env_name, config in self.configs.items():
+                for key in diff_config_paths(old_configs[env_name], config):
+                    names |= self.graph.affected_by_key(key, env_name)
+
+        indexes = self._failed | {self._indexes[n] for n in names if n in self._indexes}
+        return sorted(indexes)
+
+    def rebuild(self, changed: Iterable[Path]) -> list[RenderResult]:
+        """仅重新渲染受 changed 中的文件影响的任务。"""
+        return self.render(self.affected(changed))
+
+    def _get_snapshot(self):
+        sources = list(self.config_files)
+        for d in self.tpl_dirs:
+            sources.extend(sorted(p for p in d.rglob("*") if p.is_file()))
+        return get_deps_snapshot(self.fabik_file.cache_dir, sources)
+
+    def load_graph(self) -> bool:
+        """从缓存中载入依赖图，缓存失效或者缺少某个任务的依赖时返回 False。"""
+        data = self._get_snapshot().load()
+        if not isinstance(data, dict) or not all(j.name in data for j in self.jobs):
+            return False
+        self.graph = DependencyGraph.from_data(
+            {n: d for n, d in data.items() if n in self._indexes}
+        )
+        return True
+
+    def save_graph(self) -> None:
+        """将依赖图保存到缓存中。"""
+        self._get_snapshot().save(self.graph.to_data())
@@ -0,0 +1,124 @@
+""".._fabik_conf_session:
+
+fabik.conf.session
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+进程内的配置会话。
+
+一个命令中多次调用 ``GlobalState.load_conf_data`` （例如检查输出路径时），
+或者渲染多个模板时，共享同一份解析结果和同一个 ConfigReplacer。
+fabik.toml 或 .fabik.env 改变（mtime/size 改变）时，会话中缓存的配置和 ConfigReplacer 全部失效；
+不同的环境使用各自的 FabikConfig。
+
+INCLUDE 片段仍然在第一次读取时载入，片段文件的改变由 :ref:`fabik_conf_watch` 处理。
+"""
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from fabik.conf.cache import file_signature
+from fabik.conf.storage import FabikConfig, FabikConfigFile
+
+if TYPE_CHECKING:
+    from fabik.conf.processor import ConfigReplacer
+
+
+class ConfigSession:
+    """缓存一个配置文件的解析结果，以及基于它创建的 ConfigReplacer。
+
+    :param fabik_file: 配置文件。
+    :param use_cache: 是否使用磁盘上的配置快照。
+    """
+
+    fabik_file: FabikConfigFile
+    use_cache: bool
+
+    parse_count: int = 0
+    """ 载入配置文件（解析或者读取快照）的次数。"""
+
+    replacer_count: int = 0
+    """ 创建 ConfigReplacer 的次数。"""
+
+    _signature: tuple | None = None
+    """ 载入时 fabik.toml 和 .fabik.env 的 (mtime_ns, size)。"""
+
+    _data: tuple[dict, dict] | None = None
+    _configs: dict[str, FabikConfig]
+    _replacers: dict[tuple, "ConfigReplacer"]
+
+    def __init__(self, fabik_file: FabikConfigFile, use_cache: bool = True):
+        self.fabik_file = fabik_file
+        self.use_cache = use_cache
+        self._configs = {}
+        self._replacers = {}
+
+    def _get_signature(self) -> tuple:
+        return (
+            file_signature(self.fabik_file.fabik_toml),
+            file_signature(self.fabik_file.fabik_env),
+        )
+
+    def invalidate(self) -> None:
+        """丢弃缓存的配置和 ConfigReplacer。"""
+        self._signature = None
+        self._data = None
+        self._configs.clear()
+        self._replacers.clear()
+
+    def _load_data(self) -> tuple[dict, dict]:
+        signature = self._get_signature()
+        if self._data is None or signature != self._signature:
+            self.invalidate()
+            self._data = self.fabik_file._load_data(self.use_cache)
+            self._signature = signature
+            self.parse_count += 1
+        return self._data
+
+    def load_config(self, env_name: str = "") -> FabikConfig:
+        """返回 env_name 的 FabikConfig，配置文件未改变时总是返回同一个对象。"""
+        root_data, env_data = self._load_data()
+        config = self._configs.get(env_name)
+        if config is None:
+            config = FabikConfig(root_data, env_data, env_name)
+            self._configs[env_name] = config
+        return config
+
+    def load_configs(self, env_names: list[str] | None = None) -> dict[str, FabikConfig]:
+        """返回多个环境的 FabikConfig，env_names 为 None 时使用 ENV 中定义的所有环境。"""
+        root_data, _ = self._load_data()
+        if env_names is None:
+            envs = root_data.get("ENV")
+            env_names = list(envs) if isinstance(envs, Mapping) else []
+        return {n: self.load_config(n) for n in env_names}
+
+    def get_replacer(
+        self,
+        fabik_config: FabikConfig,
+        work_dir: Path,
+        *,
+        output_dir: Path | None = None,
+        tpl_dir: Path | None = None,
+        verbose: bool = False,
+        replacer_class: type["ConfigReplacer"] | None = None,
+    ) -> "ConfigReplacer":
+        """返回 fabik_config 的 ConfigReplacer，相同的参数共享同一个对象。
+
+        :param replacer_class: 默认为 ConfigReplacer。
+        """
+        if replacer_class is None:
+            from fabik.conf.processor import ConfigReplacer as replacer_class
+        # replacer 持有 fabik_config 的引用，缓存期间 id 不会被复用
+        key = (replacer_class, id(fabik_config), work_dir, output_dir, tpl_dir, verbose)
+        replacer = self._replacers.get(key)
+        if replacer is None:
+            replacer = replacer_class(
+                fabik_config,
+                work_dir,
+                output_dir=output_dir,
+                tpl_dir=tpl_dir,
+                verbose=verbose,
+            )
+            self._replacers[key] = replacer
+            self.replacer_count += 1
+        return replacer
@@ -6,7 +6,9 @@ fabik.conf.storage
 fabik 配置文件读取和存储。
 """
 
+import copy
 import os
+from collections.abc import Mapping
 from pathlib import Path
 import tomllib
 from typing import Any, Union
@@ -17,52 +19,141 @@ from dotenv import dotenv_values
 import fabik
 from fabik.error import ConfigError, PathError, EnvError, echo_error
 from fabik.tpl import FABIK_ENV_FILE, FABIK_TOML_FILE
-from fabik.conf import merge_dict
+from fabik.conf.cache import ConfigSnapshot, SNAPSHOT_SUFFIX, get_cache_dir
+from fabik.conf.include import (
+    Fragment,
+    collect_fragments,
+    expand_includes,
+    find_fragments,
+    load_fragments,
+)
+from fabik.conf.view import LayeredView, set_override
 
 
 FABIK_DATA: str = "root_data"
 FABIK_ENV: str = "env_data"
 
+KeyPath = tuple[str, ...]
+""" 配置中的路径，由各级键名组成。"""
+
+_MISSING = object()
+
+
+def split_key_path(path: str) -> list[tuple[str, bool]]:
+    """将点号分隔的路径拆分为 (键名, 是否使用引号) 的列表。
+
+    使用单引号或者双引号包围的键名中可以包含点号，例如 ``'config.toml'.SQLALCHEMY`` 。
+    """
+    tokens: list[tuple[str, bool]] = []
+    i, n = 0, len(path)
+    while i < n:
+        if path[i] in "'\"":
+            end = path.find(path[i], i + 1)
+            if end < 0:
+                raise ConfigError(
+                    err_type=ValueError(), err_msg=f"Unclosed quote in key path {path!r}."
+                )
+            tokens.append((path[i + 1 : end], True))
+            i = end + 1
+            if i < n and path[i] != ".":
+                raise ConfigError(
+                    err_type=ValueError(), err_msg=f"Invalid key path {path!r}."
+                )
+            i += 1
+        else:
+            end = path.find(".", i)
+            end = n if end < 0 else end
+            tokens.append((path[i:end], False))
+            i = end + 1
+    return tokens
+
+
+def resolve_key_path(data: Any, tokens: list[tuple[str, bool]]) -> KeyPath:
+    """根据 data 中存在的键名，将 split_key_path 的结果转换为键名元组。
+
+    不使用引号的连续键名优先匹配 data 中存在的最长的键名，都不存在时使用单个键名。
+    """
+    keys: list[str] = []
+    i = 0
+    while i < len(tokens):
+        size = 1
+        if not tokens[i][1] and isinstance(data, Mapping):
+            # 不使用引号的连续键名
+            j = i
+            while j < len(tokens) and not tokens[j][1]:
+                j += 1
+            for size in range(j - i, 0, -1):
+                if ".".join(t for t, _ in tokens[i : i + size]) in data:
+                    break
+        key = ".".join(t for t, _ in tokens[i : i + size])
+        keys.append(key)
+        data = data.get(key) if isinstance(data, Mapping) else None
+        i += size
+    return tuple(keys)
+
 
 class FabikConfig:
-    """处理 FABIK 配置的值。"""
+    """处理 FABIK 配置的值。
+
+    配置的值由多个层叠加而成，读取时才合并，不复制任何数据（见 :ref:`fabik_conf_view` ）：
+
+    - root_data: fabik.toml → .fabik.env 中的 NO_NAME_VAR → setcfg 写入的值
+    - env_data: 系统环境变量中以项目名称开头的变量 → .fabik.env → setcfg 写入的值
+    - 配置模板的值: root_data 中的表 → ENV.<env_name> 中的同名表，见 ConfigReplacer.get_tpl_value
+    """
 
     __project_name: str
     """ 项目名称。"""
 
-    root_data: dict[str, Any]
-    """ 保存 FABIK_TOML_FILE 中载入的配置。"""
+    root_data: LayeredView
+    """ FABIK_TOML_FILE 中载入的配置与 FABIK_ENV_FILE 中的 NO_NAME_VAR 叠加的只读视图。"""
 
-    env_data: dict[str, Any]
-    """ 存储 FABIK_ENV_FILE 文件中载入的配置。"""
+    env_data: Mapping[str, Any]
+    """ 系统环境变量与 FABIK_ENV_FILE 文件中载入的配置叠加的只读视图。"""
     
     env_name: str = ""
     """ 存储命令行传递的 env 参数。"""
-    
-    envs: dict[str, dict[str, Any]]| None = None
+
+    _overrides: dict[str, Any]
+    """ setcfg 写入的值，位于 root_data 的最上层。"""
+
+    _env_overrides: dict[str, Any]
+    """ setcfg 写入的值，位于 env_data 的最上层。"""
+
+    _path_keys: dict[str, "KeyPath"]
+    """ compile_path 的缓存，路径字符串 -> 键名元组。"""
+
+    _path_values: dict["KeyPath", Any]
+    """ path 的缓存，键名元组 -> 值。"""
     
 
     def __init__(
         self,
-        root_data: dict | None = None,
-        env_data: dict | None = None,
+        root_data: Mapping | None = None,
+        env_data: Mapping | None = None,
         env_name: str  = ""
     ):
         """接受配置文件的 值
-        :param cfg: 配置文件路径
+
+        root_data 和 env_data 不会被复制或者修改，多个 FabikConfig 可以共享同一份数据。
         """
-        self.root_data = root_data or {}
-        self.env_data = env_data or {}
         self.env_name = env_name
-        
-        self._update_root_env_data()
-        self.envs = self.root_data.get('ENV', None)
-        
+        self._overrides = {}
+        self._env_overrides = {}
+        self._path_keys = {}
+        self._path_values = {}
+        self._update_root_env_data(root_data or {}, env_data or {})
+
     @property
     def NAME(self) -> str:
         """ 配置中的 NAME"""
         return self.__project_name
 
+    @property
+    def envs(self) -> Mapping[str, Any] | None:
+        """ 配置中的 ENV，包括 setcfg 写入的值。"""
+        return self.root_data.get('ENV', None)
+
     @property
     def WORK_DIR(self) -> str | None:
         """ 配置中的 WORK_DIR"""
@@ -73,29 +164,31 @@ class FabikConfig:
         """ 配置中的 TPL_DIR"""
         return self._get_path_str('TPL_DIR')
     
-    def _update_root_env_data(self):
-        """ 将环境配置的 NO_NAME_VAR 值合并到 root_data 中，
-        将环境配置的值覆盖同名，环境变量的值覆盖配置的值，保存到 env_data 中。
+    def _update_root_env_data(self, root_data: Mapping, env_data: Mapping):
+        """ 将环境配置的 NO_NAME_VAR 值叠加到 root_data 之上，
+        将环境配置的值叠加到环境变量之上，保存到 env_data 中。
         NO_NAME_VAR: 不以项目名称值开头的环境变量。
         """
         # 获取项目名称（优先从环境配置获取）
-        self.__project_name = self.env_data.get("NAME", self.root_data.get("NAME", fabik.__name__))
+        self.__project_name = env_data.get("NAME", root_data.get("NAME", fabik.__name__))
         
-        # 将NO_NAME_VAR 并入 root_data
+        # NO_NAME_VAR 叠加在 root_data 之上
         name_prefix = f"{self.__project_name.upper()}_"
         non_name_vars = {
-            k: v for k, v in self.env_data.items() if not k.startswith(name_prefix)
+            k: v for k, v in env_data.items() if not k.startswith(name_prefix)
         }
 
-        # 合并配置：环境配置覆盖 TOML 配置中的同名键，仅限 NO_NAME_VAR
-        self.root_data = merge_dict(self.root_data, non_name_vars)
+        # 环境配置覆盖 TOML 配置中的同名键，仅限 NO_NAME_VAR；setcfg 的值覆盖所有的层
+        self.root_data = LayeredView(root_data, non_name_vars, self._overrides)
 
         # 获取系统环境变量，仅处理以项目名称开头的环境变量
         fabik_env_var_in_os_environ = {
-            k: v for k, v in dict(os.environ).items() if k.startswith(name_prefix)
+            k: v for k, v in os.environ.items() if k.startswith(name_prefix)
         }
-        # 合并配置：  以 env_data 中的值作为基础，env_data 中的值覆盖系统环境变量中的同名值
-        self.env_data = merge_dict(fabik_env_var_in_os_environ, self.env_data)
+        # env_data 中的值覆盖系统环境变量中的同名值
+        self.env_data = LayeredView(
+            fabik_env_var_in_os_environ, env_data, self._env_overrides
+        )
 
     def _get_path_str(self, var_name: str) -> str | None:
         """ 获取配置中的路径变量的绝对路径字符串形式 """
@@ -114,7 +207,7 @@ class FabikConfig:
     def check_env_name(self):
         """仅在 env_name 有效时，才会检查 envs 的值。"""
         if self.env_name:
-            if not self.envs or not isinstance(self.envs, dict):
+            if not self.envs or not isinstance(self.envs, Mapping):
                 raise EnvError(err_type=TypeError(), err_msg="envs must be a dict.")
             if self.env_name not in self.envs:
                 raise EnvError(
@@ -133,47 +226,138 @@ class FabikConfig:
             return env_obj
         return env_obj.get(key, default_value)
 
+    def get_fragments(self, *keys: str) -> list[Fragment]:
+        """返回读取 keys 以及 ENV.<env_name>.<key> 时需要载入的片段，不会载入它们。
+
+        见 :ref:`fabik_conf_include` 。
+        """
+        paths: list[KeyPath] = [(k,) for k in keys]
+        if self.env_name:
+            paths.append(("ENV", self.env_name))
+            paths.extend(("ENV", self.env_name, k) for k in keys)
+        return collect_fragments(self.root_data, paths)
+
+    def preload(self, *keys: str, max_workers: int | None = None) -> None:
+        """并行载入读取 keys 时需要的片段，片段在第一次读取时也会自动载入。"""
+        load_fragments(self.get_fragments(*keys), max_workers)
+
+    @property
+    def include_files(self) -> list[Path]:
+        """INCLUDE 中定义的所有片段文件。"""
+        return [f.file for f in find_fragments(self.root_data.layers[0])]
+
     def getcfg(
-        self, *args, default_value: Any = None, data: str | dict = FABIK_DATA
+        self, *args, default_value: Any = None, data: str | Mapping = FABIK_DATA
     ) -> Any:
         """递归获取 conf 中的值。getcfg 不仅可用于读取 config.toml 的值，还可以通过传递 data 用于读取任何字典的值。
 
+        返回的表可能是只读的 LayeredView，需要 dict 时使用 materialize 转换。
+
         :param args: 需要读取的参数，支持多级调用，若级不存在，不会报错。
         :param default_value: 找不到这个键就提供一个默认值。
         :param data: 提供一个 dict，否则使用 cfg_data。
         :return: 获取的配置值
         """
         if data == FABIK_DATA:
-            data = self.root_data or {}
+            data = self.root_data
         elif data == FABIK_ENV:
-            data = self.env_data or {}
-        if args and isinstance(data, dict):
-            cur_data = data.get(args[0], default_value)
-            return self.getcfg(*args[1:], default_value=default_value, data=cur_data)
+            data = self.env_data
+        # 逐级查找，与递归调用的结果相同：遇到非表的值时直接返回它
+        for arg in args:
+            if not isinstance(data, Mapping):
+                break
+            data = data.get(arg, default_value)
         return data
 
+    def compile_path(self, path: str) -> KeyPath:
+        """将点号分隔的路径转换为键名元组，结果被缓存。
+
+        键名中可以包含点号：使用引号包围键名（例如 ``'config.toml'.SQLALCHEMY.URI`` ），
+        或者不使用引号，此时优先匹配 root_data 中存在的最长的键名（例如 ``config.toml.SQLALCHEMY.URI`` ）。
+        """
+        keys = self._path_keys.get(path)
+        if keys is None:
+            keys = resolve_key_path(self.root_data, split_key_path(path))
+            self._path_keys[path] = keys
+        return keys
+
+    def path(self, path: str | KeyPath, default_value: Any = None) -> Any:
+        """读取 root_data 中的值，与 getcfg 相同，但解析后的路径和读取的值都被缓存。
+
+        setcfg 会使受影响的缓存失效。中间的值不是表时，视为找不到这个键。
+
+        :param path: 点号分隔的路径（见 compile_path），或者键名元组。
+        :param default_value: 找不到这个键就提供一个默认值。
+        """
+        keys = path if isinstance(path, tuple) else self.compile_path(path)
+        value = self._path_values.get(keys, _MISSING)
+        if value is _MISSING:
+            value = self.root_data
+            for k in keys:
+                if not isinstance(value, Mapping) or k not in value:
+                    value = _MISSING
+                    break
+                value = value[k]
+            self._path_values[keys] = value
+        return default_value if value is _MISSING else value
+
+    def __getstate__(self) -> dict[str, Any]:
+        # path 的缓存使用 _MISSING 记录找不到的键，_MISSING 在其他进程中不是同一个对象，不能序列化
+        state = self.__dict__.copy()
+        state["_path_values"] = {}
+        return state
+
+    def _invalidate_path(self, keys: KeyPath) -> None:
+        """使 keys 的祖先、自身和后代的缓存失效。"""
+        n = len(keys)
+        for cached in [
+            k for k in self._path_values if k[:n] == keys or keys[: len(k)] == k
+        ]:
+            del self._path_values[cached]
+        # 新增的键可能改变不带引号的路径的解析结果
+        if self.getcfg(*keys) is None:
+            self._path_keys.clear()
+
     def setcfg(self, *args, value: Any, data: str | dict = FABIK_DATA) -> None:
         """递归设置 conf 中的值。setcfg 不仅可用于设置 config.toml 的值，还可以通过传递 data 用于读取任何字典的值。
 
+        设置 root_data 和 env_data 时，值被写入最上层的覆盖层，不会修改载入的配置数据。
+        与直接修改 dict 相同，值替换原来的值：值为 None 时也会替换，值为表时替换整个表，见 set_override。
+
         :param args: 需要设置的参数，支持多级调用，若级不存在，会自动创建一个内缪的 dict。
         :param data: 提供一个 dict，否则使用 cfg_data。
         :param value: 需要设置的值。
         """
         if data == FABIK_DATA:
-            data = self.root_data or {}
+            self._invalidate_path(tuple(args))
+            set_override(self._overrides, args, value)
         elif data == FABIK_ENV:
-            data = self.env_data or {}
-        if args and isinstance(data, dict):
+            set_override(self._env_overrides, args, value)
+        elif args and isinstance(data, dict):
             arg0 = args[0]
             if len(args) > 1:
                 cur_data = data.get(arg0)
-                if cur_data is None:
+                if not isinstance(cur_data, dict):
                     cur_data = {}
                     data[arg0] = cur_data
                 self.setcfg(*args[1:], value=value, data=cur_data)
             else:
                 data[arg0] = value
 
+    def with_overrides(self, overrides: Mapping[str, Any]) -> "FabikConfig":
+        """返回一个共享配置数据的新 FabikConfig，overrides 中的值覆盖 root_data 以及
+        ENV.<env_name> 中的同名值。
+
+        overrides 中的表与原来的表递归合并，不会修改当前的 FabikConfig。
+        overrides 位于新 FabikConfig 的覆盖层中，也会覆盖 .fabik.env 中的 NO_NAME_VAR。
+        """
+        config = FabikConfig(self.root_data, self.env_data, self.env_name)
+        # 复制一份，在新 FabikConfig 上调用 setcfg 不会修改 overrides
+        config._overrides.update(copy.deepcopy(dict(overrides)))
+        if self.env_name:
+            config._overrides["ENV"] = {self.env_name: copy.deepcopy(dict(overrides))}
+        return config
+
     def __repr__(self) -> str:
         return f"""{self.__class__.__name__}
         ({self.__project_name=!s}, 
@@ -246,8 +430,47 @@ class FabikConfigFile:
         """返回配置文件 FABIK_TOML 是否存在。"""
         return self.fabik_toml.exists() and self.fabik_env.exists()
 
-    def load_config(self, env_name: str="") -> FabikConfig:
-        """获取主配置文件并合并环境配置"""
+    @property
+    def cache_dir(self) -> Path:
+        """返回缓存文件夹路径。"""
+        return get_cache_dir(self.getdir())
+
+    def get_snapshot(self) -> ConfigSnapshot:
+        """返回主配置文件的快照对象。
+
+        环境配置文件不使用快照：它的值由 dotenv 展开了系统环境变量，系统环境变量改变时快照无法感知。
+        """
+        return ConfigSnapshot(
+            self.cache_dir.joinpath(f"{self.fabik_toml.name}{SNAPSHOT_SUFFIX}"),
+            [self.fabik_toml],
+        )
+
+    def load_config(self, env_name: str = "", use_cache: bool = True) -> FabikConfig:
+        """获取主配置文件并合并环境配置
+
+        :param env_name: 环境名称。
+        :param use_cache: 是否使用配置快照，源文件改变时快照会自动重建。
+        """
+        root_data, env_data = self._load_data(use_cache)
+        return FabikConfig(root_data, env_data, env_name)
+
+    def load_configs(
+        self, env_names: list[str] | None = None, use_cache: bool = True
+    ) -> dict[str, FabikConfig]:
+        """仅解析一次配置文件，为多个环境分别创建 FabikConfig。
+
+        :param env_names: 环境名称列表，为 None 时使用 ENV 中定义的所有环境。
+        :param use_cache: 是否使用配置快照。
+        """
+        root_data, env_data = self._load_data(use_cache)
+        if env_names is None:
+            envs = root_data.get("ENV")
+            env_names = list(envs) if isinstance(envs, Mapping) else []
+        # 所有环境共享同一份数据，setcfg 仅写入每个 FabikConfig 自己的覆盖层
+        return {n: FabikConfig(root_data, env_data, n) for n in env_names}
+
+    def _load_data(self, use_cache: bool = True) -> tuple[dict, dict]:
+        """从快照或者配置文件中载入 (root_data, env_data)。"""
         # 检查两个文件必须同时存在
         if not self.file_exists:
             missing_files = [
@@ -258,8 +481,34 @@ class FabikConfigFile:
                 err_msg=f"Required config files not found: {missing_files!s}",
             )
 
-        root_data = {}
-        env_data = {}
+        if not use_cache:
+            return self._parse_config(use_cache=False)
+
+        snapshot = self.get_snapshot()
+        root_data = snapshot.load()
+        if root_data is None:
+            signatures = snapshot.collect_signatures()
+            root_data = self._parse_toml()
+            snapshot.save(root_data, signatures)
+        # 环境配置文件很小，每次都重新解析
+        return root_data, self._parse_env()
+
+    def _parse_config(self, use_cache: bool = True) -> tuple[dict, dict]:
+        """解析主配置文件和环境配置文件，返回 (root_data, env_data)。
+
+        NO_NAME_VAR 由 FabikConfig 叠加到 root_data 之上，这里不做合并。
+
+        :param use_cache: 片段文件是否使用快照。
+        """
+        return self._parse_toml(use_cache), self._parse_env()
+
+    def _parse_toml(self, use_cache: bool = True) -> dict:
+        """解析主配置文件。
+
+        INCLUDE 中的片段文件不会被解析，见 :ref:`fabik_conf_include` 。
+
+        :param use_cache: 片段文件是否使用快照。
+        """
         try:
             root_data = tomllib.loads(self.fabik_toml.read_text(encoding="utf-8"))
         except FileNotFoundError as e:
@@ -269,7 +518,15 @@ class FabikConfigFile:
                 err_type=e,
                 err_msg=f"Decode {self.fabik_toml} error: {e}",
             )
-
+        expand_includes(
+            root_data,
+            self.fabik_toml.parent,
+            self.cache_dir if use_cache else None,
+        )
+        return root_data
+
+    def _parse_env(self) -> dict:
+        """解析环境配置文件，其中的 ``${VAR}`` 使用当前的系统环境变量展开。"""
         try:
             # 使用 dotenv_values 读取 .env 格式文件
             env_data = dotenv_values(self.fabik_env) or {}
@@ -280,19 +537,7 @@ class FabikConfigFile:
                 err_type=e,
                 err_msg=f"Load {self.fabik_env} error: {e}",
             )
-
-        # 获取项目名称（优先从环境配置获取）
-        project_name = env_data.get("NAME", root_data.get("NAME", fabik.__name__))
-
-        # 将不以项目名称值开头的环境变量 (NO_NAME_VAR) 并入 root_data
-        name_prefix = f"{project_name.upper()}_"  # pyright: ignore[reportOptionalMemberAccess]
-        non_name_vars = {
-            k: v for k, v in env_data.items() if not k.startswith(name_prefix)
-        }
-
-        # 合并配置：环境配置覆盖 TOML 配置中的同名键
-        root_data = merge_dict(root_data, non_name_vars)
-        return FabikConfig(root_data, env_data, env_name)
+        return env_data
 
     def getdir(self, *args, work_dir: Path | None = None) -> Path:
         """基于当前项目的运行文件夹，返回一个 pathlib.Path 对象
@@ -0,0 +1,158 @@
+""".._fabik_conf_view:
+
+fabik.conf.view
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+多个配置层叠加的只读视图。
+
+LayeredView 与 :func:`fabik.conf.merge_dict` 的合并规则相同，但不复制任何数据：
+读取某个键时才在各层中查找，嵌套的表返回新的 LayeredView，
+只有一层包含这个表时直接返回原始的 dict。
+
+覆盖层（见 :func:`set_override` ）中的值使用 :class:`Replaced` 包装时，直接替换下层的值。
+"""
+
+from collections.abc import Iterator, Mapping
+from typing import Any
+
+
+class Replaced:
+    """覆盖层中的值，直接替换下层的值：值为 None 时也替换，值为表时不与下层的表合并。"""
+
+    __slots__ = ("value",)
+
+    value: Any
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.value!r})"
+
+
+class OverrideTable(dict):
+    """覆盖层中的表，其中可能包含 Replaced 的值，LayeredView 总是将它包装为视图返回。"""
+
+
+class LayeredView(Mapping):
+    """只读的配置视图，后面的层覆盖前面的层。
+
+    合并规则与 merge_dict 相同：
+
+    1. 值为 None 时不覆盖下层的值。
+    2. 上层的值与下层的值都是表时，递归合并。
+    3. 其他情况下，上层的值直接覆盖下层的值。
+    4. 使用 Replaced 包装的值直接替换下层的值，不遵守 1 和 2。
+
+    :param layers: 从低到高排列的配置层，不是 Mapping 的层被忽略。
+    """
+
+    __slots__ = ("_layers",)
+
+    _layers: tuple[Mapping, ...]
+
+    def __init__(self, *layers: Any):
+        self._layers = tuple(layer for layer in layers if isinstance(layer, Mapping))
+
+    @property
+    def layers(self) -> tuple[Mapping, ...]:
+        return self._layers
+
+    def __getitem__(self, key: Any) -> Any:
+        found = False
+        value = None
+        tables: list[Mapping] = []
+        for layer in reversed(self._layers):
+            if key not in layer:
+                continue
+            v = layer[key]
+            replaced = isinstance(v, Replaced)
+            if replaced:
+                v = v.value
+            if not found:
+                found = True
+                value = v
+            if v is None:
+                if replaced:
+                    break
+                continue
+            if not isinstance(v, Mapping):
+                if not tables:
+                    return v
+                # 非表的值覆盖了它之下的所有的层
+                break
+            tables.append(v)
+            if replaced:
+                break
+        if not found:
+            raise KeyError(key)
+        if not tables:
+            return value
+        if len(tables) == 1:
+            if isinstance(tables[0], OverrideTable):
+                return LayeredView(tables[0])
+            return tables[0]
+        tables.reverse()
+        return LayeredView(*tables)
+
+    def __iter__(self) -> Iterator:
+        if len(self._layers) == 1:
+            return iter(self._layers[0])
+        # 保持与 merge_dict 相同的顺序：先是底层的键，然后是上层新增的键
+        keys: dict = {}
+        for layer in self._layers:
+            keys.update(dict.fromkeys(layer))
+        return iter(keys)
+
+    def __len__(self) -> int:
+        if len(self._layers) == 1:
+            return len(self._layers[0])
+        keys: set = set()
+        for layer in self._layers:
+            keys.update(layer)
+        return len(keys)
+
+    def __contains__(self, key: object) -> bool:
+        return any(key in layer for layer in self._layers)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({materialize(self)!r})"
+
+    def __reduce__(self):
+        return (self.__class__, self._layers)
+
+
+def set_override(layer: dict, keys: tuple[str, ...], value: Any) -> None:
+    """在覆盖层中设置 keys 对应的值，替换下层的值。
+
+    与直接修改 dict 相同：值为 None 时也会替换下层的值，值为表时替换整个表，不与下层的表合并。
+    中间的表不存在时自动创建，中间的表与下层的表合并。
+
+    :param layer: 覆盖层，位于 LayeredView 的最上层。
+    """
+    if not keys:
+        return
+    for key in keys[:-1]:
+        current = layer.get(key)
+        replaced = isinstance(current, Replaced)
+        if replaced:
+            current = current.value
+        if not isinstance(current, OverrideTable):
+            current = OverrideTable(current if isinstance(current, Mapping) else {})
+            layer[key] = Replaced(current) if replaced else current
+        layer = current
+    if value is None or isinstance(value, Mapping):
+        value = Replaced(OverrideTable(value) if isinstance(value, Mapping) else None)
+    layer[keys[-1]] = value
+
+
+def materialize(value: Any) -> Any:
+    """将 Mapping（包括 LayeredView）递归转换为 dict，list 被复制，其他值保持不变。
+
+    仅在需要一个真正的 dict 时调用（例如写入文件或者传递给第三方库）。
+    """
+    if isinstance(value, Mapping):
+        return {k: materialize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [materialize(v) for v in value]
+    return value
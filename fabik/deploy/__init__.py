@@ -4,20 +4,36 @@ fabik.deploy
 ~~~~~~~~~~~~~~~~~~~
 
 封装 fabric 的功能，提供远程部署能力。
+
+SSH 连接在第一次执行远程命令时才建立。 ``conn.run`` 、 ``conn.put`` 以及 rsync 共享同一个
+paramiko Transport：rsync 通过 :ref:`fabik_util_channel` 在这个连接的新 channel 中执行远程命令，
+一次部署仅需要一次 SSH 握手和认证（包括跳板机）。
+
+远程文件的存在性和元数据通过 :meth:`Deploy.probe` 在一次远程调用中批量获取，
+结果在 Deploy 对象的生命周期中缓存，写入远程文件的方法会使相应的缓存失效。
+互相独立的远程操作（例如创建部署需要的所有文件夹）使用 :class:`RemotePlan` 合并为一次远程调用。
 """
 
 import re
+import shlex
+import socket
 import sys
 import logging
 import json
+import posixpath
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
 from datetime import datetime
-from pathlib import Path
+from pathlib import Path, PurePath, PurePosixPath
 
 from invoke import runners
 from fabric.connection import Connection
 from invoke.exceptions import Exit
 
 from fabik.conf import ConfigReplacer, FabikConfig
+from fabik.tpl import FABIK_CACHE_DIR, FABIK_MANIFEST_FILE
+from fabik.util.channel import ChannelRelay
 
 logger = logging.Logger("fabric", level=logging.DEBUG)
 logger.addHandler(logging.StreamHandler(sys.stdout))
@@ -32,6 +48,7 @@ def rsync(
     strict_host_keys: bool = True,
     rsync_opts: str = "",
     ssh_opts: str = "",
+    rsh: str | None = None,
 ):
     """
     Convenient wrapper around your friendly local ``rsync``.
@@ -97,6 +114,10 @@ def rsync(
     :param str ssh_opts:
         Like ``rsync_opts`` but specifically for the SSH options string
         (rsync's ``--rsh`` flag.)
+    :param str rsh:
+        Use this program as rsync's ``--rsh`` instead of ``ssh``, e.g.
+        `~fabik.util.channel.ChannelRelay.rsh`. The SSH key, port and
+        ``ssh_opts`` options are ignored.
     """
     # Turn single-string exclude into a one-item list for consistency
     if isinstance(exclude, str):
@@ -131,7 +152,9 @@ def rsync(
     if not strict_host_keys and disable_keys not in ssh_opts:
         ssh_opts += f" {disable_keys}"
     rsh_parts = [key_string, port_string, ssh_opts]
-    if any(rsh_parts):
+    if rsh is not None:
+        rsh_string = "--rsh={}".format(shlex.quote(rsh))
+    elif any(rsh_parts):
         rsh_string = "--rsh='ssh {}'".format(" ".join(rsh_parts))
     # Set up options part of string
     options_map = {
@@ -153,6 +176,129 @@ def rsync(
     return c.local(cmd)
 
 
+@dataclass
+class RemoteStat:
+    """远程路径的探测结果，符号链接被跟随。"""
+
+    path: str
+    exists: bool
+    type: str = ""
+    """ file/dir/other，不存在时为空字符串。"""
+    size: int | None = None
+    mtime: int | None = None
+    sha256: str | None = None
+    """ 仅在探测时要求计算 hash 并且 path 是文件时才有值。"""
+
+
+# 每个路径输出一行：不存在时为 -，否则为 类型 大小 mtime sha256（没有计算时为 -）
+# stat -c 用于 GNU，stat -f 用于 BSD/macOS
+PROBE_FUNCTION = r"""fabik_probe() {
+if [ ! -e "$1" ]; then echo -; return; fi
+if [ -d "$1" ]; then t=dir; elif [ -f "$1" ]; then t=file; else t=other; fi
+s=$(stat -L -c '%s %Y' "$1" 2>/dev/null || stat -L -f '%z %m' "$1" 2>/dev/null || echo '- -')
+h=
+if [ "$2" = 1 ] && [ "$t" = file ]; then
+h=$( (sha256sum "$1" 2>/dev/null || shasum -a 256 "$1" 2>/dev/null) | cut -d ' ' -f 1)
+fi
+echo "$t $s ${h:--}"
+}"""
+
+
+def _parse_probe_line(path: str, line: str) -> RemoteStat:
+    parts = line.split()
+    if len(parts) != 4:
+        return RemoteStat(path, False)
+    type_, size, mtime, sha256 = parts
+    return RemoteStat(
+        path,
+        True,
+        type_,
+        int(size) if size.isdigit() else None,
+        int(mtime) if mtime.isdigit() else None,
+        None if sha256 == "-" else sha256,
+    )
+
+
+class RemotePlan:
+    """将互相独立的远程 shell 操作合并为一次远程调用。
+
+    所有的文件夹合并为一个幂等的 ``mkdir -p`` ，在其他操作之前执行，probe 缓存中已经存在的文件夹被跳过；
+    其他操作按照加入的顺序执行，任一操作失败时停止（ ``set -e`` ）。 ::
+
+        plan = deploy.plan()
+        plan.mkdir(deploy.get_remote_path('logs'), deploy.get_remote_path('output'))
+        plan.remove(deploy.get_remote_path('uwsgi.pid'))
+        plan.execute()
+    """
+
+    deploy: "Deploy"
+    dirs: list[str]
+    """ 需要创建的文件夹。"""
+    commands: list[str]
+    """ 其他操作的命令。"""
+    touched: list[str]
+    """ 执行之后 probe 缓存失效的路径。"""
+
+    def __init__(self, deploy: "Deploy"):
+        self.deploy = deploy
+        self.dirs = []
+        self.commands = []
+        self.touched = []
+
+    def __len__(self) -> int:
+        return len(self.commands) + (1 if self.dirs else 0)
+
+    def mkdir(self, *dirs) -> "RemotePlan":
+        """创建文件夹，包括不存在的上级文件夹。"""
+        for d in dirs:
+            d = self.deploy._normalize_remote_path(d)
+            stat = self.deploy._probe_cache.get(d)
+            if (stat is None or stat.type != "dir") and d not in self.dirs:
+                self.dirs.append(d)
+        return self
+
+    def run(self, command: str, invalidate=()) -> "RemotePlan":
+        """加入一个命令。
+
+        :param invalidate: 这个命令改变的远程路径。
+        """
+        self.commands.append(command)
+        self.touched.extend(self.deploy._normalize_remote_path(f) for f in invalidate)
+        return self
+
+    def remove(self, *files) -> "RemotePlan":
+        """删除文件，文件不存在时不报错。"""
+        paths = [self.deploy._normalize_remote_path(f) for f in files]
+        return self.run("rm -f " + " ".join(f'"$(echo {p})"' for p in paths), paths)
+
+    def get_command(self) -> str:
+        lines = ["set -e"]
+        if self.dirs:
+            lines.append("mkdir -p " + " ".join(f'"$(echo {d})"' for d in self.dirs))
+        lines.extend(self.commands)
+        return "\n".join(lines)
+
+    def execute(self):
+        """在一次远程调用中执行所有的操作，没有操作时不执行远程调用。
+
+        :return: 远程调用的结果，没有操作时为 None。
+        """
+        if not self:
+            return None
+        self.deploy.check_remote_conn()
+        command = self.get_command()
+        logger.info("执行远程操作 %s", command)
+        result = self.deploy.conn.run(command, hide=True, warn=True)
+        dirs, touched = self.dirs, self.touched
+        self.dirs, self.commands, self.touched = [], [], []
+        self.deploy.invalidate(*dirs, *touched)
+        if not result.ok:
+            raise Exit(f"执行远程操作失败：{result.stderr}")
+        for d in dirs:
+            self.deploy._probe_cache[d] = RemoteStat(d, True, "dir")
+        return result
+
+
 class Deploy:
     fabik_conf: FabikConfig
     work_dir: Path
@@ -162,6 +308,22 @@ class Deploy:
     pye: str
     replacer: ConfigReplacer
 
+    share_connection: bool = True
+    """ rsync 是否使用 conn 的 SSH 连接，来自 RSYNC_SHARE_CONNECTION 配置。"""
+
+    _probe_cache: dict[str, RemoteStat]
+    """ probe 的结果缓存，远程路径 -> RemoteStat。"""
+
+    name: str = ""
+    """ 服务器的名称，见 FABRIC.hosts。"""
+
+    config_files: dict[str, str] = {
+        ".env": ".env",
+        "gunicorn.conf.py": "gunicorn.conf.py",
+        "config.toml": "config.toml",
+    }
+    """ put_config 默认上传的配置文件。"""
+
     def __init__(
         self,
         fabik_conf: FabikConfig,
@@ -174,8 +336,10 @@ class Deploy:
         self.work_dir = Path(work_dir)
         self.conn = conn
         self.verbose = verbose
+        self._probe_cache = {}
 
-        self.pye = fabik_conf.getcfg('PYE')
+        self.pye = fabik_conf.path('PYE')
+        self.share_connection = bool(fabik_conf.path("RSYNC_SHARE_CONNECTION", True))
         
         fabik_conf.check_env_name()
         # 传递空的环境数据，因为 Deploy 类目前不支持环境配置
@@ -193,24 +357,70 @@ class Deploy:
     def get_remote_path(self, *args) -> str:
         return self.replacer.deploy_dir.joinpath(*args).as_posix()
 
+    @staticmethod
+    def _normalize_remote_path(file) -> str:
+        # 远程路径不能使用 resolve，否则本地的符号链接会被应用到远程路径上
+        if isinstance(file, PurePath):
+            file = PurePosixPath(file.as_posix()).as_posix()
+        return str(file)
+
+    def probe(self, *files, hash: bool = False) -> dict[str, RemoteStat]:
+        """在一次远程调用中获取多个远程路径的存在性、类型、大小和 mtime。
+
+        结果被缓存，仅探测缓存中没有的路径。路径中的变量由远程 shell 展开，与 ``echo`` 相同。
+
+        :param hash: 是否计算文件的 sha256。
+        :return: 路径 -> RemoteStat，包括缓存中的路径。
+        """
+        paths = list(dict.fromkeys(self._normalize_remote_path(f) for f in files))
+        pending = [
+            p
+            for p in paths
+            if p not in self._probe_cache
+            or (
+                hash
+                and self._probe_cache[p].type == "file"
+                and self._probe_cache[p].sha256 is None
+            )
+        ]
+        if pending:
+            self.check_remote_conn()
+            flag = "1" if hash else "0"
+            lines = [PROBE_FUNCTION]
+            lines.extend(f'fabik_probe "$(echo {p})" {flag}' for p in pending)
+            command = "\n".join(lines)
+            logger.info("probe %s", pending)
+            result = self.conn.run(command, hide=True, warn=True)
+            output = result.stdout.splitlines() if result.ok else []
+            if len(output) != len(pending):
+                raise Exit(f"探测远程文件失败：{result.stderr}")
+            for p, line in zip(pending, output):
+                self._probe_cache[p] = _parse_probe_line(p, line)
+        return {p: self._probe_cache[p] for p in paths}
+
+    def invalidate(self, *files) -> None:
+        """远程文件改变之后，丢弃 files 以及它们之下的路径的 probe 缓存，不提供 files 时丢弃全部缓存。"""
+        if not files:
+            self._probe_cache.clear()
+            return
+        for f in files:
+            f = self._normalize_remote_path(f).rstrip("/")
+            for p in list(self._probe_cache):
+                if p == f or p.startswith(f + "/"):
+                    del self._probe_cache[p]
+
     def remote_exists(self, file):
         """是否存在远程文件 file"""
-        self.check_remote_conn()
-        # files.exists 仅接受字符串
-        if isinstance(file, Path):
-            file = file.resolve().as_posix()
-        command = f'test -e "$(echo {file})"'
-        logger.info(f"{command=}")
-        return self.conn.run(command, hide=True, warn=True).ok
+        path = self._normalize_remote_path(file)
+        return self.probe(path)[path].exists
+
+    def plan(self) -> RemotePlan:
+        """创建一个 RemotePlan，合并多个远程操作。"""
+        return RemotePlan(self)
 
     def make_remote_dir(self, *args):
         """创建部署文件夹"""
-        self.check_remote_conn()
-        remotedir = self.get_remote_path(*args)
-        if not self.remote_exists(remotedir):
-            command = "mkdir %s" % remotedir
-            logger.info("创建远程文件夹 %s", command)
-            self.conn.run(command)
+        self.plan().mkdir(self.get_remote_path(*args)).execute()
 
     def cat_remote_file(self, *args):
         """使用 cat 命令获取远程文件的内容"""
@@ -246,16 +456,26 @@ class Deploy:
             return None
         return re.split(r"\s+", result.stdout)[1]
 
-    def init_remote_dir(self, deploy_dir):
-        """创建远程服务器的运行环境"""
-        deploy_dir_path = Path(deploy_dir)
-        for d in [
-            self.replacer.deploy_dir,
-            deploy_dir,
-            deploy_dir_path.joinpath("logs"),
-            deploy_dir_path.joinpath("output"),
-        ]:
-            self.make_remote_dir(d)
+    def get_remote_dirs(self, deploy_dir=None, files=None) -> list[str]:
+        """返回部署需要的所有远程文件夹。
+
+        包括部署文件夹（也是 venv 的上级文件夹）、logs、output 以及配置文件所在的子文件夹。
+
+        :param deploy_dir: 默认为 DEPLOY_DIR。
+        :param files: 配置文件，默认为 config_files。
+        """
+        root = self.get_remote_path()
+        deploy_dir = root if deploy_dir is None else self._normalize_remote_path(deploy_dir)
+        dirs = [root, deploy_dir, f"{deploy_dir}/logs", f"{deploy_dir}/output"]
+        for name in self.config_files if files is None else files:
+            parent = posixpath.dirname(name)
+            if parent:
+                dirs.append(self.get_remote_path(parent))
+        return list(dict.fromkeys(dirs))
+
+    def init_remote_dir(self, deploy_dir=None, files=None):
+        """创建远程服务器的运行环境，所有的文件夹在一个 ``mkdir -p`` 中创建。"""
+        self.plan().mkdir(*self.get_remote_dirs(deploy_dir, files)).execute()
 
     def source_venv(self):
         remote_venv_dir = self.get_remote_path("venv")
@@ -273,6 +493,7 @@ class Deploy:
             raise Exit(f"Python 可执行文件 {self.pye} 未找到或未安装")
 
         # 创建虚拟环境（如果不存在）
+        self.probe(remote_venv_dir, self.get_remote_path(requirements_file_name))
         if not self.remote_exists(remote_venv_dir):
             venv_result = self.conn.run(
                 f"{self.pye} -m venv {remote_venv_dir}", warn=True
@@ -285,6 +506,7 @@ class Deploy:
                 )
                 if not venv_result.ok:
                     raise Exit(f"创建虚拟环境失败: {venv_result.stderr}")
+            self.invalidate(remote_venv_dir)
 
         # 检查虚拟环境是否成功创建
         if not self.remote_exists(f"{remote_venv_dir}/bin/activate"):
@@ -353,15 +575,22 @@ class Deploy:
             remoter = self.conn.run(f"rm -f {target_remote}")
             if remoter.ok:
                 logger.warning(f"删除远程配置文件 {target_remote}")
+            self.invalidate(target_remote)
             tpltarget_remote_exists = False
 
         # 本地创建临时文件后上传
         if force or not tpltarget_remote_exists:
             # 创建一个临时文件用于上传，使用后缀
+            # 多台服务器同时部署时，每台服务器使用不同的临时文件
+            postfix = f".{self.fabik_conf.env_name}"
+            if self.name:
+                postfix += f".{self.name}"
+            # 临时文件上传之后即被删除，不记录在清单中
             _, final_file = self.replacer.set_writer(
-                tpl_name, force=force, target_postfix=f".{self.fabik_conf.env_name}"
+                tpl_name, target_postfix=postfix, immediately=True, record=False
             )
             self.conn.put(final_file, target_remote)
+            self.invalidate(target_remote)
             logger.warning("覆盖远程配置文件 %s", target_remote)
             localrunner = runners.Local(self.conn)
             # 删除本地的临时配置文件
@@ -379,18 +608,25 @@ class Deploy:
         """
         if files is None:
             # 默认上传常用配置文件
-            default_files = {
-                ".env": ".env",
-                "gunicorn.conf.py": "gunicorn.conf.py",
-                "config.toml": "config.toml",
-            }
-            files = default_files
+            files = self.config_files
 
+        # 已经创建的文件夹被跳过，然后一次探测所有的远程配置文件
+        self.init_remote_dir(files=files)
+        self.probe(*(self.get_remote_path(n) for n in files))
         for tpl_name in files.keys():
             self.put_tpl(tpl_name, force)
 
-    def rsync(self, exclude=[], is_windows=False):
-        """部署最新程序到远程服务器"""
+    def rsync(self, exclude=None, is_windows=False):
+        """部署最新程序到远程服务器
+
+        :param exclude: 排除的文件，默认使用 RSYNC_EXCLUDE 配置。
+            总是排除 FABIK_CACHE_DIR 和 FABIK_MANIFEST_FILE。
+        """
+        if exclude is None:
+            exclude = self.fabik_conf.path("RSYNC_EXCLUDE", [])
+        if isinstance(exclude, str):
+            exclude = [exclude]
+        exclude = [*exclude, FABIK_CACHE_DIR, FABIK_MANIFEST_FILE]
         if is_windows:
             # 因为 windows 下面的 rsync 不支持 windows 风格的绝对路径，转换成相对路径
             pdir = str(self.work_dir.relative_to(".").resolve())
@@ -400,13 +636,21 @@ class Deploy:
             pdir += "/"
         deploy_dir = self.get_remote_path()
         self.init_remote_dir(deploy_dir)
-        rsync(self.conn, pdir, deploy_dir, exclude=exclude)
+        if self.share_connection and not is_windows and hasattr(socket, "AF_UNIX"):
+            # rsync 在已经建立的连接的新 channel 中执行
+            self.conn.open()
+            with ChannelRelay(self.conn.transport) as relay:
+                rsync(self.conn, pdir, deploy_dir, exclude=exclude, rsh=relay.rsh)
+        else:
+            rsync(self.conn, pdir, deploy_dir, exclude=exclude)
+        self.invalidate(deploy_dir)
         logger.warn("RSYNC [%s] to [%s]", pdir, deploy_dir)
 
     def get_logs(self, extras=[]):
         """下载远程 logs 到本地"""
         log_files = ["app.log", "error.log", "access.log"]
         time_string = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        self.probe(*(self.get_remote_path("logs/{}".format(f)) for f in log_files + extras))
         for f in log_files + extras:
             logf = self.get_remote_path("logs/{}".format(f))
             if not self.remote_exists(logf):
@@ -423,3 +667,43 @@ class Deploy:
                 ),
             )
             self.conn.get(logf, local=local_file)
+
+    def get_health_check(self) -> dict:
+        """返回 HEALTH_CHECK 配置，字符串形式的配置是 command。
+
+        配置中的占位符（例如 ``{{ DEPLOY_DIR }}`` ）被替换。没有配置时 command 为 None。
+        """
+        conf = self.replacer.replace_value(
+            self.replacer.get_tpl_value("HEALTH_CHECK", merge=True)
+        )
+        if isinstance(conf, str):
+            conf = {"command": conf}
+        check = {"command": None, "timeout": 30, "interval": 1, "delay": 0}
+        if isinstance(conf, Mapping):
+            check.update({k: v for k, v in conf.items() if k in check})
+        return check
+
+    def wait_ready(self) -> float:
+        """等待服务就绪：在远程服务器上重复执行 HEALTH_CHECK 的命令，直到成功。
+
+        进程重载之后 pid 不变，无法通过 pid 文件判断是否就绪，因此必须提供 HEALTH_CHECK。
+
+        :return: 等待的秒数。
+        :raise Exit: 没有提供 HEALTH_CHECK 或者超时的时候。
+        """
+        check = self.get_health_check()
+        command = check["command"]
+        if not command:
+            raise Exit("没有提供 HEALTH_CHECK，无法判断服务是否就绪。")
+        self.check_remote_conn()
+        start = time.monotonic()
+        deadline = start + float(check["timeout"])
+        time.sleep(float(check["delay"]))
+        while True:
+            result = self.conn.run(command, hide=True, warn=True)
+            if result.ok:
+                logger.info("服务已就绪 %s", self.name)
+                return time.monotonic() - start
+            if time.monotonic() + float(check["interval"]) > deadline:
+                raise Exit(f"服务没有在 {check['timeout']} 秒内就绪：{command}")
+            time.sleep(float(check["interval"]))
@@ -0,0 +1,207 @@
+""".. _fabik_deploy_fleet:
+
+fabik.deploy.fleet
+~~~~~~~~~~~~~~~~~~~~~~
+
+在多台远程服务器上执行部署操作。
+
+``FABRIC.hosts`` 定义多台服务器，每台服务器使用自己的 Connection 和 Deploy，
+:func:`run_on_hosts` 在一个线程池中对它们执行同一个操作，并发数量由 ``parallel`` 限制。
+每台服务器的结果和耗时记录在 :class:`HostResult` 中，一台服务器失败不会影响其他服务器。
+
+:func:`run_rolling` 分批执行：先执行金丝雀服务器，然后每次执行一批，
+一批服务器全部成功之后才执行下一批，任一服务器失败时停止，剩余的服务器被跳过。
+"""
+
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from invoke.exceptions import Exit
+
+from fabik.error import ConfigError, FabikError
+
+if TYPE_CHECKING:
+    from fabik.deploy import Deploy
+
+
+@dataclass
+class FabricHost:
+    """FABRIC 中定义的一台服务器。"""
+
+    name: str
+    """ 服务器的名称，默认为 host。"""
+    conn_kwargs: dict[str, Any]
+    """ 传递给 fabric Connection 的参数。"""
+    overrides: dict[str, Any] = field(default_factory=dict)
+    """ 这台服务器的配置，覆盖 fabik 配置中的同名值，例如 DEPLOY_DIR。"""
+
+
+@dataclass
+class HostResult:
+    """在一台服务器上执行操作的结果。"""
+
+    name: str
+    ok: bool = True
+    elapsed: float = 0.0
+    """ 耗时，单位为秒。"""
+    error: str = ""
+    skipped: bool = False
+    """ 之前的批次失败，没有执行。"""
+
+
+def get_fabric_hosts(fabric_conf: Mapping) -> list[FabricHost]:
+    """解析 FABRIC 配置中的服务器。
+
+    没有 ``hosts`` 时，FABRIC 本身就是一台服务器。 ``hosts`` 的每一项是一个 host 字符串，
+    或者一个表：表中的 ``name`` 是服务器的名称， ``CONFIG`` 是覆盖 fabik 配置的值，
+    其他的值覆盖 FABRIC 中的同名参数（ ``connect_kwargs`` 合并）。
+
+    :param fabric_conf: FABRIC 配置。
+    :return: 服务器列表，与 hosts 的顺序相同。
+    """
+    base = dict(fabric_conf)
+    hosts = base.pop("hosts", None)
+    if hosts is None:
+        hosts = [{}]
+    elif not isinstance(hosts, list) or not hosts:
+        raise ConfigError(
+            err_type=TypeError(), err_msg="FABRIC.hosts must be a non-empty list."
+        )
+    else:
+        # 服务器的地址由 hosts 提供
+        base.pop("host", None)
+
+    result: list[FabricHost] = []
+    for item in hosts:
+        item = {"host": item} if isinstance(item, str) else dict(item)
+        name = item.pop("name", None)
+        overrides = dict(item.pop("CONFIG", None) or {})
+        conn_kwargs = {**base, **item}
+        if "connect_kwargs" in base and "connect_kwargs" in item:
+            conn_kwargs["connect_kwargs"] = {
+                **base["connect_kwargs"],
+                **item["connect_kwargs"],
+            }
+        if "host" not in conn_kwargs or "user" not in conn_kwargs:
+            raise ConfigError(
+                err_type=ValueError(),
+                err_msg="FABRIC configuration must contain 'host' and 'user' parameter",
+            )
+        result.append(FabricHost(str(name or conn_kwargs["host"]), conn_kwargs, overrides))
+
+    names = [h.name for h in result]
+    duplicated = sorted({n for n in names if names.count(n) > 1})
+    if duplicated:
+        raise ConfigError(
+            err_type=ValueError(),
+            err_msg=f"Duplicated host name in FABRIC.hosts: {', '.join(duplicated)}. Use name to distinguish them.",
+        )
+    return result
+
+
+def get_error_message(e: BaseException) -> str:
+    """返回异常的说明文字。"""
+    if isinstance(e, FabikError):
+        return str(e.err_msg)
+    if isinstance(e, Exit):
+        return str(e.message or f"exit code {e.code}")
+    return str(e) or e.__class__.__name__
+
+
+def run_on_host(name: str, deploy: "Deploy", action: Callable[["Deploy"], Any]) -> HostResult:
+    """在一台服务器上执行 action，捕获它的异常。"""
+    start = time.perf_counter()
+    try:
+        action(deploy)
+    except Exception as e:
+        return HostResult(name, False, time.perf_counter() - start, get_error_message(e))
+    return HostResult(name, True, time.perf_counter() - start)
+
+
+def run_on_hosts(
+    deploys: Mapping[str, "Deploy"],
+    action: Callable[["Deploy"], Any],
+    parallel: int = 1,
+) -> list[HostResult]:
+    """在多台服务器上执行 action。
+
+    :param deploys: 服务器名称 -> Deploy。
+    :param action: 对每台服务器执行的操作。
+    :param parallel: 同时执行的服务器的最大数量，为 1 时依次执行。
+    :return: 每台服务器的结果，与 deploys 的顺序相同。
+    """
+    items = list(deploys.items())
+    if parallel <= 1 or len(items) <= 1:
+        return [run_on_host(name, d, action) for name, d in items]
+    with ThreadPoolExecutor(max_workers=min(parallel, len(items))) as executor:
+        futures = [executor.submit(run_on_host, name, d, action) for name, d in items]
+        return [f.result() for f in futures]
+
+
+def get_rolling_batches(
+    names: list[str], batch_size: int = 1, canary: int = 1
+) -> list[list[str]]:
+    """将服务器分批。
+
+    :param batch_size: 每批的服务器数量。
+    :param canary: 第一批（金丝雀）的服务器数量，为 0 时没有金丝雀批次。
+    """
+    batch_size = max(batch_size, 1)
+    batches = [names[:canary]] if canary > 0 else []
+    rest = names[len(batches[0]) if batches else 0 :]
+    batches.extend(rest[i : i + batch_size] for i in range(0, len(rest), batch_size))
+    return [b for b in batches if b]
+
+
+def run_rolling(
+    deploys: Mapping[str, "Deploy"],
+    action: Callable[["Deploy"], Any],
+    batch_size: int = 1,
+    canary: int = 1,
+) -> list[HostResult]:
+    """分批在多台服务器上执行 action，同一批的服务器同时执行。
+
+    action 应该在服务器就绪之后才返回，见 :meth:`fabik.deploy.Deploy.wait_ready` 。
+    任一服务器失败时，剩余批次的服务器被跳过。同时执行的服务器不超过一批的数量。
+
+    :return: 每台服务器的结果，与 deploys 的顺序相同。
+    """
+    results: dict[str, HostResult] = {}
+    batches = get_rolling_batches(list(deploys), batch_size, canary)
+    for i, batch in enumerate(batches):
+        batch_results = run_on_hosts(
+            {name: deploys[name] for name in batch}, action, parallel=len(batch)
+        )
+        results.update((r.name, r) for r in batch_results)
+        if not all(r.ok for r in batch_results):
+            for name in (n for b in batches[i + 1 :] for n in b):
+                results[name] = HostResult(name, False, skipped=True)
+            break
+    return [results[name] for name in deploys]
+
+
+def format_host_results(results: list[HostResult], elapsed: float | None = None) -> str:
+    """将每台服务器的结果和耗时转换为文字，每台服务器一行，最后一行是汇总。
+
+    :param elapsed: 总耗时，不提供时不输出。
+    """
+    width = max((len(r.name) for r in results), default=0)
+    lines = []
+    for r in results:
+        status = "SKIPPED" if r.skipped else "OK" if r.ok else "FAILED"
+        line = f"{r.name:<{width}}  {status:<7}  {r.elapsed:7.2f}s"
+        if r.error:
+            line += f"  {r.error}"
+        lines.append(line)
+    skipped = sum(1 for r in results if r.skipped)
+    failed = sum(1 for r in results if not r.ok) - skipped
+    summary = f"Hosts: {len(results) - failed - skipped} ok, {failed} failed"
+    if skipped:
+        summary += f", {skipped} skipped"
+    if elapsed is not None:
+        summary += f", {elapsed:.2f}s"
+    lines.append(summary + ".")
+    return "\n".join(lines)
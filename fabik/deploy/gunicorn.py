@@ -10,6 +10,7 @@ from pathlib import Path
 from fabric.connection import Connection
 from invoke.exceptions import Exit
 
+from fabik.conf import FabikConfig
 from fabik.deploy import Deploy, logger
 
 
@@ -18,13 +19,12 @@ class GunicornDeploy(Deploy):
 
     def __init__(
         self,
-        fabik_conf: dict,
+        fabik_conf: FabikConfig,
         work_dir: Path,
         conn: Connection,
-        env_name: str | None = None,
         verbose: bool = False,
     ):
-        super().__init__(fabik_conf, work_dir, conn, env_name, verbose)
+        super().__init__(fabik_conf, work_dir, conn, verbose)
 
     def get_pid_file(self):
         """使用 pidfile 来判断进程是否启动"""
@@ -52,6 +52,10 @@ class GunicornDeploy(Deploy):
         :@param wsgi_app: 传递 wsgi_app 名称
         :@param daemon: 若值为 True，则强制加上 -D 参数
         """
+        # 一次探测 pid 文件和 gunicorn 可执行文件
+        self.probe(
+            self.get_remote_path("gunicorn.pid"), self.get_remote_path("venv/bin/gunicorn")
+        )
         pidfile = self.get_pid_file()
         if pidfile is not None:
             raise Exit("进程不能重复启动！")
@@ -62,6 +66,7 @@ class GunicornDeploy(Deploy):
         if wsgi_app is not None:
             cmd += " " + wsgi_app
         self.conn.run(cmd)
+        self.invalidate(self.get_remote_path("gunicorn.pid"))
 
     def stop(self):
         """停止 API 进程"""
@@ -70,7 +75,9 @@ class GunicornDeploy(Deploy):
         if killr.ok:
             logger.warning("优雅关闭 %s", pidvalue)
             # 删除 pidfile 以便下次启动
-            self.conn.run("rm %s" % self.get_pid_file())
+            pidfile = self.get_pid_file()
+            self.conn.run("rm %s" % pidfile)
+            self.invalidate(pidfile)
         else:
             logger.warning("关闭 %s 失败", pidvalue)
 
@@ -10,6 +10,7 @@ from pathlib import Path
 
 from fabric.connection import Connection
 from invoke.exceptions import Exit
+from fabik.conf import FabikConfig
 from fabik.deploy import Deploy
 
 
@@ -18,13 +19,12 @@ class UwsgiDeploy(Deploy):
 
     def __init__(
         self,
-        fabik_conf: dict,
+        fabik_conf: FabikConfig,
         work_dir: Path,
         conn: Connection,
-        env_name: str | None = None,
         verbose: bool = False,
     ):
-        super().__init__(fabik_conf, work_dir, conn, env_name, verbose)
+        super().__init__(fabik_conf, work_dir, conn, verbose)
 
     def get_fifo_file(self):
         """使用 master-fifo 来管理进程
@@ -51,20 +51,26 @@ class UwsgiDeploy(Deploy):
 
     def start(self):
         """启动服务进程"""
+        # 一次探测 pid 文件和 uwsgi 可执行文件
+        self.probe(self.get_remote_path("uwsgi.pid"), self.get_remote_path("venv/bin/uwsgi"))
         pidfile = self.get_pid_file()
         if pidfile is not None:
             raise Exit("进程不能重复启动！")
         self.conn.run(self.get_uwsgi_exe() + " " + self.get_remote_path("uwsgi.ini"))
+        self.invalidate(self.get_remote_path("uwsgi.pid"), self.get_remote_path("uwsgi.fifo"))
 
     def stop(self):
         """停止 API 进程"""
+        self.probe(self.get_remote_path("uwsgi.fifo"), self.get_remote_path("uwsgi.pid"))
         fifofile = self.get_fifo_file()
+        plan = self.plan()
         if fifofile is not None:
-            self.conn.run("echo q > %s" % fifofile)
+            plan.run("echo q > %s" % fifofile, invalidate=[fifofile])
         pidfile = self.get_pid_file()
         # 删除 pidfile 以便下次启动
         if pidfile is not None:
-            self.conn.run("rm %s" % pidfile)
+            plan.remove(pidfile)
+        plan.execute()
 
     def reload(self):
         """优雅重载 API 进程"""
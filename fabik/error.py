@@ -6,13 +6,19 @@ fabik.error
 错误处理。
 """
 
-from typing import Any
+import io
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
 from rich.console import Console
 from rich.style import Style
 from rich.panel import Panel
 
 console: Console = Console(highlight=True)
 
+_local = threading.local()
+""" 每个线程中 capture_echo 使用的 console。"""
+
 class FabikError(Exception):
     err_type: Exception
     err_msg: str
@@ -49,11 +55,16 @@ class TplError(FabikError):
     pass
 
 
+def get_console() -> Console:
+    """ 返回当前线程使用的 console，在 capture_echo 中时返回收集输出的 console。"""
+    return getattr(_local, 'console', None) or console
+
+
 def echo(value:Any, *, panel_title:str | None=None, style:Style | str | None=None):
     """  调用 console.print 输出信息。"""
     if panel_title:
         value = Panel(value, title=panel_title, title_align='left')
-    console.print(value, style=style)
+    get_console().print(value, style=style)
     
 
 def echo_info(value: Any, *, panel_title:str | None=None):
@@ -69,4 +80,34 @@ def echo_warning(value: Any, *, panel_title:str | None=None):
 def echo_error(value: Any, *, panel_title:str | None=None):
     """ 输出错误。"""
     echo(value, panel_title=panel_title, style='red')
-    
\ No newline at end of file
+
+
+@contextmanager
+def capture_echo() -> Iterator[io.StringIO]:
+    """ 临时将 echo 的输出保存到 StringIO 中，保留当前 console 的颜色和宽度设置。
+
+    用于在子进程中收集输出，由主进程按顺序统一输出。
+    仅收集当前线程的输出，其他线程的输出不受影响。
+    """
+    buffer = io.StringIO()
+    origin_console = get_console()
+    previous = getattr(_local, 'console', None)
+    _local.console = Console(
+        file=buffer,
+        highlight=True,
+        force_terminal=origin_console.is_terminal,
+        color_system=origin_console.color_system,  # type: ignore[arg-type]
+        width=origin_console.width,
+    )
+    try:
+        yield buffer
+    finally:
+        _local.console = previous
+
+
+def echo_captured(text: str):
+    """ 原样输出 capture_echo 收集的内容。"""
+    if text:
+        output = get_console()
+        output.file.write(text)
+        output.file.flush()
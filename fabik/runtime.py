@@ -0,0 +1,343 @@
+""".. _fabik_runtime:
+
+fabik.runtime
+----------------------
+
+读取 fabik 生成的二进制配置包（ ``.fbk`` ）。
+
+应用启动时使用这个模块代替解析 TOML/JSON 配置文件。配置包使用 mmap 映射到内存中，
+读取某个值时才解码它，嵌套的表和数组不会被复制。在 fork 之前载入配置包时（例如 gunicorn 的 preload），
+所有的 worker 共享同一份内存页。
+
+这个模块仅依赖标准库，不会载入 fabik 的其他模块。 ::
+
+    from fabik.runtime import load_bundle
+
+    config = load_bundle('/srv/app/myapp/config.toml.fbk')
+    uri = config.get('SQLALCHEMY.URI')
+    debug = config['DEBUG']
+
+配置包的格式（小端）：
+
+- 文件头： ``FBK1`` 、版本 (u16)、保留 (u16)、根节点的偏移 (u32)。
+- 每个值以一个字节的类型开头：
+
+  - ``b`` 布尔值，1 字节； ``i`` 整数，int64； ``f`` 浮点数，float64；
+  - ``s`` 字符串，长度 (u32) + UTF-8 内容；
+  - ``D/d/t`` datetime/date/time，与字符串相同，内容为 ISO 8601 格式；
+  - ``a`` 数组，元素数量 (u32) + 每个元素的偏移 (u32)；
+  - ``m`` 表，键的数量 (u32) + 每个键的 (键的偏移, 值的偏移)，键按照 UTF-8 字节排序，
+    键的内容为长度 (u32) + UTF-8 内容。
+"""
+
+import datetime
+import mmap
+import struct
+from collections.abc import Iterator, Mapping, Sequence
+from pathlib import Path
+from typing import Any
+
+__all__ = ["BUNDLE_SUFFIX", "Bundle", "Table", "Array", "load_bundle", "dump_bundle"]
+
+BUNDLE_SUFFIX: str = ".fbk"
+""" 配置包文件的后缀。"""
+
+MAGIC: bytes = b"FBK1"
+VERSION: int = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_U32 = struct.Struct("<I")
+_PAIR = struct.Struct("<II")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+_T_BOOL = ord("b")
+_T_INT = ord("i")
+_T_FLOAT = ord("f")
+_T_STR = ord("s")
+_T_DATETIME = ord("D")
+_T_DATE = ord("d")
+_T_TIME = ord("t")
+_T_ARRAY = ord("a")
+_T_TABLE = ord("m")
+
+_ISO_TYPES = {
+    _T_DATETIME: datetime.datetime.fromisoformat,
+    _T_DATE: datetime.date.fromisoformat,
+    _T_TIME: datetime.time.fromisoformat,
+}
+
+
+class BundleError(ValueError):
+    """配置包格式错误，或者值无法写入配置包。"""
+
+
+# ==============================================
+# 读取
+# ==============================================
+
+
+def _read_str(buf: memoryview, off: int) -> str:
+    (n,) = _U32.unpack_from(buf, off)
+    return str(buf[off + 4 : off + 4 + n], "utf-8")
+
+
+def _read_value(buf: memoryview, off: int) -> Any:
+    tag = buf[off]
+    if tag == _T_STR:
+        return _read_str(buf, off + 1)
+    if tag == _T_INT:
+        return _I64.unpack_from(buf, off + 1)[0]
+    if tag == _T_TABLE:
+        return Table(buf, off)
+    if tag == _T_BOOL:
+        return buf[off + 1] != 0
+    if tag == _T_FLOAT:
+        return _F64.unpack_from(buf, off + 1)[0]
+    if tag == _T_ARRAY:
+        return Array(buf, off)
+    if tag in _ISO_TYPES:
+        return _ISO_TYPES[tag](_read_str(buf, off + 1))
+    raise BundleError(f"Unknown value type {tag!r} at {off}.")
+
+
+class Table(Mapping):
+    """配置包中的一个表，按需解码其中的值，嵌套的表也是 Table。"""
+
+    __slots__ = ("_buf", "_off", "_count")
+
+    def __init__(self, buf: memoryview, off: int):
+        self._buf = buf
+        self._off = off + 5
+        (self._count,) = _U32.unpack_from(buf, off + 1)
+
+    def _key_bytes(self, i: int) -> bytes:
+        (key_off,) = _U32.unpack_from(self._buf, self._off + i * 8)
+        (n,) = _U32.unpack_from(self._buf, key_off)
+        return bytes(self._buf[key_off + 4 : key_off + 4 + n])
+
+    def _find(self, key: Any) -> int:
+        """二分查找键的序号，找不到时返回 -1。"""
+        if not isinstance(key, str):
+            return -1
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self._key_bytes(mid)
+            if k < target:
+                lo = mid + 1
+            elif k > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def __getitem__(self, key: Any) -> Any:
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        (value_off,) = _U32.unpack_from(self._buf, self._off + i * 8 + 4)
+        return _read_value(self._buf, value_off)
+
+    def __contains__(self, key: object) -> bool:
+        return self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self._key_bytes(i).decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, path: Any, default: Any = None) -> Any:  # type: ignore[override]
+        """读取值，path 可以是点号分隔的路径，或者键名元组（键名中包含点号时使用）。"""
+        keys = path.split(".") if isinstance(path, str) else path
+        value: Any = self
+        for k in keys:
+            if not isinstance(value, Table):
+                return default
+            i = value._find(k)
+            if i < 0:
+                return default
+            value = value[k]
+        return value
+
+    def to_dict(self) -> dict:
+        """将整个表解码为 dict。"""
+        return {k: _to_python(v) for k, v in self.items()}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+
+class Array(Sequence):
+    """配置包中的一个数组，按需解码其中的值。"""
+
+    __slots__ = ("_buf", "_off", "_count")
+
+    def __init__(self, buf: memoryview, off: int):
+        self._buf = buf
+        self._off = off + 5
+        (self._count,) = _U32.unpack_from(buf, off + 1)
+
+    def __getitem__(self, index):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        (value_off,) = _U32.unpack_from(self._buf, self._off + index * 4)
+        return _read_value(self._buf, value_off)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def to_list(self) -> list:
+        """将整个数组解码为 list。"""
+        return [_to_python(v) for v in self]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_list()!r})"
+
+
+def _to_python(value: Any) -> Any:
+    if isinstance(value, Table):
+        return value.to_dict()
+    if isinstance(value, Array):
+        return value.to_list()
+    return value
+
+
+class Bundle(Table):
+    """使用 mmap 打开的配置包，本身就是根节点的 Table。
+
+    关闭之后不能再读取从它获得的 Table 和 Array。
+    """
+
+    __slots__ = ("path", "_file", "_mmap")
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise BundleError(f"{self.path} is empty.")
+        buf = memoryview(self._mmap)
+        try:
+            magic, version, _, root_off = _HEADER.unpack_from(buf, 0)
+            if magic != MAGIC or version != VERSION:
+                raise BundleError(f"{self.path} is not a fabik bundle.")
+            if buf[root_off] != _T_TABLE:
+                raise BundleError(f"The root of {self.path} is not a table.")
+            super().__init__(buf, root_off)
+            # 根节点总是最后写入，以它结尾的文件才是完整的
+            if self._off + self._count * _PAIR.size != len(buf):
+                raise BundleError(f"{self.path} is truncated.")
+        except (struct.error, IndexError, BundleError) as e:
+            buf.release()
+            self.close()
+            raise BundleError(str(e)) from e
+
+    def close(self) -> None:
+        if isinstance(getattr(self, "_buf", None), memoryview):
+            self._buf.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "Bundle":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path.as_posix()!r})"
+
+
+def load_bundle(path: str | Path) -> Bundle:
+    """使用 mmap 打开配置包。"""
+    return Bundle(path)
+
+
+# ==============================================
+# 写入
+# ==============================================
+
+
+class _Encoder:
+    def __init__(self):
+        self.buf = bytearray(_HEADER.size)
+
+    def _str(self, tag: int | None, s: str) -> int:
+        off = len(self.buf)
+        data = s.encode("utf-8")
+        if tag is not None:
+            self.buf.append(tag)
+        self.buf += _U32.pack(len(data))
+        self.buf += data
+        return off
+
+    def value(self, v: Any) -> int:
+        """写入一个值（先写入它的子节点），返回它的偏移。"""
+        if isinstance(v, bool):
+            off = len(self.buf)
+            self.buf += bytes((_T_BOOL, 1 if v else 0))
+            return off
+        if isinstance(v, int):
+            off = len(self.buf)
+            self.buf.append(_T_INT)
+            try:
+                self.buf += _I64.pack(v)
+            except struct.error:
+                raise BundleError(f"Integer {v} is out of the int64 range.")
+            return off
+        if isinstance(v, float):
+            off = len(self.buf)
+            self.buf.append(_T_FLOAT)
+            self.buf += _F64.pack(v)
+            return off
+        if isinstance(v, str):
+            return self._str(_T_STR, v)
+        if isinstance(v, datetime.datetime):
+            return self._str(_T_DATETIME, v.isoformat())
+        if isinstance(v, datetime.date):
+            return self._str(_T_DATE, v.isoformat())
+        if isinstance(v, datetime.time):
+            return self._str(_T_TIME, v.isoformat())
+        if isinstance(v, Mapping):
+            items = sorted(
+                ((str(k).encode("utf-8"), val) for k, val in v.items()),
+                key=lambda kv: kv[0],
+            )
+            pairs = [
+                (self._str(None, k.decode("utf-8")), self.value(val)) for k, val in items
+            ]
+            off = len(self.buf)
+            self.buf.append(_T_TABLE)
+            self.buf += _U32.pack(len(pairs))
+            for pair in pairs:
+                self.buf += _PAIR.pack(*pair)
+            return off
+        if isinstance(v, (list, tuple)):
+            offs = [self.value(item) for item in v]
+            off = len(self.buf)
+            self.buf.append(_T_ARRAY)
+            self.buf += _U32.pack(len(offs))
+            for o in offs:
+                self.buf += _U32.pack(o)
+            return off
+        raise BundleError(f"Value {v!r} of type {type(v).__name__} can not be bundled.")
+
+
+def dump_bundle(data: Mapping) -> bytes:
+    """将一个表编码为配置包。"""
+    encoder = _Encoder()
+    root_off = encoder.value(data)
+    if len(encoder.buf) > 0xFFFFFFFF:
+        raise BundleError("The bundle is larger than 4 GiB.")
+    _HEADER.pack_into(encoder.buf, 0, MAGIC, VERSION, 0, root_off)
+    return bytes(encoder.buf)
@@ -7,12 +7,48 @@ fabik.tpl
 Provide template support.
 """
 
+import hashlib
+import os
+from pathlib import Path
+
 FABIK_TOML_FILE: str = 'fabik.toml'
 """ Main config file name. """
 
 FABIK_ENV_FILE: str = '.fabik.env'
 """ Main environment file name. """
 
+FABIK_CACHE_DIR: str = '.fabik_cache'
+""" Legacy cache folder name in the work dir, caches now live in the user cache home. """
+
+FABIK_CACHE_HOME_ENV: str = 'FABIK_CACHE_HOME'
+""" Environment variable to override the user cache home. """
+
+FABIK_MANIFEST_FILE: str = '.fabik.manifest.json'
+""" Output manifest file name, placed next to the generated config files. """
+
+
+def get_cache_home() -> Path:
+    """Return the user cache home of fabik.
+
+    ``$FABIK_CACHE_HOME``, or ``fabik`` in ``$XDG_CACHE_HOME`` (default to ``~/.cache``).
+    """
+    home = os.environ.get(FABIK_CACHE_HOME_ENV)
+    if home:
+        return Path(home)
+    xdg_home = os.environ.get('XDG_CACHE_HOME')
+    base = Path(xdg_home) if xdg_home else Path.home().joinpath('.cache')
+    return base.joinpath('fabik')
+
+
+def get_cache_dir(work_dir: Path | str) -> Path:
+    """Return the cache folder of the work dir in the user cache home, it is not created.
+
+    The cache is kept out of the work dir, so it is never committed or deployed.
+    """
+    work_dir = Path(work_dir).resolve()
+    digest = hashlib.sha256(work_dir.as_posix().encode('utf-8')).hexdigest()[:16]
+    return get_cache_home().joinpath(f'{work_dir.name or "root"}-{digest}')
+
 FABIK_TOML_TPL: str = """
 ###########################################
 # fabik main config file
@@ -0,0 +1,212 @@
+""".. _fabik_util_channel:
+
+fabik.util.channel
+~~~~~~~~~~~~~~~~~~~~~~
+
+让本地的子进程（例如 rsync）通过 fabric 已经建立的 SSH 连接执行远程命令。
+
+rsync 使用 ``--rsh`` 指定的程序连接远程服务器。ChannelRelay 在一个 Unix socket 上监听，
+将 ``--rsh`` 设置为 ``python -m fabik.util.channel <socket>`` 之后，rsync 的远程命令在
+paramiko Transport 的一个新 channel 中执行，不会再建立一个 SSH 连接，也不会再经过一次跳板机的认证。
+
+这个模块仅依赖标准库。
+
+协议：客户端发送一行 JSON ``{"command": 远程命令}`` ，然后转发标准输入，标准输入结束时关闭 socket 的写入端；
+服务端发送帧：类型 (1 字节) + 长度 (u32) + 数据，类型为标准输出、标准错误或者退出码。
+"""
+
+import json
+import os
+import shlex
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any
+
+__all__ = ["ChannelRelay", "main"]
+
+FRAME_STDOUT: int = 1
+FRAME_STDERR: int = 2
+FRAME_EXIT: int = 3
+
+_FRAME = struct.Struct("<BI")
+_STATUS = struct.Struct("<i")
+_BUFSIZE = 32768
+
+
+def _send_frame(sock: socket.socket, lock: threading.Lock, kind: int, data: bytes) -> None:
+    with lock:
+        sock.sendall(_FRAME.pack(kind, len(data)) + data)
+
+
+def _recv_line(sock: socket.socket) -> bytes:
+    """逐字节读取一行，不能读取行之后的标准输入。"""
+    buf = bytearray()
+    while not buf.endswith(b"\n"):
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes | None:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+class ChannelRelay:
+    """在一个 Unix socket 上接受 ``python -m fabik.util.channel`` 的连接，
+    在 transport 的新 channel 中执行它们请求的远程命令。
+
+    :param transport: 已经认证的 paramiko Transport，例如 fabric ``Connection.transport`` 。
+    """
+
+    transport: Any
+    socket_file: Path | None = None
+    _server: socket.socket | None = None
+    _tmp_dir: str | None = None
+
+    def __init__(self, transport: Any):
+        self.transport = transport
+
+    @property
+    def rsh(self) -> str:
+        """提供给 rsync ``--rsh`` 的命令。"""
+        return shlex.join(
+            [sys.executable, "-m", "fabik.util.channel", str(self.socket_file)]
+        )
+
+    def start(self) -> "ChannelRelay":
+        # mkdtemp 创建的文件夹仅当前用户可以访问
+        self._tmp_dir = tempfile.mkdtemp(prefix="fabik-")
+        self.socket_file = Path(self._tmp_dir, "channel.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.socket_file))
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def __enter__(self) -> "ChannelRelay":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _serve(self) -> None:
+        server = self._server
+        while server is not None:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                # close 之后 accept 失败
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn: socket.socket) -> None:
+        lock = threading.Lock()
+        channel = None
+        try:
+            command = json.loads(_recv_line(conn))["command"]
+            channel = self.transport.open_session()
+            channel.exec_command(command)
+
+            def forward_stdin():
+                try:
+                    while data := conn.recv(_BUFSIZE):
+                        channel.sendall(data)
+                    channel.shutdown_write()
+                except OSError:
+                    pass
+
+            def forward_stderr():
+                while data := channel.recv_stderr(_BUFSIZE):
+                    _send_frame(conn, lock, FRAME_STDERR, data)
+
+            threading.Thread(target=forward_stdin, daemon=True).start()
+            stderr_thread = threading.Thread(target=forward_stderr, daemon=True)
+            stderr_thread.start()
+            while data := channel.recv(_BUFSIZE):
+                _send_frame(conn, lock, FRAME_STDOUT, data)
+            stderr_thread.join()
+            status = channel.recv_exit_status()
+            _send_frame(conn, lock, FRAME_EXIT, _STATUS.pack(status))
+        except Exception as e:
+            try:
+                _send_frame(conn, lock, FRAME_STDERR, f"fabik channel: {e}\n".encode())
+            except OSError:
+                pass
+        finally:
+            if channel is not None:
+                channel.close()
+            conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """作为 rsync 的 ``--rsh`` 执行： ``<socket> [-l user] host command...`` 。
+
+    user 和 host 被忽略，远程命令使用 ChannelRelay 的连接执行。返回远程命令的退出码，
+    连接失败时与 ssh 相同返回 255。
+    """
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) < 3:
+        print("usage: python -m fabik.util.channel SOCKET [-l USER] HOST COMMAND...", file=sys.stderr)
+        return 255
+    socket_file, rest = args[0], args[1:]
+    if rest[0] == "-l":
+        rest = rest[2:]
+    # 与 ssh 相同，使用空格连接远程命令的参数
+    command = " ".join(rest[1:])
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_file)
+        sock.sendall(json.dumps({"command": command}).encode() + b"\n")
+    except OSError as e:
+        print(f"fabik channel: {e}", file=sys.stderr)
+        return 255
+
+    def forward_stdin():
+        try:
+            while data := os.read(0, _BUFSIZE):
+                sock.sendall(data)
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    threading.Thread(target=forward_stdin, daemon=True).start()
+    while header := _recv_exact(sock, _FRAME.size):
+        kind, size = _FRAME.unpack(header)
+        data = _recv_exact(sock, size) if size else b""
+        if data is None:
+            break
+        if kind == FRAME_EXIT:
+            return _STATUS.unpack(data)[0]
+        fd = 1 if kind == FRAME_STDOUT else 2
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    print("fabik channel: connection closed.", file=sys.stderr)
+    return 255
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+""" .._fabik_util_watch:
+
+fabik.util.watch
+~~~~~~~~~~~~~~~~~~~
+
+监控文件的改变。
+
+在 Linux 中通过 ctypes 直接调用 inotify，其他平台（或者 inotify 不可用时）使用轮询。
+"""
+
+import abc
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+
+# 以下常量来自 <sys/inotify.h>
+IN_MODIFY: int = 0x00000002
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_FROM: int = 0x00000040
+IN_MOVED_TO: int = 0x00000080
+IN_CREATE: int = 0x00000100
+IN_DELETE: int = 0x00000200
+IN_Q_OVERFLOW: int = 0x00004000
+IN_IGNORED: int = 0x00008000
+IN_ISDIR: int = 0x40000000
+
+WATCH_MASK: int = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+""" 编辑器通常使用「写入临时文件再重命名」的方式保存文件，因此监控文件夹而不是文件本身。"""
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class FileWatcher(abc.ABC):
+    """文件监控器的基类，子类实现 wait。
+
+    :param files: 需要监控的文件。
+    :param dirs: 需要监控的文件夹，包括其中所有层级的文件。
+    """
+
+    name: str = "base"
+
+    files: set[Path]
+    dirs: set[Path]
+
+    def __init__(self, files: Iterable[Path], dirs: Iterable[Path] = ()):
+        self.files = {Path(f).absolute() for f in files}
+        self.dirs = {Path(d).absolute() for d in dirs}
+
+    def matches(self, p: Path) -> bool:
+        """p 是否是被监控的文件。"""
+        return p in self.files or any(p.is_relative_to(d) for d in self.dirs)
+
+    @abc.abstractmethod
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        """等待文件改变，返回改变的文件。超过 timeout 秒没有改变则返回空集合。
+
+        :param timeout: 为 None 时一直等待。
+        """
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PollingWatcher(FileWatcher):
+    """定时比较文件的 mtime 和 size。"""
+
+    name: str = "polling"
+
+    interval: float
+    _signatures: dict[Path, tuple[int, int]]
+
+    def __init__(
+        self, files: Iterable[Path], dirs: Iterable[Path] = (), interval: float = 0.5
+    ):
+        super().__init__(files, dirs)
+        self.interval = interval
+        self._signatures = self._scan()
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        paths = set(self.files)
+        for d in self.dirs:
+            paths.update(p for p in d.rglob("*") if p.is_file())
+        signatures = {}
+        for p in paths:
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            signatures[p] = (st.st_mtime_ns, st.st_size)
+        return signatures
+
+    def _poll(self) -> set[Path]:
+        signatures = self._scan()
+        changed = {
+            p
+            for p in signatures.keys() | self._signatures.keys()
+            if signatures.get(p) != self._signatures.get(p)
+        }
+        self._signatures = signatures
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._poll()
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            time.sleep(min(self.interval, remaining))
+
+
+class InotifyWatcher(FileWatcher):
+    """使用 Linux inotify 监控文件，无需轮询。"""
+
+    name: str = "inotify"
+
+    _libc: ctypes.CDLL
+    _fd: int
+    _wds: dict[int, Path]
+    """ watch descriptor -> 文件夹 """
+
+    def __init__(self, files: Iterable[Path], dirs: Iterable[Path] = ()):
+        super().__init__(files, dirs)
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise _errno_error("inotify_init1")
+        self._wds = {}
+        try:
+            for f in self.files:
+                self._add_watch(f.parent)
+            for d in self.dirs:
+                self._add_watch(d, recursive=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, d: Path, recursive: bool = False) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), WATCH_MASK)
+        if wd < 0:
+            raise _errno_error(f"inotify_add_watch {d}")
+        self._wds[wd] = d
+        if recursive:
+            for sub in d.iterdir():
+                if sub.is_dir():
+                    self._add_watch(sub, recursive=True)
+
+    def _read_events(self) -> set[Path]:
+        changed: set[Path] = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                name = buf[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，无法知道哪些文件改变了
+                    changed.update(self.files)
+                    changed.update(p for d in self.dirs for p in d.rglob("*") if p.is_file())
+                    continue
+                if mask & IN_IGNORED:
+                    self._wds.pop(wd, None)
+                    continue
+                d = self._wds.get(wd)
+                if d is None or not name:
+                    continue
+                p = d.joinpath(os.fsdecode(name))
+                if mask & IN_ISDIR:
+                    # 在被监控的文件夹中新建的子文件夹也需要监控
+                    if mask & (IN_CREATE | IN_MOVED_TO) and self.matches(p):
+                        self._add_watch(p, recursive=True)
+                        changed.update(f for f in p.rglob("*") if f.is_file())
+                    continue
+                if self.matches(p):
+                    changed.add(p)
+        return changed
+
+    def wait(self, timeout: float | None = None) -> set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return set()
+            changed = self._read_events()
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _load_libc() -> ctypes.CDLL:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not supported.")
+    return libc
+
+
+def _errno_error(action: str) -> OSError:
+    errno = ctypes.get_errno()
+    return OSError(errno, f"{action}: {os.strerror(errno)}")
+
+
+def create_watcher(
+    files: Iterable[Path],
+    dirs: Iterable[Path] = (),
+    *,
+    polling: bool = False,
+    interval: float = 0.5,
+) -> FileWatcher:
+    """创建文件监控器，inotify 不可用时使用轮询。
+
+    :param polling: 强制使用轮询。
+    :param interval: 轮询的间隔秒数。
+    """
+    files, dirs = list(files), list(dirs)
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(files, dirs)
+        except OSError:
+            pass
+    return PollingWatcher(files, dirs, interval=interval)
+
+
+def watch_changes(watcher: FileWatcher, debounce: float = 0.2) -> Iterator[set[Path]]:
+    """持续返回改变的文件。
+
+    一次改变之后 debounce 秒内的改变会被合并，直到连续 debounce 秒没有新的改变。
+
+    :param debounce: 合并连续改变的间隔秒数。
+    """
+    while True:
+        changed = watcher.wait()
+        while more := watcher.wait(debounce):
+            changed |= more
+        yield changed
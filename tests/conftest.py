@@ -15,6 +15,14 @@ import fabik
 from fabik.cmd import GlobalState, FabikConfig
 
 
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch) -> Path:
+    """所有的测试使用临时的用户缓存文件夹"""
+    home = tmp_path_factory.mktemp("fabik_cache_home")
+    monkeypatch.setenv("FABIK_CACHE_HOME", home.as_posix())
+    return home
+
+
 @pytest.fixture
 def temp_dir(tmp_path) -> Path:
     """提供一个临时目录用于测试"""
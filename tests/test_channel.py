@@ -0,0 +1,85 @@
+"""
+Tests for fabik.util.channel
+"""
+
+import shlex
+import subprocess
+import sys
+
+import pytest
+
+from fabik.util.channel import ChannelRelay
+
+
+class FakeChannel:
+    """使用本地子进程模拟 paramiko Channel"""
+
+    def exec_command(self, command: str):
+        self.proc = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def recv(self, n: int) -> bytes:
+        return self.proc.stdout.read1(n)
+
+    def recv_stderr(self, n: int) -> bytes:
+        return self.proc.stderr.read1(n)
+
+    def sendall(self, data: bytes):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def shutdown_write(self):
+        self.proc.stdin.close()
+
+    def recv_exit_status(self) -> int:
+        return self.proc.wait()
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sessions = 0
+
+    def open_session(self) -> FakeChannel:
+        self.sessions += 1
+        return FakeChannel()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Unix socket only")
+class TestChannelRelay:
+    """测试本地子进程通过 ChannelRelay 在已有的连接中执行远程命令"""
+
+    def run(self, relay: ChannelRelay, *args: str, input: bytes = b""):
+        return subprocess.run(
+            [*shlex.split(relay.rsh), *args], input=input, capture_output=True
+        )
+
+    def test_relay(self):
+        """转发标准输入、标准输出、标准错误和退出码，每个命令使用同一个 transport 的新 channel"""
+        transport = FakeTransport()
+        with ChannelRelay(transport) as relay:
+            socket_file = relay.socket_file
+            result = self.run(relay, "-l", "user", "host", "cat", input=b"x" * 100000)
+            assert result.returncode == 0, result.stderr
+            assert result.stdout == b"x" * 100000
+
+            result = self.run(relay, "host", "echo", "out;", "echo err >&2;", "exit 3")
+            assert result.returncode == 3
+            assert result.stdout == b"out\n"
+            assert result.stderr == b"err\n"
+            assert transport.sessions == 2
+        assert not socket_file.exists()
+
+        # relay 关闭之后与 ssh 相同返回 255
+        result = subprocess.run(
+            [sys.executable, "-m", "fabik.util.channel", str(socket_file), "host", "true"],
+            capture_output=True,
+        )
+        assert result.returncode == 255
@@ -0,0 +1,83 @@
+"""
+Tests for fabik.conf.check
+"""
+
+from pathlib import Path
+
+import pytest
+
+from fabik.conf import FabikConfigFile, config_validator_tpldir
+from fabik.conf.check import CheckKind, check_configs
+
+
+FABIK_TOML = """
+NAME = 'check_test'
+WORK_DIR = '{work_dir}'
+TPL_DIR = '{tpl_dir}'
+
+['app.conf']
+PORT = 5000
+
+['config.json']
+URL = '{{{{ NAME | nosuchfilter }}}}'
+
+[ENV.local]
+[ENV.prod.'app.conf']
+PORT = 80
+"""
+
+
+def failed_validator(config) -> bool:
+    return config.env_name != "prod"
+
+
+@pytest.fixture
+def configs(temp_dir: Path):
+    tpl_dir = temp_dir / "tpls"
+    tpl_dir.mkdir()
+    (tpl_dir / "app.conf.jinja2").write_text('port={{ PORT }} {% include "base.jinja2" %}')
+    (tpl_dir / "base.jinja2").write_text("name={{ NAME }}")
+    (tpl_dir / "broken.jinja2").write_text("{% if %}")
+    (temp_dir / "fabik.toml").write_text(
+        FABIK_TOML.format(work_dir=temp_dir.as_posix(), tpl_dir=tpl_dir.as_posix())
+    )
+    (temp_dir / ".fabik.env").write_text("")
+    fabik_file = FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir)
+    return fabik_file.load_configs(["local", "prod"])
+
+
+class TestConfigCheck:
+    """测试 fabik conf check 使用的并发检查"""
+
+    def test_report_all_failures(self, configs, temp_dir):
+        """检查所有环境的验证器、输出表和模板，不在第一个错误处停止，也不写入文件"""
+        items = check_configs(
+            configs, temp_dir, [config_validator_tpldir, failed_validator], max_workers=1
+        )
+        result = {(i.env_name, i.kind, i.name): i.ok for i in items}
+        assert result == {
+            ("local", CheckKind.VALIDATOR, "config_validator_tpldir"): True,
+            ("local", CheckKind.VALIDATOR, "failed_validator"): True,
+            ("local", CheckKind.TEMPLATE, "app.conf"): True,
+            ("local", CheckKind.TABLE, "config.json"): False,
+            ("local", CheckKind.PARTIAL, "base"): True,
+            ("local", CheckKind.PARTIAL, "broken"): False,
+            ("prod", CheckKind.VALIDATOR, "config_validator_tpldir"): True,
+            ("prod", CheckKind.VALIDATOR, "failed_validator"): False,
+            ("prod", CheckKind.TEMPLATE, "app.conf"): True,
+            ("prod", CheckKind.TABLE, "config.json"): False,
+            ("prod", CheckKind.PARTIAL, "base"): True,
+            ("prod", CheckKind.PARTIAL, "broken"): False,
+        }
+        assert all(i.elapsed > 0 for i in items)
+        assert not (temp_dir / "app.conf").exists()
+
+    def test_process_pool(self, configs, temp_dir):
+        """使用进程池时结果与顺序执行相同"""
+        names = ["app.conf"]
+        serial = check_configs(configs, temp_dir, [], names=names, max_workers=1)
+        parallel = check_configs(configs, temp_dir, [], names=names, max_workers=2)
+        assert [(i.env_name, i.name, i.error) for i in parallel] == [
+            (i.env_name, i.name, i.error) for i in serial
+        ]
+        assert [i.env_name for i in parallel] == ["local", "prod"]
@@ -0,0 +1,65 @@
+"""
+Tests for fabik.cli lazy sub command loading
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from fabik.cli import main as cli, LazyTyperGroup
+
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["fabric", "paramiko", "invoke", "httpx"]
+
+
+def imported_modules(*args: str) -> set[str]:
+    """在新的解释器中执行 fabik 命令，返回执行后载入的所有模块名称"""
+    code = (
+        "import sys\n"
+        "from typer.testing import CliRunner\n"
+        "from fabik.cli import main\n"
+        f"CliRunner().invoke(main, {list(args)!r})\n"
+        "print('\\n'.join(sys.modules))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=ROOT_DIR,
+        check=True,
+    )
+    return set(proc.stdout.split())
+
+
+class TestLazyCommands:
+    """测试子命令的延迟载入"""
+
+    @pytest.mark.parametrize(
+        "args", [["--version"], ["gen", "token"], ["gen", "uuid"], ["conf", "--help"]]
+    )
+    def test_local_commands_skip_heavy_modules(self, args):
+        """本地命令不应载入 fabric/paramiko/httpx"""
+        modules = imported_modules(*args)
+        assert "fabik.cli" in modules
+        for heavy in HEAVY_MODULES:
+            assert heavy not in modules, f"{heavy} is imported by fabik {' '.join(args)}"
+
+    def test_only_invoked_sub_command_is_loaded(self):
+        """仅载入被调用的子命令的实现模块"""
+        modules = imported_modules("gen", "token")
+        assert "fabik.cmd.gen" in modules
+        assert "fabik.cmd.conf" not in modules
+        assert "fabik.cmd.server" not in modules
+        assert "fabik.cmd.venv" not in modules
+
+    def test_all_sub_commands_listed(self):
+        """帮助信息中列出所有子命令"""
+        result = CliRunner().invoke(cli, ["--help"])
+        assert result.exit_code == 0
+        for name in ["init", *LazyTyperGroup.lazy_subcommands]:
+            assert name in result.output
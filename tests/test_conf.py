@@ -2,6 +2,8 @@
 Tests for fabik.cmd module's conf_tpl and conf_make commands
 """
 
+import json
+
 import pytest
 from unittest.mock import MagicMock, call
 
@@ -251,7 +253,7 @@ class TestConfCommands:
         mocker.patch("pathlib.Path.exists", return_value=True)
 
         # 模拟 ConfigReplacer
-        mock_config_replacer = mocker.patch("fabik.cmd.ConfigReplacer")
+        mock_config_replacer = mocker.patch("fabik.conf.processor.ConfigReplacer")
         mock_replacer_instance = MagicMock()
         mock_config_replacer.return_value = mock_replacer_instance
 
@@ -351,7 +353,7 @@ work_dir = "{{ WORK_DIR }}"
         mocker.patch("pathlib.Path.exists", return_value=True)
 
         # 模拟 ConfigReplacer
-        mock_replacer_class = mocker.patch("fabik.cmd.ConfigReplacer")
+        mock_replacer_class = mocker.patch("fabik.conf.processor.ConfigReplacer")
 
         # 模拟 ConfigWriter
         mock_writer = MagicMock()
@@ -369,8 +371,8 @@ work_dir = "{{ WORK_DIR }}"
         global_state.env_postfix = False
         conf_tpl(["config.json", "settings.toml"])
 
-        # 验证 ConfigReplacer 被正确调用
-        assert mock_replacer_class.call_count == 2
+        # 验证 ConfigReplacer 被正确调用，所有文件共享一个 ConfigReplacer
+        assert mock_replacer_class.call_count == 1
         mock_replacer.set_writer.assert_any_call("config.json", force=False, rename=False, target_postfix="", immediately=True)
         mock_replacer.set_writer.assert_any_call("settings.toml", force=False, rename=False, target_postfix="", immediately=True)
 
@@ -402,7 +404,7 @@ work_dir = "{{ WORK_DIR }}"
         )
 
         # 模拟 ConfigReplacer
-        mock_replacer_class = mocker.patch("fabik.cmd.ConfigReplacer")
+        mock_replacer_class = mocker.patch("fabik.conf.processor.ConfigReplacer")
 
         # 模拟 ConfigWriter
         mock_writer = MagicMock()
@@ -420,8 +422,8 @@ work_dir = "{{ WORK_DIR }}"
         global_state.env_postfix = False
         conf_make(["database.json", "app.json"])
 
-        # 验证 ConfigReplacer 被正确调用
-        assert mock_replacer_class.call_count == 2
+        # 验证 ConfigReplacer 被正确调用，所有文件共享一个 ConfigReplacer
+        assert mock_replacer_class.call_count == 1
         mock_replacer.set_writer.assert_any_call("database.json", force=False, rename=False, target_postfix="", immediately=True)
         mock_replacer.set_writer.assert_any_call("app.json", force=False, rename=False, target_postfix="", immediately=True)
 
@@ -454,7 +456,7 @@ work_dir = "{{ WORK_DIR }}"
         )
 
         # 模拟 ConfigReplacer
-        mock_replacer_class = mocker.patch("fabik.cmd.ConfigReplacer")
+        mock_replacer_class = mocker.patch("fabik.conf.processor.ConfigReplacer")
 
         # 模拟 ConfigWriter
         mock_writer = MagicMock()
@@ -610,4 +612,445 @@ work_dir = "{{ WORK_DIR }}"
         
         # 验证结果
         assert resolved_output_dir == output_dir
-        assert resolved_output_file is None
\ No newline at end of file
+        assert resolved_output_file is None
+
+class TestConfMultiEnv:
+    """测试 --env a,b,c 和 --all-envs 批量渲染多个环境"""
+
+    @pytest.fixture
+    def project_dir(self, temp_dir):
+        """创建一个包含多个环境的真实项目"""
+        tpl_dir = temp_dir / "tpls"
+        tpl_dir.mkdir()
+        (tpl_dir / "app.conf.jinja2").write_text("name={{ NAME }} debug={{ DEBUG }}\n")
+        (temp_dir / "fabik.toml").write_text(
+            f"""
+NAME = 'multi_env'
+WORK_DIR = '{temp_dir.as_posix()}'
+TPL_DIR = '{tpl_dir.as_posix()}'
+
+['app.conf']
+DEBUG = false
+
+['config.toml']
+URI = 'sqlite:///{{{{ DEPLOY_DIR }}}}/db.sqlite'
+
+[ENV.local.'app.conf']
+DEBUG = true
+
+[ENV.prod]
+DEPLOY_DIR = '/srv/app/multi_env_prod'
+
+[ENV.staging]
+
+[ENV.prod.'worker.conf']
+WORKERS = [{{ name = 'mail', queue = 'q-{{{{ NAME }}}}' }}, {{ name = 'sms', queue = 'q2' }}]
+"""
+        )
+        (temp_dir / ".fabik.env").write_text("")
+        global_state.all_envs = False
+        yield temp_dir
+        global_state.all_envs = False
+        global_state.fabik_configs = None
+        global_state.matrix_key = None
+
+    def invoke(self, *args, input: str | None = None):
+        from typer.testing import CliRunner
+        from fabik.cli import main as cli
+
+        return CliRunner().invoke(cli, list(args), input=input, catch_exceptions=False)
+
+    def test_conf_tpl_multiple_envs(self, project_dir):
+        """一次命令为多个环境渲染模板，输出文件名带有环境后缀"""
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local,prod", "conf", "tpl", "app.conf"
+        )
+        assert result.exit_code == 0, result.output
+        assert (project_dir / "app.conf.local").read_text() == "name=multi_env debug=True"
+        assert (project_dir / "app.conf.prod").read_text() == "name=multi_env debug=False"
+        assert not (project_dir / "app.conf.staging").exists()
+
+    def test_conf_make_all_envs(self, project_dir):
+        """--all-envs 处理 ENV 中的所有环境"""
+        result = self.invoke(
+            "--cwd", str(project_dir), "conf", "--all-envs", "make", "config.toml"
+        )
+        assert result.exit_code == 0, result.output
+        for env_name in ["local", "prod", "staging"]:
+            text = (project_dir / f"config.toml.{env_name}").read_text()
+            assert "/srv/app/multi_env/db.sqlite" in text
+
+    def test_conf_tpl_jobs(self, project_dir):
+        """--jobs 在进程池中渲染一个环境的多个模板，错误按照模板的顺序报告"""
+        tpl_dir = project_dir / "tpls"
+        (tpl_dir / "config.toml.jinja2").write_text("uri={{ URI }}")
+        (tpl_dir / "missing.conf.jinja2").write_text("x")
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local", "conf", "tpl",
+            "app.conf", "config.toml", "--jobs", "2",
+        )
+        assert result.exit_code == 0, result.output
+        assert (project_dir / "app.conf").read_text() == "name=multi_env debug=True"
+        assert (project_dir / "config.toml").read_text() == "uri=sqlite:////srv/app/multi_env/db.sqlite"
+
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local", "conf", "-f", "tpl",
+            "missing.conf", "app.conf", "-j", "2",
+        )
+        assert result.exit_code != 0
+        assert "missing.conf (env: local)" in result.output
+        assert "1/2 render jobs failed." in result.output
+
+    def test_conf_tpl_matrix(self, project_dir):
+        """矩阵模式为列表的每一项渲染一次模板，输出文件名带有列表项名称"""
+        (project_dir / "tpls" / "worker.conf.jinja2").write_text("worker={{ w.queue }}")
+        (project_dir / "fabik.toml").write_text(
+            (project_dir / "fabik.toml").read_text() + "\n['worker.conf']\nWORKERS = []\n"
+        )
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local,prod", "conf", "tpl", "worker.conf",
+            "--matrix", "WORKERS", "--matrix-var", "w", "--matrix-name", "name",
+        )
+        assert result.exit_code == 0, result.output
+        assert (project_dir / "worker.conf.mail.prod").read_text() == "worker=q-multi_env"
+        assert (project_dir / "worker.conf.sms.prod").read_text() == "worker=q2"
+        assert not list(project_dir.glob("worker.conf*.local"))
+
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "prod", "conf", "tpl", "worker.conf",
+            "--matrix", "WORKERS", "--matrix-name", "missing",
+        )
+        assert result.exit_code != 0
+        assert "has no field missing" in result.output
+
+    def test_conf_tpl_unknown_env(self, project_dir):
+        """不存在的环境名称导致命令中止"""
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local,nope", "conf", "tpl", "app.conf"
+        )
+        assert result.exit_code != 0
+        assert "nope" in result.output
+
+    def test_conf_get(self, project_dir):
+        """conf get 一次输出多个键的值，ENV 中的值覆盖根中的值，占位符被替换"""
+        keys = ["app.conf.DEBUG", "'config.toml'.URI", "DEPLOY_DIR", "NOPE"]
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local", "conf", "get", *keys[:2],
+            "--stdin", input=json.dumps(keys[2:]),
+        )
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output) == {
+            "app.conf.DEBUG": True,
+            "'config.toml'.URI": "sqlite:////srv/app/multi_env/db.sqlite",
+            "DEPLOY_DIR": "/srv/app/multi_env",
+            "NOPE": None,
+        }
+
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "local,prod", "conf", "get", "app.conf"
+        )
+        assert json.loads(result.output) == {
+            "local": {"app.conf": {"DEBUG": True}},
+            "prod": {"app.conf": {"DEBUG": False}},
+        }
+
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "prod", "conf", "get", "NOPE", "--strict"
+        )
+        assert result.exit_code == 1
+
+    def test_conf_get_root_meta(self, project_dir):
+        """ROOT_META_KEYS 与渲染时相同，ENV 中的 DEPLOY_DIR 不覆盖根中的值"""
+        result = self.invoke(
+            "--cwd", str(project_dir), "-e", "prod", "conf", "get",
+            "DEPLOY_DIR", "'config.toml'.URI",
+        )
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output) == {
+            "DEPLOY_DIR": "/srv/app/multi_env",
+            "'config.toml'.URI": "sqlite:////srv/app/multi_env/db.sqlite",
+        }
+
+    def test_render_jobs_in_process_pool(self, project_dir):
+        """进程池中的输出按照任务顺序返回"""
+        from fabik.conf import FabikConfigFile
+        from fabik.conf.batch import RenderJob, render_jobs
+
+        fabik_file = FabikConfigFile.gen_fabik_config_file(work_dir=project_dir)
+        configs = fabik_file.load_configs()
+        jobs = [
+            RenderJob(env_name, "app.conf", tpl_dir=project_dir / "tpls", target_postfix=f".{env_name}")
+            for env_name in configs
+        ] + [RenderJob("prod", "missing.conf", tpl_dir=project_dir / "tpls")]
+        results = render_jobs(configs, jobs, project_dir, max_workers=2)
+
+        assert [r.job for r in results] == jobs
+        assert [r.ok for r in results] == [True, True, True, False]
+        assert results[0].target == project_dir / "app.conf.local"
+        assert "app.conf.local" in results[0].output
+        assert (project_dir / "app.conf.staging").exists()
+
+
+class TestTplEnv:
+    """测试共享的 jinja2.Environment 和字节码缓存"""
+
+    def test_tpl_env_shared(self, temp_dir):
+        """同一个 tpl_dir 共享一个 Environment"""
+        from fabik.conf.processor import get_tpl_env
+
+        cache_dir = temp_dir / "cache"
+        assert get_tpl_env(temp_dir, cache_dir) is get_tpl_env(temp_dir, cache_dir)
+        assert get_tpl_env(temp_dir, cache_dir) is not get_tpl_env(temp_dir)
+
+    def test_precompile_templates(self, temp_dir):
+        """预编译模板文件夹，字节码保存到缓存文件夹中"""
+        from fabik.conf.processor import precompile_templates
+
+        tpl_dir = temp_dir / "tpls"
+        (tpl_dir / "sub").mkdir(parents=True)
+        (tpl_dir / "base.jinja2").write_text("{% block body %}{% endblock %}")
+        (tpl_dir / "sub" / "app.conf.jinja2").write_text(
+            '{% extends "base.jinja2" %}{% block body %}{{ NAME }}{% endblock %}'
+        )
+        (tpl_dir / "readme.txt").write_text("not a template")
+        cache_dir = temp_dir / ".fabik_cache" / "jinja2"
+
+        names = precompile_templates(tpl_dir, cache_dir)
+        assert names == ["base.jinja2", "sub/app.conf.jinja2"]
+        assert len(list(cache_dir.glob("__jinja2_*.cache"))) == 2
+
+
+class TestConfigReplacer:
+    """测试 ConfigReplacer 对配置值的替换"""
+
+    def test_replace_value(self, temp_dir):
+        """只渲染包含占位符的字符串，其它类型的值保持不变"""
+        from fabik.conf import ConfigReplacer, FabikConfig
+        from fabik.conf.processor import compile_value_template
+
+        config = FabikConfig(
+            {
+                "NAME": "replacer",
+                "DEPLOY_DIR": "/srv/app/replacer",
+                "config.toml": {
+                    "DIR": "{{ DEPLOY_DIR }}/logs",
+                    "PORT": 5000,
+                    "RATE": 0.5,
+                    "ENABLED": True,
+                    "PLAIN": "no placeholder",
+                    "PATHS": ["{{ NAME }}.sock", 1, {"SUB": "{{ NAME }}"}],
+                    "{{ NAME }}_KEY": "value",
+                },
+            }
+        )
+        replacer = ConfigReplacer(config, temp_dir)
+        compile_value_template.cache_clear()
+        obj = replacer.get_replace_obj("config.toml")
+
+        assert obj["DIR"] == "/srv/app/replacer/logs"
+        assert obj["PORT"] == 5000
+        assert obj["RATE"] == 0.5
+        assert obj["ENABLED"] is True
+        assert obj["PLAIN"] == "no placeholder"
+        assert obj["PATHS"] == ["replacer.sock", 1, {"SUB": "replacer"}]
+        assert obj["replacer_KEY"] == "value"
+        assert obj["NAME"] == "replacer"
+
+        # 相同的值只编译一次
+        replacer.get_replace_obj("config.toml")
+        info = compile_value_template.cache_info()
+        assert info.misses == 4
+        assert info.hits == 4
+
+    def test_lazy_environ(self, temp_dir):
+        """REPLACE_ENVIRON 中的变量仅在被引用时获取，并且只获取一次"""
+        from fabik.conf import ConfigReplacer, FabikConfig
+        from fabik.error import ConfigError
+
+        (temp_dir / "token.txt").write_text("secret-token\n")
+        count_file = temp_dir / "count.txt"
+        config = FabikConfig(
+            {
+                "NAME": "lazy",
+                "REPLACE_ENVIRON": ["TOKEN", "PASSWORD", "BROKEN"],
+                "config.toml": {
+                    "TOKEN": "{{ TOKEN }}",
+                    "PASSWORD": "{{ PASSWORD }}",
+                    "AGAIN": "{{ PASSWORD }}-{{ NAME }}",
+                },
+                "app.conf": {"PORT": 5000, "DIR": "{{ DEPLOY_DIR }}"},
+                "ENV": {"prod": {}},
+            },
+            {
+                "LAZY_PROD_TOKEN": "@file:token.txt",
+                "LAZY_PROD_PASSWORD": "@cmd:echo run >> count.txt && echo pa55",
+                "LAZY_PROD_BROKEN": "@cmd:echo hidden && exit 3",
+            },
+            env_name="prod",
+        )
+        replacer = ConfigReplacer(config, temp_dir)
+
+        # 没有引用任何变量时不执行命令
+        assert replacer.get_replace_obj("app.conf")["DIR"] == "/srv/app/lazy"
+        assert not count_file.exists()
+
+        obj = replacer.get_replace_obj("config.toml")
+        assert obj["TOKEN"] == "secret-token"
+        assert obj["PASSWORD"] == "pa55"
+        assert obj["AGAIN"] == "pa55-lazy"
+        replacer.get_replace_obj("config.toml")
+        assert count_file.read_text() == "run\n"
+
+        with pytest.raises(ConfigError) as exc_info:
+            replacer.replace("{{ BROKEN }}")
+        assert "exited with 3" in exc_info.value.err_msg
+        assert "hidden" not in exc_info.value.err_msg
+
+
+class TestIncrementalOutput:
+    """测试基于内容 hash 的增量输出"""
+
+    def test_write_stats_not_shared(self):
+        """每个 GlobalState 使用自己的写入统计，conf 命令开始时重置统计"""
+        from fabik.cmd import GlobalState
+        from fabik.cmd.conf import conf_callback
+        from fabik.conf.manifest import WriteStatus
+
+        state = GlobalState()
+        state.write_stats[WriteStatus.NEW] += 1
+        assert GlobalState().write_stats == {}
+
+        global_state.write_stats[WriteStatus.NEW] += 1
+        conf_callback()
+        assert global_state.write_stats == {}
+
+    def test_write_status(self, temp_dir):
+        """内容相同时不写入文件，mtime 保持不变"""
+        from fabik.conf import ConfigWriter
+        from fabik.conf.manifest import WriteStatus
+        from fabik.tpl import FABIK_MANIFEST_FILE
+
+        dst_file = temp_dir / "config.toml"
+        writer = ConfigWriter("config.toml", dst_file, {"PORT": 5000})
+        assert writer.write_file() == WriteStatus.NEW
+        assert (temp_dir / FABIK_MANIFEST_FILE).exists()
+        mtime_ns = dst_file.stat().st_mtime_ns
+
+        assert writer.write_file() == WriteStatus.UNCHANGED
+        assert dst_file.stat().st_mtime_ns == mtime_ns
+
+        writer = ConfigWriter("config.toml", dst_file, {"PORT": 5001})
+        assert writer.write_file(force=False) == WriteStatus.SKIPPED
+        assert "5000" in dst_file.read_text()
+        assert writer.write_file() == WriteStatus.CHANGED
+        assert "5001" in dst_file.read_text()
+
+    def test_manual_edit_detected(self, temp_dir):
+        """输出文件被手动修改后，清单中的 hash 不再被信任"""
+        from fabik.conf import ConfigWriter
+        from fabik.conf.manifest import WriteStatus
+
+        dst_file = temp_dir / "config.json"
+        writer = ConfigWriter("config.json", dst_file, {"A": 1})
+        writer.write_file()
+        dst_file.write_text("edited by hand")
+        assert writer.write_file() == WriteStatus.CHANGED
+        assert json.loads(dst_file.read_text()) == {"A": 1}
+
+    def test_atomic_write(self, temp_dir):
+        """写入保留文件的权限，渲染出错时目标文件保持不变，不留下临时文件"""
+        import os
+        from fabik.conf.processor import TplWriter
+        from fabik.conf.manifest import WriteStatus
+        from fabik.error import TplError
+
+        tpl_dir = temp_dir / "tpls"
+        tpl_dir.mkdir()
+        (tpl_dir / "app.conf.jinja2").write_text(
+            "{% for i in range(N) %}{{ 1 // i if FAIL else i }}\n{% endfor %}"
+        )
+        out_dir = temp_dir / "out"
+        out_dir.mkdir()
+        dst_file = out_dir / "app.conf"
+        writer = TplWriter("app.conf", dst_file, {"N": 3, "FAIL": False}, tpl_dir)
+        assert writer.write_file() == WriteStatus.NEW
+        assert dst_file.read_text() == "0\n1\n2\n"
+        os.chmod(dst_file, 0o640)
+
+        writer = TplWriter("app.conf", dst_file, {"N": 4, "FAIL": False}, tpl_dir)
+        assert writer.write_file() == WriteStatus.CHANGED
+        assert dst_file.read_text() == "0\n1\n2\n3\n"
+        assert dst_file.stat().st_mode & 0o777 == 0o640
+
+        writer = TplWriter("app.conf", dst_file, {"N": 5, "FAIL": True}, tpl_dir)
+        with pytest.raises(ZeroDivisionError):
+            writer.write_file()
+        assert dst_file.read_text() == "0\n1\n2\n3\n"
+        assert sorted(p.name for p in out_dir.iterdir()) == [
+            ".fabik.manifest.json",
+            "app.conf",
+        ]
+
+        (tpl_dir / "app.conf.jinja2").write_text("{{ undefined_func() }}")
+        writer = TplWriter("app.conf", dst_file, {}, tpl_dir)
+        with pytest.raises(TplError):
+            writer.write_file()
+        assert len(list(out_dir.iterdir())) == 2
+
+    def test_symlinked_output(self, temp_dir):
+        """输出文件是符号链接时，替换链接指向的文件，链接本身保持不变"""
+        from fabik.conf.manifest import AtomicOutput
+
+        real_dir = temp_dir / "shared"
+        real_dir.mkdir()
+        real_file = real_dir / "app.conf"
+        real_file.write_text("old")
+        link = temp_dir / "app.conf"
+        link.symlink_to(real_file)
+
+        with AtomicOutput(link) as output:
+            output.write("new")
+            output.commit()
+        assert link.is_symlink()
+        assert real_file.read_text() == "new"
+        assert sorted(p.name for p in real_dir.iterdir()) == ["app.conf"]
+
+    def test_get_umask(self):
+        """读取 umask 不修改进程的 umask"""
+        import os
+        from fabik.conf.manifest import get_umask
+
+        old = os.umask(0o027)
+        try:
+            assert get_umask() == 0o027
+        finally:
+            os.umask(old)
+
+    def test_manifest_threads(self, temp_dir):
+        """多个线程同时保存同一个清单，临时文件不会冲突，也不会留下临时文件"""
+        from concurrent.futures import ThreadPoolExecutor
+        from fabik.conf import ConfigWriter
+        from fabik.conf.manifest import OutputManifest
+
+        def write(i: int):
+            ConfigWriter(f"c{i}.json", temp_dir / f"c{i}.json", {"I": i}).write_file()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write, range(16)))
+        manifest = OutputManifest.for_file(temp_dir / "c0.json")
+        assert manifest.entries
+        assert set(manifest.entries) <= {f"c{i}.json" for i in range(16)}
+        assert not list(temp_dir.glob("*.tmp"))
+
+    def test_not_recorded(self, temp_dir):
+        """record 为 False 时写入文件，但不记录在清单中"""
+        from fabik.conf import ConfigReplacer, FabikConfig
+        from fabik.tpl import FABIK_MANIFEST_FILE
+
+        config = FabikConfig({"NAME": "manifest", "config.json": {"A": 1}})
+        replacer = ConfigReplacer(config, temp_dir)
+        _, final_file = replacer.set_writer(
+            "config.json", target_postfix=".prod", immediately=True, record=False
+        )
+        assert final_file.read_text()
+        assert not (temp_dir / FABIK_MANIFEST_FILE).exists()
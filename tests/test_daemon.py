@@ -0,0 +1,164 @@
+"""
+Tests for fabik.conf.daemon and fabik.client
+"""
+
+import threading
+from pathlib import Path
+
+import pytest
+
+from fabik.client import DaemonClient, DaemonClientError, get_socket_file
+from fabik.conf import FabikConfigFile, config_validator_name_workdir
+from fabik.conf.daemon import METHOD_NOT_FOUND, DaemonState, serve
+
+
+FABIK_TOML = """
+NAME = 'daemon_test'
+WORK_DIR = '{work_dir}'
+TPL_DIR = '{tpl_dir}'
+
+['app.conf']
+PORT = 5000
+URL = 'http://{{{{ NAME }}}}'
+
+[ENV.prod.'app.conf']
+PORT = {port}
+"""
+
+
+def write_fabik_toml(temp_dir: Path, port: int):
+    (temp_dir / "fabik.toml").write_text(
+        FABIK_TOML.format(
+            work_dir=temp_dir.as_posix(), tpl_dir=(temp_dir / "tpls").as_posix(), port=port
+        )
+    )
+
+
+@pytest.fixture
+def daemon(temp_dir: Path):
+    """在线程中启动 daemon，返回 DaemonState"""
+    (temp_dir / "tpls").mkdir()
+    (temp_dir / "tpls" / "app.conf.jinja2").write_text("port={{ PORT }}")
+    (temp_dir / ".fabik.env").write_text("")
+    write_fabik_toml(temp_dir, 80)
+    state = DaemonState(
+        FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir),
+        [config_validator_name_workdir],
+    )
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=serve,
+        args=(state,),
+        kwargs=dict(polling=True, on_ready=lambda _: ready.set()),
+        daemon=True,
+    )
+    thread.start()
+    assert ready.wait(5)
+    yield state
+    try:
+        with DaemonClient(work_dir=temp_dir, timeout=5) as client:
+            client.shutdown()
+    except DaemonClientError:
+        pass
+    thread.join(5)
+    assert not get_socket_file(temp_dir).exists()
+
+
+class TestDaemon:
+    """测试 daemon 的 JSON-RPC 方法"""
+
+    def test_methods(self, daemon: DaemonState, temp_dir: Path):
+        """一个连接中发送多个请求，配置和 ConfigReplacer 保持在内存中"""
+        with DaemonClient(work_dir=temp_dir) as client:
+            assert client.ping()["work_dir"] == temp_dir.as_posix()
+            assert client.query(["app.conf.PORT", "app.conf.URL", "NOPE"], env="prod") == {
+                "values": {"app.conf.PORT": 80, "app.conf.URL": "http://daemon_test", "NOPE": None},
+                "missing": ["NOPE"],
+            }
+            results = client.render(["app.conf", "missing.conf"], env="prod")
+            assert results[0]["content"] == "port=80"
+            assert results[1]["error"]
+            assert not (temp_dir / "app.conf").exists()
+
+            assert client.render(["app.conf"], write=True)[0]["status"] == "new"
+            assert (temp_dir / "app.conf").read_text() == "port=5000"
+
+            items = client.validate()
+            assert [i["env_name"] for i in items] == ["prod", "prod"]
+            assert all(i["ok"] for i in items)
+
+            with pytest.raises(DaemonClientError) as e:
+                client.call("nope")
+            assert e.value.code == METHOD_NOT_FOUND
+            # 出错之后连接仍然可用
+            assert client.ping()["requests"] == 6
+        assert len(daemon.replacers) == 3
+
+    def test_reload(self, daemon: DaemonState, temp_dir: Path):
+        """配置文件改变之后重新载入配置"""
+        with DaemonClient(work_dir=temp_dir) as client:
+            assert client.query(["app.conf.PORT"], env="prod")["values"]["app.conf.PORT"] == 80
+            write_fabik_toml(temp_dir, 8080)
+            with daemon.lock:
+                assert daemon.handle_changes({temp_dir / "fabik.toml"})
+                assert not daemon.handle_changes({temp_dir / "tpls" / "app.conf.jinja2"})
+            assert client.query(["app.conf.PORT"], env="prod")["values"]["app.conf.PORT"] == 8080
+            assert client.ping()["reloads"] == 1
+
+    def test_socket_permission(self, daemon: DaemonState, temp_dir: Path):
+        """socket 文件仅当前用户可以连接，所在的缓存文件夹权限为 0700"""
+        socket_file = get_socket_file(temp_dir)
+        assert socket_file.stat().st_mode & 0o777 == 0o600
+        assert socket_file.parent.stat().st_mode & 0o777 == 0o700
+
+
+class TestDaemonServe:
+    """测试 fabik daemon serve 命令"""
+
+    def test_bind_error(self, temp_dir: Path, mocker):
+        """无法监听 socket 时输出错误并中止"""
+        import typer
+        from fabik.cmd import global_state
+        from fabik.cmd.daemon import daemon_serve
+
+        (temp_dir / ".fabik.env").write_text("")
+        write_fabik_toml(temp_dir, 80)
+        mocker.patch.object(
+            global_state,
+            "fabik_file",
+            FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir),
+            create=True,
+        )
+        mocker.patch.object(global_state, "_config_validators", [])
+        mock_echo_error = mocker.patch("fabik.cmd.daemon.echo_error")
+        socket_file = temp_dir / ("s" * 200) / "daemon.sock"
+        with pytest.raises(typer.Abort):
+            daemon_serve(socket_file)
+        assert socket_file.as_posix() in mock_echo_error.call_args.args[0]
+
+
+class TestCaptureEcho:
+    """测试 capture_echo 仅收集当前线程的输出"""
+
+    def test_other_threads(self, capsys):
+        from fabik.error import capture_echo, echo_info
+
+        in_capture = threading.Event()
+        echoed = threading.Event()
+
+        def watcher():
+            in_capture.wait(5)
+            echo_info("from watcher")
+            echoed.set()
+
+        thread = threading.Thread(target=watcher)
+        thread.start()
+        with capture_echo() as buffer:
+            echo_info("from request")
+            in_capture.set()
+            assert echoed.wait(5)
+        thread.join(5)
+        assert "from request" in buffer.getvalue()
+        assert "from watcher" not in buffer.getvalue()
+        out = capsys.readouterr().out
+        assert "from watcher" in out and "from request" not in out
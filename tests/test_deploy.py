@@ -0,0 +1,276 @@
+"""
+Tests for fabik.deploy module
+"""
+
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("fabric")
+
+from fabric.connection import Connection  # noqa: E402
+from invoke.exceptions import Exit  # noqa: E402
+
+from fabik.conf import FabikConfig  # noqa: E402
+from fabik.deploy import Deploy  # noqa: E402
+from fabik.deploy.fleet import (  # noqa: E402
+    get_fabric_hosts,
+    get_rolling_batches,
+    run_on_hosts,
+    run_rolling,
+)
+from fabik.error import ConfigError  # noqa: E402
+
+
+def run_local(command: str, **kwargs):
+    """在本地的 shell 中执行远程命令"""
+    proc = subprocess.run(command, shell=True, capture_output=True, text=True)
+    return SimpleNamespace(
+        stdout=proc.stdout, stderr=proc.stderr, ok=proc.returncode == 0
+    )
+
+
+@pytest.fixture
+def deploy(temp_dir):
+    """远程命令在本地执行的 Deploy，DEPLOY_DIR 为临时文件夹"""
+    deploy_dir = temp_dir / "srv"
+    deploy_dir.mkdir()
+    config = FabikConfig(
+        {"NAME": "deploy_test", "DEPLOY_DIR": deploy_dir.as_posix(), "PYE": "python3"}
+    )
+    conn = MagicMock(spec=Connection)
+    conn.run.side_effect = run_local
+    return Deploy(config, temp_dir, conn)
+
+
+class TestDeployProbe:
+    """测试批量探测远程文件"""
+
+    def test_probe(self, deploy):
+        """一次远程调用探测多个路径，结果被缓存，写入之后失效"""
+        deploy_dir = deploy.get_remote_path()
+        (deploy.replacer.deploy_dir / "app.conf").write_text("abc")
+        app_conf = deploy.get_remote_path("app.conf")
+        missing = deploy.get_remote_path("missing")
+
+        stats = deploy.probe(deploy_dir, app_conf, missing, hash=True)
+        assert deploy.conn.run.call_count == 1
+        assert stats[deploy_dir].type == "dir"
+        assert stats[app_conf].exists and stats[app_conf].type == "file"
+        assert stats[app_conf].size == 3
+        assert stats[app_conf].mtime is not None
+        assert stats[app_conf].sha256 == hashlib.sha256(b"abc").hexdigest()
+        assert not stats[missing].exists
+
+        # 缓存中的路径不再探测
+        assert deploy.remote_exists(app_conf)
+        assert not deploy.remote_exists(missing)
+        assert deploy.conn.run.call_count == 1
+
+        # 创建的文件夹直接记录在缓存中
+        deploy.make_remote_dir("missing")
+        assert deploy.remote_exists(missing)
+        assert deploy.remote_exists(app_conf)
+        assert deploy.conn.run.call_count == 2
+
+        # 文件夹改变之后，其中的路径全部失效
+        deploy.invalidate(deploy_dir)
+        assert deploy.probe(app_conf, missing)[missing].type == "dir"
+        assert deploy.conn.run.call_count == 3
+
+
+class TestRemotePlan:
+    """测试合并远程操作"""
+
+    def test_init_remote_dir(self, deploy):
+        """部署需要的所有文件夹在一次远程调用中创建，已经存在的文件夹不再创建"""
+        deploy.config_files = {"config.toml": "config.toml", "conf/app.ini": "conf/app.ini"}
+        deploy_dir = deploy.replacer.deploy_dir
+        deploy.init_remote_dir()
+        assert deploy.conn.run.call_count == 1
+        for name in ["logs", "output", "conf"]:
+            assert (deploy_dir / name).is_dir()
+
+        deploy.init_remote_dir()
+        deploy.make_remote_dir("logs")
+        assert deploy.conn.run.call_count == 1
+
+    def test_local_symlink(self, temp_dir):
+        """远程路径不使用本地的符号链接解析"""
+        real = temp_dir / "real"
+        real.mkdir()
+        link = temp_dir / "link"
+        link.symlink_to(real)
+        config = FabikConfig(
+            {"NAME": "deploy_test", "DEPLOY_DIR": (link / "app").as_posix(), "PYE": "python3"}
+        )
+        deploy = Deploy(config, temp_dir, MagicMock(spec=Connection))
+        root = (link / "app").as_posix()
+        assert deploy.get_remote_dirs() == [root, f"{root}/logs", f"{root}/output"]
+        assert deploy._normalize_remote_path(link / "app") == root
+
+    def test_rsync_exclude(self, deploy, mocker):
+        """总是排除缓存文件夹和输出清单"""
+        from fabik.tpl import FABIK_CACHE_DIR, FABIK_MANIFEST_FILE
+
+        deploy.share_connection = False
+        mock_rsync = mocker.patch("fabik.deploy.rsync")
+        deploy.rsync(exclude="*.pyc")
+        assert mock_rsync.call_args.kwargs["exclude"] == [
+            "*.pyc",
+            FABIK_CACHE_DIR,
+            FABIK_MANIFEST_FILE,
+        ]
+
+    def test_plan(self, deploy):
+        """按照顺序执行，失败时停止并报错"""
+        pid_file = deploy.get_remote_path("app.pid")
+        (deploy.replacer.deploy_dir / "app.pid").write_text("1")
+        assert deploy.remote_exists(pid_file)
+
+        plan = deploy.plan().mkdir(deploy.get_remote_path("a/b")).remove(pid_file)
+        assert len(plan) == 2
+        plan.execute()
+        assert (deploy.replacer.deploy_dir / "a" / "b").is_dir()
+        assert not deploy.remote_exists(pid_file)
+        assert len(plan) == 0 and plan.execute() is None
+
+        marker = deploy.replacer.deploy_dir / "marker"
+        plan.run("false").run(f"touch {marker.as_posix()}")
+        with pytest.raises(Exit):
+            plan.execute()
+        assert not marker.exists()
+
+
+class TestFleet:
+    """测试多台服务器的部署"""
+
+    def test_get_fabric_hosts(self):
+        """hosts 中的每一项覆盖 FABRIC 中的参数，CONFIG 覆盖 fabik 配置"""
+        fabric_conf = {
+            "host": "ignored",
+            "user": "app",
+            "connect_kwargs": {"key_filename": "id_rsa"},
+            "hosts": [
+                "web1",
+                {
+                    "host": "web2",
+                    "port": 2222,
+                    "connect_kwargs": {"timeout": 3},
+                    "CONFIG": {"DEPLOY_DIR": "/srv/web2"},
+                },
+                {"name": "web1-admin", "host": "web1", "user": "admin"},
+            ],
+        }
+        hosts = get_fabric_hosts(fabric_conf)
+        assert [h.name for h in hosts] == ["web1", "web2", "web1-admin"]
+        assert hosts[0].conn_kwargs == {
+            "host": "web1",
+            "user": "app",
+            "connect_kwargs": {"key_filename": "id_rsa"},
+        }
+        assert hosts[1].conn_kwargs["port"] == 2222
+        assert hosts[1].conn_kwargs["connect_kwargs"] == {"key_filename": "id_rsa", "timeout": 3}
+        assert hosts[1].overrides == {"DEPLOY_DIR": "/srv/web2"}
+        assert hosts[2].conn_kwargs["user"] == "admin"
+
+        # 没有 hosts 时 FABRIC 本身就是一台服务器
+        assert [h.name for h in get_fabric_hosts({"host": "web1", "user": "app"})] == ["web1"]
+
+        with pytest.raises(ConfigError):
+            get_fabric_hosts({"user": "app", "hosts": ["web1", "web1"]})
+        with pytest.raises(ConfigError):
+            get_fabric_hosts({"hosts": ["web1"]})
+
+    def test_run_on_hosts(self):
+        """同时执行的服务器数量不超过 parallel，一台服务器失败不影响其他服务器"""
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def action(d):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.05)
+            with lock:
+                running["now"] -= 1
+            if d.name == "web3":
+                raise ConfigError(err_type=ValueError(), err_msg="broken")
+
+        deploys = {n: SimpleNamespace(name=n) for n in ["web1", "web2", "web3", "web4"]}
+        results = run_on_hosts(deploys, action, parallel=2)
+        assert [r.name for r in results] == list(deploys)
+        assert [r.ok for r in results] == [True, True, False, True]
+        assert results[2].error == "broken"
+        assert all(r.elapsed >= 0.05 for r in results)
+        assert running["max"] == 2
+
+    def test_run_rolling(self):
+        """先执行金丝雀，然后分批执行，一批失败时跳过剩余的服务器"""
+        names = ["web1", "web2", "web3", "web4", "web5"]
+        assert get_rolling_batches(names, 2) == [["web1"], ["web2", "web3"], ["web4", "web5"]]
+        assert get_rolling_batches(names, 3, canary=0) == [names[:3], names[3:]]
+        assert get_rolling_batches(names[:1], 2, canary=2) == [["web1"]]
+
+        done = []
+
+        def action(d):
+            done.append(d.name)
+            if d.name == "web3":
+                raise ConfigError(err_type=ValueError(), err_msg="not ready")
+
+        deploys = {n: SimpleNamespace(name=n) for n in names}
+        results = run_rolling(deploys, action, batch_size=2)
+        assert sorted(done) == ["web1", "web2", "web3"]
+        assert [r.ok for r in results] == [True, True, False, False, False]
+        assert [r.skipped for r in results] == [False, False, False, True, True]
+
+
+class TestWaitReady:
+    """测试等待服务就绪"""
+
+    def test_health_check(self, deploy):
+        """重复执行 HEALTH_CHECK 直到成功，超时报错"""
+        ready = deploy.replacer.deploy_dir / "ready"
+        deploy.fabik_conf.setcfg(
+            "HEALTH_CHECK",
+            value={"command": f"test -f {ready.as_posix()}", "timeout": 0.2, "interval": 0.05},
+        )
+        with pytest.raises(Exit):
+            deploy.wait_ready()
+        assert deploy.conn.run.call_count > 1
+
+        ready.touch()
+        assert deploy.wait_ready() >= 0
+
+    def test_health_check_required(self, deploy):
+        """没有 HEALTH_CHECK 时报错，不再通过 pid 文件判断"""
+        assert deploy.get_health_check()["command"] is None
+        with pytest.raises(Exit):
+            deploy.wait_ready()
+        assert deploy.conn.run.call_count == 0
+
+    def test_rolling_requires_health_check(self, deploy, mocker):
+        """分批重载时，没有 HEALTH_CHECK 的服务器不会被重载"""
+        from fabik.cmd.server import _reload_ready
+
+        reload = mocker.patch.object(deploy, "reload", create=True)
+        with pytest.raises(Exit):
+            _reload_ready(deploy)
+        reload.assert_not_called()
+
+    def test_health_check_placeholder(self, deploy):
+        """HEALTH_CHECK 中的占位符被替换"""
+        deploy.fabik_conf.setcfg(
+            "HEALTH_CHECK", value="test -f {{ DEPLOY_DIR }}/ready"
+        )
+        (deploy.replacer.deploy_dir / "ready").touch()
+        check = deploy.get_health_check()
+        assert check["command"] == f"test -f {deploy.replacer.deploy_dir.as_posix()}/ready"
+        assert deploy.wait_ready() >= 0
@@ -0,0 +1,137 @@
+"""
+Tests for fabik.conf.deps
+"""
+
+from pathlib import Path
+
+import pytest
+
+from fabik.conf import FabikConfigFile
+from fabik.conf.batch import RenderJob
+from fabik.conf.deps import DependencyGraph, OutputDeps, diff_config_paths
+from fabik.conf.rebuild import Rebuilder
+
+
+FABIK_TOML = """
+NAME = 'deps_test'
+WORK_DIR = '{work_dir}'
+TPL_DIR = '{tpl_dir}'
+
+['app.conf']
+PORT = 5000
+LOG = '{{{{ DEPLOY_DIR }}}}/logs'
+DB = {{ HOST = 'localhost', USER = 'app' }}
+UNUSED = 1
+
+['worker.conf']
+QUEUES = {{ default = 1, mail = 2 }}
+
+[ENV.local]
+[ENV.prod.'app.conf']
+PORT = 80
+"""
+
+
+@pytest.fixture
+def rebuilder(temp_dir: Path) -> Rebuilder:
+    tpl_dir = temp_dir / "tpls"
+    tpl_dir.mkdir()
+    (tpl_dir / "app.conf.jinja2").write_text(
+        'port={{ PORT }} log={{ LOG }} host={{ DB.HOST }} {% include "base.jinja2" %}'
+    )
+    (tpl_dir / "base.jinja2").write_text("name={{ NAME }}")
+    (tpl_dir / "worker.conf.jinja2").write_text(
+        "{% for k, v in QUEUES.items() %}{{ k }}={{ v }} {% endfor %}"
+    )
+    (temp_dir / "fabik.toml").write_text(
+        FABIK_TOML.format(work_dir=temp_dir.as_posix(), tpl_dir=tpl_dir.as_posix())
+    )
+    (temp_dir / ".fabik.env").write_text("")
+    fabik_file = FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir)
+    configs = fabik_file.load_configs(["local", "prod"])
+    jobs = [
+        RenderJob(env, tpl, tpl_dir=tpl_dir, target_postfix=f".{env}")
+        for env in configs
+        for tpl in ["app.conf", "worker.conf"]
+    ]
+    return Rebuilder(fabik_file, configs, jobs)
+
+
+class TestDependencyGraph:
+    """测试输出文件的依赖图"""
+
+    def test_tracked_dependencies(self, rebuilder, temp_dir):
+        """记录模板读取的配置路径、占位符引用的变量和 include 的模板"""
+        results = rebuilder.track(range(len(rebuilder.jobs)))
+        assert all(r.ok for r in results)
+        assert not (temp_dir / "app.conf.local").exists()
+
+        deps = rebuilder.graph.outputs["app.conf@local"]
+        assert deps.keys == {
+            ("app.conf", "PORT"),
+            ("app.conf", "LOG"),
+            ("app.conf", "DB", "HOST"),
+            ("DEPLOY_DIR",),
+            ("NAME",),
+        }
+        assert deps.templates == {
+            (temp_dir / "tpls" / "app.conf.jinja2").as_posix(),
+            (temp_dir / "tpls" / "base.jinja2").as_posix(),
+        }
+        # 遍历整个 dict 时依赖 dict 自身
+        assert rebuilder.graph.outputs["worker.conf@local"].keys == {
+            ("worker.conf", "QUEUES")
+        }
+
+    def test_affected_by_key(self, rebuilder):
+        """查询键改变时需要重新渲染的输出文件"""
+        rebuilder.track(range(len(rebuilder.jobs)))
+        graph = rebuilder.graph
+
+        assert graph.affected_by_key(("app.conf", "UNUSED")) == set()
+        assert graph.affected_by_key(("app.conf", "DB", "USER")) == set()
+        assert graph.affected_by_key(("app.conf", "PORT"), "prod") == {"app.conf@prod"}
+        # 改变整个表影响所有读取了其中的值的输出文件
+        assert graph.affected_by_key(("app.conf",)) == {"app.conf@local", "app.conf@prod"}
+        # 改变 dict 中的某个值影响遍历了整个 dict 的输出文件
+        assert graph.affected_by_key(("worker.conf", "QUEUES", "mail")) == {
+            "worker.conf@local",
+            "worker.conf@prod",
+        }
+        assert graph.resolve_key("ENV.prod.app.conf.DB.HOST") == (
+            "prod",
+            ("app.conf", "DB", "HOST"),
+        )
+
+    def test_graph_cache(self, rebuilder, temp_dir):
+        """依赖图保存在缓存中，模板文件改变后缓存失效"""
+        rebuilder.track(range(len(rebuilder.jobs)))
+        rebuilder.save_graph()
+
+        graph = rebuilder.graph
+        rebuilder.graph = DependencyGraph()
+        assert rebuilder.load_graph()
+        assert rebuilder.graph.to_data() == graph.to_data()
+
+        (temp_dir / "tpls" / "base.jinja2").write_text("project={{ NAME }}")
+        assert not rebuilder.load_graph()
+
+    def test_diff_config_paths(self, rebuilder):
+        """比较新旧配置得到改变的配置路径"""
+        old = rebuilder.configs["prod"]
+        new = rebuilder.fabik_file.load_configs(["prod"])["prod"]
+        new.root_data["ENV"]["prod"]["app.conf"]["PORT"] = 8080
+        new.root_data["worker.conf"]["QUEUES"]["mail"] = 3
+        assert diff_config_paths(old, new) == {
+            ("app.conf", "PORT"),
+            ("worker.conf", "QUEUES", "mail"),
+        }
+
+    def test_remove_output(self):
+        """替换输出文件的依赖时，反向索引同时更新"""
+        graph = DependencyGraph()
+        graph.add(OutputDeps("a", "", {("T", "X")}, {"/tpl/a.jinja2"}))
+        graph.add(OutputDeps("a", "", {("T", "Y")}, set()))
+        assert graph.affected_by_key(("T", "X")) == set()
+        assert graph.affected_by_key(("T", "Y")) == {"a"}
+        assert graph.affected_by_template("/tpl/a.jinja2") == set()
@@ -0,0 +1,57 @@
+"""
+Tests for fabik.runtime
+"""
+
+import datetime
+from pathlib import Path
+
+import pytest
+
+from fabik.conf import ConfigWriter
+from fabik.runtime import Array, BundleError, Table, dump_bundle, load_bundle
+
+
+class TestBundle:
+    """测试二进制配置包的写入和读取"""
+
+    def test_round_trip(self, temp_dir: Path):
+        """ConfigWriter 写入的配置包与原始数据相同，嵌套的表和数组按需解码"""
+        data = {
+            "NAME": "app",
+            "PORT": 5000,
+            "RATIO": 0.5,
+            "DEBUG": False,
+            "BIG": -(2**63),
+            "CREATED": datetime.datetime(2024, 1, 2, 3, 4, 5),
+            "DB": {"URI": "sqlite:///app.db", "名字": "中文", "a.b": 1},
+            "HOSTS": ["a", {"HOST": "b"}, [1, 2]],
+            "EMPTY": {},
+        }
+        dst_file = temp_dir / "config.toml.fbk"
+        ConfigWriter("config.toml", dst_file, data).write_file()
+
+        with load_bundle(dst_file) as bundle:
+            assert bundle.to_dict() == data
+            assert isinstance(bundle["DB"], Table)
+            assert isinstance(bundle["HOSTS"], Array)
+            assert bundle.get("DB.URI") == "sqlite:///app.db"
+            assert bundle.get(("DB", "a.b")) == 1
+            assert bundle.get("DB.NOT_EXISTS", 1) == 1
+            assert bundle.get("PORT.X") is None
+            assert bundle["HOSTS"][-1][1] == 2
+            assert "名字" in bundle["DB"] and "X" not in bundle["DB"]
+            with pytest.raises(KeyError):
+                bundle["NOT_EXISTS"]
+
+    def test_invalid(self, temp_dir: Path):
+        """无法写入的值和不是配置包的文件抛出 BundleError"""
+        with pytest.raises(BundleError):
+            dump_bundle({"A": None})
+        with pytest.raises(BundleError):
+            dump_bundle({"A": 2**64})
+
+        for content in (b"", b"not a bundle", dump_bundle({"A": 1})[:-4]):
+            file = temp_dir / "bad.fbk"
+            file.write_bytes(content)
+            with pytest.raises(BundleError):
+                load_bundle(file)
@@ -0,0 +1,373 @@
+"""
+Tests for fabik.conf.storage and fabik.conf.cache
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from fabik.conf import FabikConfigFile
+from fabik.conf.cache import ConfigSnapshot, get_cache_dir, make_cache_dir
+from fabik.conf.include import load_fragments
+from fabik.error import ConfigError
+
+
+FABIK_TOML = """
+NAME = 'snapshot_test'
+DEPLOY_DIR = '/srv/app/snapshot_test'
+
+['config.toml']
+DEBUG = false
+
+[ENV.prod.'config.toml']
+DEBUG = true
+"""
+
+FABIK_ENV = """
+WORK_DIR="/tmp/snapshot_test"
+"""
+
+
+@pytest.fixture
+def fabik_file(temp_dir: Path) -> FabikConfigFile:
+    """创建包含 fabik.toml 和 .fabik.env 的工作文件夹"""
+    (temp_dir / "fabik.toml").write_text(FABIK_TOML)
+    (temp_dir / ".fabik.env").write_text(FABIK_ENV)
+    return FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir)
+
+
+class TestCacheDir:
+    """测试缓存文件夹的位置和权限"""
+
+    def test_cache_dir_outside_work_dir(self, fabik_file, cache_home):
+        """缓存保存在用户缓存文件夹中，不同的工作文件夹使用不同的缓存文件夹"""
+        work_dir = fabik_file.getdir()
+        cache_dir = get_cache_dir(work_dir)
+        assert cache_dir.parent == cache_home
+        assert not cache_dir.is_relative_to(work_dir)
+        assert get_cache_dir(work_dir / "sub" / "..") == cache_dir
+        assert get_cache_dir(work_dir / "sub") != cache_dir
+
+        fabik_file.load_config()
+        assert fabik_file.get_snapshot().snapshot_file.is_relative_to(cache_dir)
+        assert not (work_dir / ".fabik_cache").exists()
+
+    def test_make_cache_dir(self, cache_home):
+        """用户缓存文件夹和缓存文件夹的权限为 0700"""
+        cache_home.chmod(0o755)
+        cache_dir = make_cache_dir(cache_home / "project-0123456789abcdef")
+        assert cache_home.stat().st_mode & 0o777 == 0o700
+        assert cache_dir.stat().st_mode & 0o777 == 0o700
+
+
+class TestConfigSnapshot:
+    """测试配置快照缓存"""
+
+    def test_snapshot_created_and_reused(self, fabik_file, mocker):
+        """第一次载入创建快照，第二次载入不再解析源文件"""
+        config = fabik_file.load_config("prod")
+        assert config.NAME == "snapshot_test"
+        assert fabik_file.get_snapshot().snapshot_file.exists()
+
+        mock_parse = mocker.patch.object(FabikConfigFile, "_parse_toml")
+        config = fabik_file.load_config("prod")
+        mock_parse.assert_not_called()
+        assert config.getcfg("WORK_DIR") == "/tmp/snapshot_test"
+        assert config.get_env_value("config.toml") == {"DEBUG": True}
+
+    def test_snapshot_invalidated_on_change(self, fabik_file):
+        """源文件内容改变后快照失效"""
+        fabik_file.load_config()
+        fabik_file.fabik_toml.write_text(FABIK_TOML.replace("snapshot_test", "changed"))
+        config = fabik_file.load_config()
+        assert config.NAME == "changed"
+
+        fabik_file.fabik_env.write_text('NAME="from_env"\n')
+        config = fabik_file.load_config()
+        assert config.NAME == "from_env"
+
+    def test_env_file_expands_current_environ(self, fabik_file, monkeypatch):
+        """.fabik.env 不使用快照，其中的 ${VAR} 使用当前的系统环境变量展开"""
+        fabik_file.fabik_env.write_text('SNAPSHOT_TEST_LOCAL_TOKEN="${MY_TOKEN}"\n')
+        monkeypatch.setenv("MY_TOKEN", "first")
+        config = fabik_file.load_config()
+        assert config.env_data["SNAPSHOT_TEST_LOCAL_TOKEN"] == "first"
+        assert fabik_file.get_snapshot().snapshot_file.exists()
+
+        monkeypatch.setenv("MY_TOKEN", "second")
+        config = fabik_file.load_config()
+        assert config.env_data["SNAPSHOT_TEST_LOCAL_TOKEN"] == "second"
+
+    def test_snapshot_survives_touch(self, fabik_file, mocker):
+        """仅修改 mtime 时通过 hash 判断内容未变，继续使用快照"""
+        fabik_file.load_config()
+        st = fabik_file.fabik_toml.stat()
+        os.utime(fabik_file.fabik_toml, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+        mock_parse = mocker.patch.object(FabikConfigFile, "_parse_toml")
+        assert fabik_file.load_config().NAME == "snapshot_test"
+        mock_parse.assert_not_called()
+
+    def test_no_cache(self, fabik_file):
+        """use_cache 为 False 时不创建快照"""
+        config = fabik_file.load_config(use_cache=False)
+        assert config.NAME == "snapshot_test"
+        assert not fabik_file.get_snapshot().snapshot_file.exists()
+
+    def test_corrupted_snapshot(self, temp_dir):
+        """损坏的快照文件被视为失效"""
+        source = temp_dir / "source.toml"
+        source.write_text("A = 1")
+        snapshot_file = temp_dir / "cache" / "source.snapshot"
+        snapshot = ConfigSnapshot(snapshot_file, [source])
+        snapshot.save({"A": 1})
+        assert snapshot.load() == {"A": 1}
+
+        snapshot_file.write_bytes(b"not a pickle")
+        assert snapshot.load() is None
+
+
+class TestConfigSession:
+    """测试进程内的配置会话"""
+
+    def test_load_once(self, fabik_file, mocker):
+        """配置文件未改变时只载入一次，每个环境和参数共享同一个 ConfigReplacer"""
+        from fabik.conf.session import ConfigSession
+
+        session = ConfigSession(fabik_file)
+        spy = mocker.spy(FabikConfigFile, "_load_data")
+        prod = session.load_config("prod")
+        assert session.load_config("prod") is prod
+        assert session.load_configs(["prod", ""])["prod"] is prod
+        assert session.load_config("") is not prod
+        assert spy.call_count == 1
+        assert session.parse_count == 1
+
+        replacer = session.get_replacer(prod, fabik_file.getdir())
+        assert session.get_replacer(prod, fabik_file.getdir()) is replacer
+        assert session.get_replacer(prod, fabik_file.getdir(), tpl_dir=Path("/tpl")) is not replacer
+        assert session.replacer_count == 2
+
+        # 配置文件改变之后重新载入，缓存的对象全部失效
+        fabik_file.fabik_toml.write_text(FABIK_TOML.replace("snapshot_test", "changed!"))
+        changed = session.load_config("prod")
+        assert changed is not prod
+        assert changed.NAME == "changed!"
+        assert session.get_replacer(changed, fabik_file.getdir()) is not replacer
+        assert session.parse_count == 2
+        assert session.replacer_count == 3
+
+
+class TestLayeredView:
+    """测试多个配置层叠加的只读视图"""
+
+    def test_same_as_merge_dict(self):
+        """读取的结果与 merge_dict 相同"""
+        from fabik.conf import LayeredView, materialize, merge_dict
+
+        base = {
+            "A": 1,
+            "B": {"X": 1, "Y": {"P": 1, "Q": 2}, "L": [1]},
+            "C": {"X": 1},
+            "D": None,
+            "E": "keep",
+        }
+        overlay = {"B": {"Y": {"Q": 3}, "L": [2], "Z": 0}, "C": "scalar", "D": {"N": 1}, "E": None, "F": 1}
+        view = LayeredView(base, overlay)
+        assert materialize(view) == merge_dict(base, overlay)
+        assert list(view) == list(merge_dict(base, overlay))
+        # 只有一层包含的表直接返回原始数据，不复制
+        assert view["D"] is overlay["D"]
+        assert isinstance(view["B"], LayeredView)
+
+    def test_setcfg_overrides(self, fabik_file):
+        """setcfg 写入覆盖层，多个环境共享的原始数据不被修改"""
+        configs = fabik_file.load_configs(["prod", "local"])
+        prod, local = configs["prod"], configs["local"]
+        assert prod.root_data.layers[0] is local.root_data.layers[0]
+
+        prod.setcfg("config.toml", "DEBUG", value=True)
+        prod.setcfg("config.toml", "PORT", value=5000)
+        assert prod.getcfg("config.toml") == {"DEBUG": True, "PORT": 5000}
+        assert local.getcfg("config.toml") == {"DEBUG": False}
+        assert prod.getcfg("NAME") == "snapshot_test"
+
+    def test_setcfg_replaces(self, fabik_file):
+        """setcfg 替换原来的值：值为 None 时也替换，值为表时替换整个表"""
+        from fabik.conf import materialize
+
+        config = fabik_file.load_configs(["prod"])["prod"]
+        config.setcfg("config.toml", value={"PORT": 1})
+        assert materialize(config.getcfg("config.toml")) == {"PORT": 1}
+        assert config.path("config.toml.DEBUG", "missing") == "missing"
+
+        config.setcfg("config.toml", "HOST", value=None)
+        assert materialize(config.getcfg("config.toml")) == {"PORT": 1, "HOST": None}
+        config.setcfg("DEPLOY_DIR", value=None)
+        assert config.getcfg("DEPLOY_DIR") is None
+        assert "DEPLOY_DIR" in config.root_data
+
+        config.setcfg("ENV", "prod", "config.toml", "DEBUG", value=False)
+        assert materialize(config.get_env_value("config.toml")) == {"DEBUG": False}
+        assert fabik_file.load_configs(["prod"])["prod"].getcfg("DEPLOY_DIR")
+
+    def test_with_overrides(self, fabik_file):
+        """with_overrides 同时覆盖根中和 ENV.<env_name> 中的值，原来的配置不被修改"""
+        from fabik.conf import materialize
+
+        prod = fabik_file.load_configs(["prod"])["prod"]
+        host = prod.with_overrides({"DEPLOY_DIR": "/srv/web2", "config.toml": {"PORT": 1}})
+        assert host.path("DEPLOY_DIR") == "/srv/web2"
+        assert materialize(host.getcfg("config.toml")) == {"DEBUG": False, "PORT": 1}
+        assert materialize(host.get_env_value("config.toml")) == {"DEBUG": True, "PORT": 1}
+        assert prod.path("DEPLOY_DIR") == "/srv/app/snapshot_test"
+        assert prod.get_env_value("config.toml") == {"DEBUG": True}
+
+    def test_with_overrides_no_name_var(self, fabik_file):
+        """服务器的配置也覆盖 .fabik.env 中的 NO_NAME_VAR"""
+        fabik_file.fabik_env.write_text('DEPLOY_DIR="/srv/fromenv"\n')
+        prod = fabik_file.load_configs(["prod"])["prod"]
+        assert prod.path("DEPLOY_DIR") == "/srv/fromenv"
+
+        overrides = {"DEPLOY_DIR": "/srv/host1", "config.toml": {"PORT": 1}}
+        host = prod.with_overrides(overrides)
+        assert host.path("DEPLOY_DIR") == "/srv/host1"
+        assert host.get_env_value("DEPLOY_DIR") == "/srv/host1"
+        host.setcfg("config.toml", "PORT", value=2)
+        assert overrides == {"DEPLOY_DIR": "/srv/host1", "config.toml": {"PORT": 1}}
+        assert prod.path("DEPLOY_DIR") == "/srv/fromenv"
+
+
+class TestConfigPath:
+    """测试 FabikConfig.path"""
+
+    def test_dotted_keys(self, fabik_file):
+        """不使用引号时优先匹配包含点号的键名，也可以使用引号"""
+        config = fabik_file.load_configs(["prod"])["prod"]
+        assert config.compile_path("config.toml.DEBUG") == ("config.toml", "DEBUG")
+        assert config.path("config.toml.DEBUG") is False
+        assert config.path("'config.toml'.DEBUG") is False
+        assert config.path(("config.toml", "DEBUG")) is False
+        assert config.path("config.toml.MISSING", 1) == 1
+        assert config.path("NAME.MISSING", 2) == 2
+        assert config.path("NAME") == config.getcfg("NAME")
+
+    def test_setcfg_invalidates(self, fabik_file):
+        """setcfg 仅使受影响的路径失效"""
+        config = fabik_file.load_configs(["prod"])["prod"]
+        assert config.path("config.toml") == {"DEBUG": False}
+        assert config.path("DEPLOY_DIR") == "/srv/app/snapshot_test"
+
+        config.setcfg("config.toml", "PORT", value=5000)
+        assert config.path("config.toml.PORT") == 5000
+        assert config.path("config.toml") == {"DEBUG": False, "PORT": 5000}
+        assert ("DEPLOY_DIR",) in config._path_values
+
+        config.setcfg("DEPLOY_DIR", value="/srv/other")
+        assert config.path("DEPLOY_DIR") == "/srv/other"
+
+    def test_pickle_after_miss(self, fabik_file):
+        """找不到的键被缓存之后，序列化的配置仍然返回默认值"""
+        import pickle
+
+        config = fabik_file.load_configs(["prod"])["prod"]
+        assert config.path("TPL_DIR", "default") == "default"
+        assert config.path("DEPLOY_DIR") == "/srv/app/snapshot_test"
+
+        restored = pickle.loads(pickle.dumps(config))
+        assert restored.path("TPL_DIR", "default") == "default"
+        assert restored.path("TPL_DIR") is None
+        assert restored.path("DEPLOY_DIR") == "/srv/app/snapshot_test"
+
+
+INCLUDE_TOML = """
+NAME = 'include_test'
+
+[INCLUDE]
+'config.toml' = 'conf.d/config.toml'
+'.env' = 'conf.d/env.toml'
+
+[INCLUDE.ENV]
+prod = 'conf.d/prod.toml'
+
+[ENV.local]
+"""
+
+
+@pytest.fixture
+def include_file(temp_dir: Path) -> FabikConfigFile:
+    conf_dir = temp_dir / "conf.d"
+    conf_dir.mkdir()
+    (conf_dir / "config.toml").write_text("DEBUG = false\n")
+    (conf_dir / "env.toml").write_text("KEY = 'value'\n")
+    (conf_dir / "prod.toml").write_text("['config.toml']\nDEBUG = true\n")
+    (temp_dir / "fabik.toml").write_text(INCLUDE_TOML)
+    (temp_dir / ".fabik.env").write_text("")
+    return FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir)
+
+
+class TestInclude:
+    """测试 INCLUDE 片段文件"""
+
+    def test_lazy_load(self, include_file, mocker):
+        """仅解析读取的片段，每个片段有自己的快照"""
+        from fabik.conf import include
+
+        parse = mocker.spy(include, "parse_fragment_file")
+        prod = include_file.load_configs(["prod"])["prod"]
+        assert parse.call_count == 0
+        assert prod.getcfg(".env", "KEY") == "value"
+        assert parse.call_count == 1
+        assert prod.get_env_value("config.toml") == {"DEBUG": True}
+        assert parse.call_count == 2
+        assert not prod.root_data.layers[0]["config.toml"].loaded
+
+        # 片段的快照有效时不再解析
+        prod = include_file.load_configs(["prod"])["prod"]
+        assert prod.getcfg(".env", "KEY") == "value"
+        assert parse.call_count == 2
+
+        # 仅重新解析改变的片段
+        include_file.getdir("conf.d", "env.toml").write_text("KEY = 'changed'\n")
+        prod = include_file.load_configs(["prod"])["prod"]
+        assert prod.getcfg(".env", "KEY") == "changed"
+        assert prod.get_env_value("config.toml") == {"DEBUG": True}
+        assert parse.call_count == 3
+
+    def test_env_fragment(self, temp_dir):
+        """ENV 本身是片段时，也可以列出所有的环境"""
+        from fabik.conf.session import ConfigSession
+
+        (temp_dir / "conf.d").mkdir()
+        (temp_dir / "conf.d" / "envs.toml").write_text("[prod]\nDEBUG = true\n[test]\n")
+        (temp_dir / "fabik.toml").write_text(
+            "NAME = 'include_test'\n[INCLUDE]\nENV = 'conf.d/envs.toml'\n"
+        )
+        (temp_dir / ".fabik.env").write_text("")
+        fabik_file = FabikConfigFile.gen_fabik_config_file(work_dir=temp_dir)
+
+        assert list(fabik_file.load_configs(use_cache=False)) == ["prod", "test"]
+        configs = ConfigSession(fabik_file, use_cache=False).load_configs()
+        assert list(configs) == ["prod", "test"]
+        assert configs["prod"].get_env_value("DEBUG") is True
+
+    def test_preload(self, include_file):
+        """并行载入多个环境需要的片段"""
+        configs = include_file.load_configs(None, use_cache=False)
+        fragments = [f for c in configs.values() for f in c.get_fragments("config.toml")]
+        assert sorted(f.file.name for f in fragments) == [
+            "config.toml",
+            "config.toml",
+            "prod.toml",
+        ]
+        load_fragments(fragments, max_workers=2)
+        assert all(f.loaded for f in fragments)
+        assert configs["prod"].get_env_value("config.toml") == {"DEBUG": True}
+        assert len(configs["local"].include_files) == 3
+
+    def test_conflict(self, include_file):
+        """同一个表不能同时在 fabik.toml 和片段中定义"""
+        include_file.fabik_toml.write_text(INCLUDE_TOML + "\n['config.toml']\nDEBUG = true\n")
+        with pytest.raises(ConfigError):
+            include_file.load_config(use_cache=False)
@@ -0,0 +1,131 @@
+"""
+Tests for fabik.util.watch and fabik.conf.rebuild
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+from fabik.conf import FabikConfigFile
+from fabik.conf.batch import RenderJob
+from fabik.conf.manifest import WriteStatus
+from fabik.conf.rebuild import Rebuilder
+from fabik.util.watch import FileWatcher, InotifyWatcher, PollingWatcher
+
+
+FABIK_TOML = """
+NAME = 'watch_test'
+WORK_DIR = '{work_dir}'
+TPL_DIR = '{tpl_dir}'
+
+['app.conf']
+PORT = {port}
+
+['worker.conf']
+QUEUE = 'default'
+"""
+
+
+@pytest.fixture
+def project_dir(temp_dir: Path) -> Path:
+    """创建包含两个模板的项目，worker.conf 引用了 base.jinja2"""
+    tpl_dir = temp_dir / "tpls"
+    tpl_dir.mkdir()
+    (tpl_dir / "app.conf.jinja2").write_text("port={{ PORT }}")
+    (tpl_dir / "base.jinja2").write_text("name={{ NAME }}")
+    (tpl_dir / "worker.conf.jinja2").write_text(
+        '{% include "base.jinja2" %} queue={{ QUEUE }}'
+    )
+    write_fabik_toml(temp_dir, port=5000)
+    (temp_dir / ".fabik.env").write_text("")
+    return temp_dir
+
+
+def write_fabik_toml(work_dir: Path, port: int):
+    (work_dir / "fabik.toml").write_text(
+        FABIK_TOML.format(
+            work_dir=work_dir.as_posix(),
+            tpl_dir=(work_dir / "tpls").as_posix(),
+            port=port,
+        )
+    )
+
+
+@pytest.fixture
+def rebuilder(project_dir: Path) -> Rebuilder:
+    fabik_file = FabikConfigFile.gen_fabik_config_file(work_dir=project_dir)
+    tpl_dir = project_dir / "tpls"
+    jobs = [
+        RenderJob("", "app.conf", tpl_dir=tpl_dir, force=True),
+        RenderJob("", "worker.conf", tpl_dir=tpl_dir, force=True),
+    ]
+    return Rebuilder(fabik_file, {"": fabik_file.load_config()}, jobs)
+
+
+class TestRebuilder:
+    """测试仅重新渲染受影响的输出文件"""
+
+    def test_template_change(self, rebuilder, project_dir):
+        """被 include 的模板改变时，只渲染引用它的输出文件"""
+        results = rebuilder.render_all()
+        assert [r.status for r in results] == [WriteStatus.NEW, WriteStatus.NEW]
+
+        base = project_dir / "tpls" / "base.jinja2"
+        base.write_text("project={{ NAME }}")
+        assert rebuilder.affected({base}) == [1]
+        rebuilder.rebuild({base})
+        assert (project_dir / "worker.conf").read_text() == "project=watch_test queue=default"
+
+    def test_config_change(self, rebuilder, project_dir):
+        """配置文件改变时，只渲染替换值改变的输出文件"""
+        rebuilder.render_all()
+        write_fabik_toml(project_dir, port=5001)
+        results = rebuilder.rebuild({project_dir / "fabik.toml"})
+        assert [r.job.tpl_name for r in results] == ["app.conf"]
+        assert (project_dir / "app.conf").read_text() == "port=5001"
+
+    def test_failed_job_retried(self, rebuilder, project_dir):
+        """渲染失败的任务在下一次改变时重新渲染"""
+        app_tpl = project_dir / "tpls" / "app.conf.jinja2"
+        app_tpl.write_text("port={{ PORT }")
+        results = rebuilder.render_all()
+        assert not results[0].ok and results[1].ok
+
+        app_tpl.write_text("port={{ PORT }}")
+        results = rebuilder.rebuild({app_tpl})
+        assert [r.ok for r in results] == [True]
+
+
+class TestFileWatcher:
+    """测试文件监控"""
+
+    def check_watcher(self, watcher_class, project_dir):
+        toml_file = project_dir / "fabik.toml"
+        new_tpl = project_dir / "tpls" / "sub" / "new.jinja2"
+        with watcher_class([toml_file], [project_dir / "tpls"]) as watcher:
+            assert watcher.wait(0.05) == set()
+            write_fabik_toml(project_dir, port=6000)
+            (project_dir / "other.txt").write_text("not watched")
+            assert watcher.wait(1) == {toml_file}
+
+            new_tpl.parent.mkdir()
+            new_tpl.write_text("new")
+            changed = set()
+            while more := watcher.wait(0.2):
+                changed |= more
+            assert new_tpl in changed
+
+    def test_polling(self, project_dir):
+        self.check_watcher(
+            lambda files, dirs: PollingWatcher(files, dirs, interval=0.01), project_dir
+        )
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+    def test_inotify(self, project_dir):
+        self.check_watcher(InotifyWatcher, project_dir)
+
+    def test_abstract(self, project_dir):
+        """FileWatcher 是抽象基类，不能直接创建"""
+        with pytest.raises(TypeError):
+            FileWatcher([project_dir / "fabik.toml"])  # type: ignore[abstract]